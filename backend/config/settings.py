@@ -330,7 +330,14 @@ CACHES = {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
         "LOCATION": "perkify-cache",
         "TIMEOUT": 300,
-    }
+    },
+    # AI match reasons: expire after a day, least recently used evicted first.
+    "match_reasons": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "perkify-match-reasons",
+        "TIMEOUT": int(os.getenv("MATCH_REASON_TTL", "86400")),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("MATCH_REASON_CACHE_SIZE", "10000"))},
+    },
 }
 
 # ─── Django REST Framework ───
@@ -384,8 +391,20 @@ ANYMAIL = {
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "info@perkifys.com")
 REPLY_TO_EMAIL = os.getenv("REPLY_TO_EMAIL", "support@perkifys.com")
 
+# ─── Swap Matching ───
+# Number of ranked swap partners kept per user in the precomputed match index.
+MATCH_INDEX_SIZE = int(os.getenv("MATCH_INDEX_SIZE", "50"))
+# compute_matches sends a MATCH notification for new pairs scoring at least this.
+MATCH_NOTIFY_MIN_SCORE = int(os.getenv("MATCH_NOTIFY_MIN_SCORE", "85"))
+
 # ─── OpenAI ───
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
+# Match reasons are generated in the background; each call gets this many
+# seconds, with at most MATCH_REASON_WORKERS calls in flight.
+MATCH_REASON_TIMEOUT = float(os.getenv("MATCH_REASON_TIMEOUT", "4"))
+MATCH_REASON_WORKERS = int(os.getenv("MATCH_REASON_WORKERS", "2"))
+MATCH_REASON_MAX_PENDING = int(os.getenv("MATCH_REASON_MAX_PENDING", "100"))
 
 # ─── Cloudflare Turnstile ───
 TURNSTILE_SITE_KEY = os.getenv("TURNSTILE_SITE_KEY", "0x4AAAAAACcbrWuiO2lrJOCd")
@@ -1,10 +1,12 @@
 from django import forms
 from django.contrib import admin
+from django.db import transaction
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.forms import AuthenticationForm
 from unfold.admin import ModelAdmin, TabularInline
 from unfold.decorators import display
 
+from . import facets, jobs, listing_cache, user_stats
 from .turnstile import verify_turnstile
 from .models import (
     AuditLog,
@@ -236,15 +238,27 @@ class GiftCardAdmin(ModelAdmin):
 
     @admin.action(description="Approve selected gift cards")
     def approve_cards(self, request, queryset):
+        card_ids = list(queryset.values_list("id", flat=True))
         queryset.update(status="active", moderation_note="Approved by admin")
+        jobs.enqueue("core.match_index.refresh_cards", {"card_ids": card_ids})
+        facets.recompute_cards(card_ids)
+        listing_cache.bump()
 
     @admin.action(description="Reject selected gift cards")
     def reject_cards(self, request, queryset):
+        card_ids = list(queryset.values_list("id", flat=True))
         queryset.update(status="rejected")
+        jobs.enqueue("core.match_index.refresh_cards", {"card_ids": card_ids})
+        facets.recompute_cards(card_ids)
+        listing_cache.bump()
 
     @admin.action(description="Mark selected as expired")
     def mark_expired(self, request, queryset):
+        card_ids = list(queryset.values_list("id", flat=True))
         queryset.update(status="expired")
+        jobs.enqueue("core.match_index.refresh_cards", {"card_ids": card_ids})
+        facets.recompute_cards(card_ids)
+        listing_cache.bump()
 
 
 # ═══════════════════════════════════════════════
@@ -306,11 +320,17 @@ class TradeAdmin(ModelAdmin):
 
     @admin.action(description="Force complete selected trades")
     def force_complete(self, request, queryset):
-        queryset.update(status="completed", initiator_confirmed=True, responder_confirmed=True)
+        with transaction.atomic():
+            parties = user_stats.trade_parties(queryset)
+            queryset.update(status="completed", initiator_confirmed=True, responder_confirmed=True)
+            user_stats.recompute_users(parties)
 
     @admin.action(description="Force cancel selected trades")
     def force_cancel(self, request, queryset):
-        queryset.update(status="cancelled")
+        with transaction.atomic():
+            parties = user_stats.trade_parties(queryset)
+            queryset.update(status="cancelled")
+            user_stats.recompute_users(parties)
 
 
 # ═══════════════════════════════════════════════
@@ -363,11 +383,17 @@ class SaleAdmin(ModelAdmin):
 
     @admin.action(description="Force complete selected sales")
     def force_complete(self, request, queryset):
-        queryset.update(status="completed", code_revealed=True)
+        with transaction.atomic():
+            sellers = set(queryset.values_list("seller_id", flat=True))
+            queryset.update(status="completed", code_revealed=True)
+            user_stats.recompute_users(sellers)
 
     @admin.action(description="Force cancel selected sales")
     def force_cancel(self, request, queryset):
-        queryset.update(status="cancelled")
+        with transaction.atomic():
+            sellers = set(queryset.values_list("seller_id", flat=True))
+            queryset.update(status="cancelled")
+            user_stats.recompute_users(sellers)
 
 
 # ═══════════════════════════════════════════════
@@ -0,0 +1,214 @@
+"""
+Statistical anomaly scoring.
+
+Fixed thresholds (``ABNORMAL_VALUE_THRESHOLD`` and friends) miss behaviour
+that is only unusual relative to similar users.  This pass loads one
+feature vector per active user with a handful of grouped queries and
+scores the whole population at once with NumPy:
+
+- features: trades per day of account age, mean and max card value
+  offered in trades, and disputes raised per trade;
+- each feature is turned into a robust z-score within the user's trust
+  tier (among users who have traded), using the median and the median
+  absolute deviation (MAD), so a few extreme users don't hide each other
+  the way they would with a mean and standard deviation;
+- a user's score is the root-sum-square of their positive z-scores (only
+  *more* activity, value or disputes is suspicious).
+
+Users scoring at least ``ANOMALY_MIN_SCORE`` are ranked and the top ones
+flagged for review.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+from django.db import models
+from django.utils import timezone
+
+from core.fraud_detection import _create_flag
+from core.models import Dispute, FraudFlag, Trade, User
+
+ANOMALY_MIN_SCORE = 3.5  # Iglewicz-Hoaglin outlier cut-off for modified z-scores
+ANOMALY_MIN_COHORT = 30  # Tiers with fewer users are not scored
+
+FEATURES = ("trades_per_day", "mean_value", "max_value", "dispute_rate")
+FEATURE_LABELS = {
+    "trades_per_day": "trades per day",
+    "mean_value": "mean card value",
+    "max_value": "max card value",
+    "dispute_rate": "disputes per trade",
+}
+
+# MAD of a normal distribution is 0.6745 standard deviations, and its mean
+# absolute deviation 0.7979; used to put both on the z-score scale.
+_MAD_SCALE = 0.6745
+_MEAN_AD_SCALE = 0.7979
+
+# Smallest deviation treated as one z unit, per feature (after the log
+# transform): keeps a near-constant feature, like a dispute rate that is
+# zero for most users, from turning tiny differences into huge scores.
+_MIN_SCALE = np.array([0.05, 0.1, 0.1, 0.1])
+
+_MICROS_PER_DAY = 86_400 * 1_000_000
+
+
+@dataclass
+class AnomalyScores:
+    user_ids: np.ndarray
+    tiers: np.ndarray
+    features: np.ndarray  # (users, len(FEATURES)), raw values
+    z_scores: np.ndarray  # (users, len(FEATURES))
+    scores: np.ndarray  # (users,)
+
+    def ranked(self, min_score=ANOMALY_MIN_SCORE):
+        """Row indexes scoring at least ``min_score``, best first (ties by user id)."""
+        rows = np.flatnonzero(self.scores >= min_score)
+        return rows[np.lexsort((self.user_ids[rows], -self.scores[rows]))]
+
+
+def _to_micros(value):
+    return int(value.timestamp() * 1_000_000)
+
+
+def _scatter(user_ids, rows, target, ufunc=np.add):
+    """Fold ``(user_id, value)`` rows into ``target``, aligned with ``user_ids``."""
+    if not rows or not len(user_ids):
+        return
+    ids, values = np.array(rows, dtype=np.float64).T
+    positions = np.searchsorted(user_ids, ids.astype(np.int64))
+    positions = np.minimum(positions, len(user_ids) - 1)
+    known = user_ids[positions] == ids
+    ufunc.at(target, positions[known], values[known])
+
+
+def load_features(now=None):
+    """``(user_ids, tiers, features)`` for every active user, sorted by id."""
+    now = now or timezone.now()
+    users = User.objects.filter(status=User.Status.ACTIVE, is_active=True).order_by("pk")
+    rows = list(users.values_list("pk", "trust_tier", "date_joined"))
+    user_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    tiers = np.array([row[1] for row in rows], dtype=np.int64)
+    joined = np.array([_to_micros(row[2]) for row in rows], dtype=np.int64)
+
+    trade_counts = np.zeros(len(user_ids))
+    value_totals = np.zeros(len(user_ids))
+    max_values = np.zeros(len(user_ids))
+    trades = Trade.objects.exclude(status=Trade.Status.CANCELLED).order_by()
+    for side in ("initiator", "responder"):
+        grouped = list(
+            trades.values(f"{side}_id")
+            .annotate(
+                total=models.Count("id"),
+                value=models.Sum(f"{side}_card__value"),
+                peak=models.Max(f"{side}_card__value"),
+            )
+            .values_list(f"{side}_id", "total", "value", "peak")
+        )
+        _scatter(user_ids, [(row[0], row[1]) for row in grouped], trade_counts)
+        _scatter(user_ids, [(row[0], row[2]) for row in grouped], value_totals)
+        _scatter(user_ids, [(row[0], row[3]) for row in grouped], max_values, np.maximum)
+
+    dispute_counts = np.zeros(len(user_ids))
+    _scatter(
+        user_ids,
+        list(
+            Dispute.objects.order_by()
+            .values("raised_by_id")
+            .annotate(total=models.Count("id"))
+            .values_list("raised_by_id", "total")
+        ),
+        dispute_counts,
+    )
+
+    age_days = np.maximum((_to_micros(now) - joined) / _MICROS_PER_DAY, 1.0)
+    traded = np.maximum(trade_counts, 1)
+    features = np.column_stack([
+        trade_counts / age_days,
+        np.where(trade_counts > 0, value_totals / traded, 0.0),
+        max_values,
+        dispute_counts / traded,
+    ])
+    return user_ids, tiers, features
+
+
+def robust_z_scores(values, cohorts, min_cohort=ANOMALY_MIN_COHORT, min_scale=0.0):
+    """
+    Modified z-scores of each column of ``values`` within each cohort.
+
+    Columns whose MAD is zero (over half the cohort shares one value, e.g.
+    no disputes) fall back to the mean absolute deviation, and no scale is
+    smaller than ``min_scale``.  Negative cohorts and cohorts smaller than
+    ``min_cohort`` score zero.
+    """
+    z_scores = np.zeros_like(values, dtype=np.float64)
+    order = np.argsort(cohorts, kind="stable")
+    bounds = np.flatnonzero(np.diff(cohorts[order])) + 1
+    for rows in np.split(order, bounds):
+        if len(rows) < min_cohort or cohorts[rows[0]] < 0:
+            continue
+        x = values[rows]
+        median = np.median(x, axis=0)
+        deviation = np.abs(x - median)
+        mad = np.median(deviation, axis=0)
+        scale = np.where(
+            mad > 0, mad / _MAD_SCALE, deviation.mean(axis=0) / _MEAN_AD_SCALE
+        )
+        scale = np.maximum(scale, min_scale)
+        z_scores[rows] = np.divide(
+            x - median, scale, out=np.zeros_like(x), where=scale > 0
+        )
+    return z_scores
+
+
+def score_users(user_ids, tiers, features):
+    # Counts and values are heavy-tailed; logs keep a few whales from
+    # setting the scale for everyone.
+    transformed = features.copy()
+    transformed[:, :3] = np.log1p(transformed[:, :3])
+    # Users who never traded have nothing to compare and would drag every
+    # median to zero, so they are left out of the cohorts.
+    cohorts = np.where(features[:, 0] > 0, tiers, -1)
+    z_scores = robust_z_scores(transformed, cohorts, min_scale=_MIN_SCALE)
+    scores = np.sqrt(np.square(np.clip(z_scores, 0, None)).sum(axis=1))
+    return AnomalyScores(user_ids, tiers, features, z_scores, scores)
+
+
+def compute_anomaly_scores(now=None):
+    return score_users(*load_features(now))
+
+
+def _describe(result, row, rank, total):
+    feature = int(np.argmax(result.z_scores[row]))
+    name = FEATURES[feature]
+    value = result.features[row, feature]
+    shown = f"${value:,.2f}" if name in ("mean_value", "max_value") else f"{value:.2f}"
+    tier = User.TrustTier(int(result.tiers[row])).label
+    return (
+        f"anomaly score {result.scores[row]:.1f} (rank {rank} of {total} above the cut-off, "
+        f"tier {tier}); highest: {FEATURE_LABELS[name]} {shown} "
+        f"(z={result.z_scores[row, feature]:.1f})"
+    )
+
+
+def flag_anomalies(result, limit=100, min_score=ANOMALY_MIN_SCORE):
+    """Flag the ``limit`` highest-scoring users; returns the new flags."""
+    ranked = result.ranked(min_score)
+    candidates = [int(user_id) for user_id in result.user_ids[ranked[:limit]]]
+    already = set(
+        FraudFlag.objects.filter(
+            user_id__in=candidates,
+            flag_type=FraudFlag.FlagType.STATISTICAL_ANOMALY,
+            status__in=[FraudFlag.Status.PENDING, FraudFlag.Status.REVIEWED],
+        ).values_list("user_id", flat=True)
+    )
+    users = User.objects.in_bulk(candidates)
+
+    new_flags = []
+    for rank, row in enumerate(ranked[:limit].tolist(), start=1):
+        user = users.get(int(result.user_ids[row]))
+        # Deleted since the features were loaded, or already under review.
+        if user is None or user.pk in already:
+            continue
+        details = f"User {user.username} has an {_describe(result, row, rank, len(ranked))}."
+        new_flags.append(_create_flag(user, FraudFlag.FlagType.STATISTICAL_ANOMALY, details))
+    return new_flags
@@ -0,0 +1,70 @@
+import hashlib
+
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from core import listing_cache
+
+
+class CachedListMixin:
+    """
+    Serve a public list view from the listing cache (see
+    ``core.listing_cache``), with an ``ETag`` so clients can revalidate
+    with ``If-None-Match`` and get a bodiless ``304``.
+
+    Every user shares the anonymous response.  When ``owner_field`` is set,
+    an authenticated user's own rows are then dropped from it (and from
+    ``count``) with one query for their matching rows; their pages can be
+    a little short, but nothing is skipped or repeated between pages.
+    """
+
+    cache_name = None
+    owner_field = None
+
+    def list(self, request, *args, **kwargs):
+        excludes_own = bool(self.owner_field) and request.user.is_authenticated
+        entry_key = listing_cache.key(self.cache_name, listing_cache.version(), request)
+        entry = listing_cache.lookup(entry_key)
+        if entry is None:
+            data = super().list(request, *args, **kwargs).data
+            entry = {"data": data, "etag": hashlib.sha1(entry_key.encode()).hexdigest()}
+            listing_cache.store(entry_key, entry)
+
+        data, etag = entry["data"], entry["etag"]
+        if excludes_own:
+            data = self._exclude_own(request, data)
+            etag = hashlib.sha1(f"{etag}:{request.user.pk}".encode()).hexdigest()
+        etag = f'"{etag}"'
+
+        if self._not_modified(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response["ETag"] = etag
+        patch_vary_headers(response, ("Authorization", "Cookie"))
+        return response
+
+    def _not_modified(self, request, etag):
+        header = request.headers.get("If-None-Match")
+        if not header:
+            return False
+        # Proxies that compress responses weaken the tag; compare weakly.
+        tags = [tag.removeprefix("W/") for tag in parse_etags(header)]
+        return "*" in tags or etag in tags
+
+    def _exclude_own(self, request, data):
+        """``data`` without the user's own rows (a copy; cached data is shared)."""
+        own = set(
+            self.filter_queryset(self.get_queryset())
+            .filter(**{self.owner_field: request.user})
+            .values_list("pk", flat=True)
+        )
+        if not own:
+            return data
+        data = dict(data)
+        data["results"] = [row for row in data["results"] if row["id"] not in own]
+        if "count" in data:
+            data["count"] -= len(own)
+        return data
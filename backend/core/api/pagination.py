@@ -1,4 +1,13 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardPagination(PageNumberPagination):
@@ -11,3 +20,176 @@ class SmallPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 50
+
+
+class MatchCursorPagination(CursorPagination):
+    """Cursor pagination over a user's precomputed match index."""
+
+    page_size = 10
+    page_size_query_param = "limit"
+    max_page_size = 50
+    ordering = ("-score", "id")
+
+
+class KeysetPagination(StandardPagination):
+    """
+    Page-number pagination by default; keyset (cursor) pagination on request.
+
+    ``?pagination=cursor`` (or any ``?cursor=``) switches to keyset mode:
+    pages are read with ``WHERE (field, id) > (last field, last id)``
+    ordered by the view's current ordering plus ``id``, so every page costs
+    the same however deep it is, and no ``COUNT(*)`` is run.  The response
+    has ``next``/``previous`` links carrying opaque cursors, plus an
+    ``estimated_count`` when ``?count=estimate`` is passed (the planner's
+    row estimate on PostgreSQL; elsewhere a count that stops at
+    ``estimate_limit``).
+
+    Only ``keyset_fields`` can be paged this way; ``NULL`` values sort after
+    all others in both directions.
+    """
+
+    mode_query_param = "pagination"
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    keyset_fields = ("created_at", "value", "selling_price", "expiry_date")
+    estimate_limit = 10_000
+    invalid_cursor_message = "Invalid cursor."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or self.cursor_query_param in request.query_params
+        )
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self._ordering(queryset)
+        self.model_field = queryset.model._meta.get_field(self.field)
+        self.estimated_count = None
+        if request.query_params.get(self.count_query_param) == "estimate":
+            self.estimated_count = self._estimate_count(queryset)
+
+        cursor = self._decode(request.query_params.get(self.cursor_query_param))
+        backwards = bool(cursor and cursor["p"])
+        # Reading backwards flips the order (and puts NULLs first).
+        descending = self.descending != backwards
+        nulls = {}
+        if self.model_field.null:
+            nulls = {"nulls_first": True} if backwards else {"nulls_last": True}
+        order = F(self.field).desc(**nulls) if descending else F(self.field).asc(**nulls)
+        queryset = queryset.order_by(order, "-pk" if descending else "pk")
+        if cursor:
+            queryset = queryset.filter(self._after(cursor["v"], cursor["id"], descending, backwards))
+
+        rows = list(queryset[: self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if backwards:
+            rows.reverse()
+        self.has_next = bool(cursor) if backwards else has_more
+        self.has_previous = has_more if backwards else bool(cursor)
+        self.rows = rows
+        return rows
+
+    def _ordering(self, queryset):
+        ordering = [
+            field
+            for field in queryset.query.order_by or queryset.model._meta.ordering
+            if isinstance(field, str)
+        ]
+        first = ordering[0] if ordering else "-created_at"
+        field = first.lstrip("-")
+        if field not in self.keyset_fields:
+            raise ValidationError(
+                {"ordering": f"Cursor pagination does not support ordering by {field}."}
+            )
+        return field, first.startswith("-")
+
+    def _after(self, value, pk, descending, backwards):
+        """Rows that come after ``(value, pk)`` in the order being read."""
+        past = "lt" if descending else "gt"
+        same_value = Q(**{f"pk__{past}": pk})
+        is_null = Q(**{f"{self.field}__isnull": True})
+        if value is None:
+            after = is_null & same_value
+            # Reading backwards from a NULL, every non-NULL value follows.
+            return after | ~is_null if backwards else after
+        after = Q(**{f"{self.field}__{past}": value}) | (Q(**{self.field: value}) & same_value)
+        if backwards or not self.model_field.null:
+            return after
+        # NULLs sort last when reading forwards.
+        return after | is_null
+
+    def _estimate_count(self, queryset):
+        queryset = queryset.order_by()
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return queryset[: self.estimate_limit].count()
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    # ─── Cursors ───
+
+    def _encode(self, row, previous):
+        value = getattr(row, self.field)
+        if value is not None:
+            value = value.isoformat() if hasattr(value, "isoformat") else str(value)
+        position = {
+            "o": ("-" if self.descending else "") + self.field,
+            "v": value,
+            "id": row.pk,
+            "p": previous,
+        }
+        raw = json.dumps(position, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def _decode(self, encoded):
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+            cursor = json.loads(raw)
+            expected = ("-" if self.descending else "") + self.field
+            if cursor["o"] != expected or not isinstance(cursor["p"], bool):
+                raise ValueError(cursor["o"])
+            if cursor["v"] is not None:
+                cursor["v"] = self.model_field.to_python(cursor["v"])
+            cursor["id"] = int(cursor["id"])
+        except (ValueError, TypeError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def _link(self, cursor):
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor
+        )
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or not self.rows:
+            return None
+        return self._link(self._encode(self.rows[-1], previous=False))
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous or not self.rows:
+            return None
+        return self._link(self._encode(self.rows[0], previous=True))
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        body = {"next": self.get_next_link(), "previous": self.get_previous_link()}
+        if self.estimated_count is not None:
+            body["estimated_count"] = self.estimated_count
+        body["results"] = data
+        return Response(body)
@@ -12,4 +12,5 @@ urlpatterns = [
     path("", include("core.api.urls.dashboard")),
     path("", include("core.api.urls.fraud")),
     path("", include("core.api.urls.payments")),
+    path("", include("core.api.urls.search")),
 ]
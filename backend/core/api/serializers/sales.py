@@ -1,5 +1,6 @@
 from rest_framework import serializers
 
+from core.fraud_detection import record_sale_velocity
 from core.models import GiftCard, Sale
 
 
@@ -143,4 +144,6 @@ class SaleCreateSerializer(serializers.Serializer):
         user.daily_trade_value += gift_card.selling_price
         user.save(update_fields=["daily_trade_count", "daily_trade_value"])
 
+        record_sale_velocity(sale)
+
         return sale
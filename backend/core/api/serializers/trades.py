@@ -1,7 +1,8 @@
-from django.db.models import Q
 from rest_framework import serializers
 
+from core.fraud_detection import record_trade_velocity
 from core.models import EscrowSession, GiftCard, Trade
+from core.user_stats import get_stats
 
 
 # ─── Nested Serializers ───
@@ -301,18 +302,7 @@ class TradeCreateSerializer(serializers.Serializer):
             )
 
         # ── Active trade limit enforcement ──
-        active_statuses = [
-            Trade.Status.PROPOSED,
-            Trade.Status.ACCEPTED,
-            Trade.Status.IN_ESCROW,
-            Trade.Status.CODES_RELEASED,
-            Trade.Status.CONFIRMING,
-        ]
-        active_count = Trade.objects.filter(
-            Q(initiator=user) | Q(responder=user),
-            status__in=active_statuses,
-        ).count()
-        if active_count >= user.max_active_trades:
+        if get_stats(user).active_trades >= user.max_active_trades:
             raise serializers.ValidationError(
                 "You have reached your active trade limit. "
                 "Complete or cancel existing trades before starting new ones."
@@ -353,6 +343,8 @@ class TradeCreateSerializer(serializers.Serializer):
         user.daily_trade_value += initiator_card.value
         user.save(update_fields=["daily_trade_count", "daily_trade_value"])
 
+        record_trade_velocity(trade)
+
         return trade
 
 
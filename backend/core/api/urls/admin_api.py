@@ -10,6 +10,7 @@ from core.api.views.admin_api import (
     AdminPlatformSettingsListView,
     AdminPlatformSettingsUpdateView,
     AdminRevenueView,
+    AdminSingleFlightStatsView,
     AdminTradeReverseView,
     AdminTransactionListView,
     AdminUserListView,
@@ -67,4 +68,10 @@ urlpatterns = [
         AdminPlatformSettingsUpdateView.as_view(),
         name="admin-settings-update",
     ),
+    # Request coalescing counters
+    path(
+        "singleflight/",
+        AdminSingleFlightStatsView.as_view(),
+        name="admin-singleflight-stats",
+    ),
 ]
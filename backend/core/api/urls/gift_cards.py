@@ -5,12 +5,14 @@ from core.api.views.gift_cards import (
     GiftCardCodeView,
     GiftCardDetailView,
     GiftCardListCreateView,
+    MarketplaceFacetsView,
     MarketplaceView,
 )
 
 urlpatterns = [
     path("brands/", BrandListView.as_view(), name="brand-list"),
     path("marketplace/", MarketplaceView.as_view(), name="marketplace"),
+    path("marketplace/facets/", MarketplaceFacetsView.as_view(), name="marketplace-facets"),
     path("gift-cards/", GiftCardListCreateView.as_view(), name="gift-card-list"),
     path("gift-cards/<int:pk>/", GiftCardDetailView.as_view(), name="gift-card-detail"),
     path("gift-cards/<int:pk>/code/", GiftCardCodeView.as_view(), name="gift-card-code"),
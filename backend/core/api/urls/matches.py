@@ -1,7 +1,8 @@
 from django.urls import path
 
-from core.api.views.matches import MatchSuggestionsView
+from core.api.views.matches import MatchSuggestionsView, SwapCycleView
 
 urlpatterns = [
     path("matches/", MatchSuggestionsView.as_view(), name="match-suggestions"),
+    path("matches/cycles/", SwapCycleView.as_view(), name="match-cycles"),
 ]
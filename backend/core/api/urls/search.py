@@ -0,0 +1,8 @@
+from django.urls import path
+
+from core.api.views.search import BrandAutocompleteView, BrandSearchView
+
+urlpatterns = [
+    path("search/", BrandSearchView.as_view(), name="brand-search"),
+    path("search/autocomplete/", BrandAutocompleteView.as_view(), name="brand-autocomplete"),
+]
@@ -37,6 +37,7 @@ from core.models import (
     Trade,
     User,
 )
+from core.singleflight import SingleFlight
 
 
 # ─── 1. Admin User List ───
@@ -305,6 +306,8 @@ class AdminAuditLogListView(generics.ListAPIView):
 # ─── 10. Admin Revenue ───
 # GET /api/admin/revenue/
 
+revenue_flight = SingleFlight("admin-revenue")
+
 
 class AdminRevenueView(APIView):
     """Revenue stats: total fees from trades/sales, daily/weekly/monthly breakdown."""
@@ -312,6 +315,10 @@ class AdminRevenueView(APIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     def get(self, request):
+        # Every admin sees the same figures, so concurrent loads share one run.
+        return Response(revenue_flight.do("revenue", self._build_revenue))
+
+    def _build_revenue(self):
         zero = Decimal("0.00")
 
         # Total trade fees from completed trades
@@ -352,7 +359,7 @@ class AdminRevenueView(APIView):
         }
 
         serializer = AdminRevenueSerializer(data)
-        return Response(serializer.data)
+        return serializer.data
 
     def _get_breakdown(self, trunc_func):
         zero = Decimal("0.00")
@@ -507,3 +514,18 @@ class AdminPlatformSettingsUpdateView(generics.UpdateAPIView):
 
     def get_queryset(self):
         return PlatformSettings.objects.all()
+
+
+# ─── 14. Admin Single-Flight Stats ───
+# GET /api/admin/singleflight/
+
+
+class AdminSingleFlightStatsView(APIView):
+    """Per-endpoint request coalescing counters for this server process."""
+
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            name: flight.stats() for name, flight in sorted(SingleFlight.registry.items())
+        })
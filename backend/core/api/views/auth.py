@@ -3,10 +3,13 @@ from rest_framework import generics, status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView as BaseTokenRefreshView
 
 from core.api.throttles import AuthRateThrottle
 from core.emails import send_password_reset_email, send_verification_email
+from core.ip_tracking import get_client_ip, record_login_ip
 from core.models import User
 from core.turnstile import verify_turnstile
 from core.api.serializers.auth import (
@@ -81,6 +84,7 @@ class LoginView(APIView):
             )
 
         user = serializer.validated_data["user"]
+        record_login_ip(user, get_client_ip(request))
         tokens = RefreshToken.for_user(user)
         return Response(
             {
@@ -94,6 +98,22 @@ class LoginView(APIView):
         )
 
 
+class TokenRefreshView(BaseTokenRefreshView):
+    """POST /api/auth/token/refresh/
+
+    Exchange a refresh token for a new access token (and, with rotation,
+    a new refresh token).  Records the client IP like a login.
+    """
+
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        refresh = RefreshToken(request.data["refresh"], verify=False)
+        user = User.objects.filter(pk=refresh[jwt_settings.USER_ID_CLAIM]).first()
+        if user is not None:
+            record_login_ip(user, get_client_ip(request))
+        return response
+
+
 class LogoutView(APIView):
     """POST /api/auth/logout/
 
@@ -1,7 +1,3 @@
-from decimal import Decimal
-
-from django.db.models import Q, Sum
-
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -10,7 +6,8 @@ from core.api.serializers.dashboard import (
     DashboardNotificationSerializer,
     DashboardStatsSerializer,
 )
-from core.models import GiftCard, Notification, Sale, Trade
+from core.models import GiftCard, Notification
+from core.user_stats import get_stats
 
 
 class DashboardStatsView(APIView):
@@ -34,35 +31,14 @@ class DashboardStatsView(APIView):
             owner=user, status=GiftCard.Status.ACTIVE
         ).count()
 
-        user_trades = Trade.objects.filter(Q(initiator=user) | Q(responder=user))
-
-        pending_trades = user_trades.filter(
-            status__in=[
-                Trade.Status.PROPOSED,
-                Trade.Status.ACCEPTED,
-                Trade.Status.IN_ESCROW,
-                Trade.Status.CODES_RELEASED,
-                Trade.Status.CONFIRMING,
-            ]
-        ).count()
-
-        completed_trades = user_trades.filter(
-            status=Trade.Status.COMPLETED
-        ).count()
-
-        total_earned = (
-            Sale.objects.filter(
-                seller=user, status=Sale.Status.COMPLETED
-            ).aggregate(total=Sum("amount"))["total"]
-            or Decimal("0.00")
-        )
+        stats = get_stats(user)
 
         data = {
             "wallet_balance": user.wallet_balance,
             "active_listings": active_listings,
-            "pending_trades": pending_trades,
-            "completed_trades": completed_trades,
-            "total_earned": total_earned,
+            "pending_trades": stats.active_trades,
+            "completed_trades": stats.successful_trades,
+            "total_earned": stats.earnings,
         }
 
         serializer = DashboardStatsSerializer(data)
@@ -1,10 +1,14 @@
 import django_filters
-from rest_framework import generics, status
-from rest_framework.exceptions import PermissionDenied
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from rest_framework import filters, generics, status
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from core.api.pagination import StandardPagination
+from core.api.caching import CachedListMixin
+from core.api.pagination import KeysetPagination, StandardPagination
 from core.api.permissions import IsOwner
 from core.api.serializers.gift_cards import (
     BrandSerializer,
@@ -17,6 +21,7 @@ from core.api.serializers.gift_cards import (
 )
 from django.utils import timezone
 
+from core import facets, listing_cache, search
 from core.models import Brand, GiftCard, Sale, Trade
 
 
@@ -25,26 +30,63 @@ from core.models import Brand, GiftCard, Sale, Trade
 
 class MarketplaceFilter(django_filters.FilterSet):
     brand = django_filters.NumberFilter(field_name="brand")
+    category = django_filters.CharFilter(field_name="brand__category")
     listing_type = django_filters.CharFilter(field_name="listing_type")
     min_value = django_filters.NumberFilter(field_name="value", lookup_expr="gte")
     max_value = django_filters.NumberFilter(field_name="value", lookup_expr="lte")
 
     class Meta:
         model = GiftCard
-        fields = ["brand", "listing_type", "min_value", "max_value"]
+        fields = ["brand", "category", "listing_type", "min_value", "max_value"]
+
+
+class BrandSearchFilter(filters.SearchFilter):
+    """
+    ``?search=`` through the brand full-text index (see ``core.search``)
+    instead of ``ILIKE '%q%'``.  The view's ``search_brand_field`` names
+    its brand id lookup.  Brand lists are ranked by relevance unless
+    ``?ordering=`` is given.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "")
+        if not search.terms(query):
+            return queryset
+        brand_ids = search.search_brands(query)
+        field = view.search_brand_field
+        queryset = queryset.filter(**{f"{field}__in": brand_ids})
+        if field == "pk" and brand_ids and not request.query_params.get(
+            filters.OrderingFilter.ordering_param
+        ):
+            # One CASE over the integer ids: hundreds of ORM When()s take
+            # far longer to compile than the query takes to run.
+            opts = queryset.model._meta
+            column = f"{connection.ops.quote_name(opts.db_table)}.{connection.ops.quote_name(opts.pk.column)}"
+            ranks = " ".join(f"WHEN {int(pk)} THEN {rank}" for rank, pk in enumerate(brand_ids))
+            queryset = queryset.order_by(RawSQL(f"CASE {column} {ranks} END", ()))
+        return queryset
+
+
+SEARCH_FILTER_BACKENDS = [
+    django_filters.rest_framework.DjangoFilterBackend,
+    BrandSearchFilter,
+    filters.OrderingFilter,
+]
 
 
 # ─── Brand List View ───
 
 
-class BrandListView(generics.ListAPIView):
+class BrandListView(CachedListMixin, generics.ListAPIView):
     """GET /api/brands/ -- Public list of active brands."""
 
+    cache_name = "brands"
     queryset = Brand.objects.filter(is_active=True)
     serializer_class = BrandSerializer
     permission_classes = [AllowAny]
     pagination_class = StandardPagination
-    search_fields = ["name", "category"]
+    filter_backends = SEARCH_FILTER_BACKENDS
+    search_brand_field = "pk"
 
 
 # ─── Gift Card List / Create View ───
@@ -122,28 +164,75 @@ class GiftCardDetailView(generics.RetrieveUpdateDestroyAPIView):
 # ─── Marketplace View ───
 
 
-class MarketplaceView(generics.ListAPIView):
-    """GET /api/marketplace/ -- Browse available gift cards (public)."""
+class MarketplaceView(CachedListMixin, generics.ListAPIView):
+    """
+    GET /api/marketplace/ -- Browse available gift cards (public).
+
+    Authenticated users get the shared anonymous listing minus their own
+    cards (see CachedListMixin).
+    """
 
+    cache_name = "marketplace"
+    owner_field = "owner"
     serializer_class = MarketplaceSerializer
     permission_classes = [AllowAny]
-    pagination_class = StandardPagination
+    pagination_class = KeysetPagination
     filterset_class = MarketplaceFilter
-    search_fields = ["brand__name"]
+    filter_backends = SEARCH_FILTER_BACKENDS
+    search_brand_field = "brand"
     ordering_fields = ["value", "selling_price", "created_at", "expiry_date"]
     ordering = ["-created_at"]
 
     def get_queryset(self):
-        qs = GiftCard.objects.filter(
+        return GiftCard.objects.filter(
             status=GiftCard.Status.ACTIVE,
             expiry_date__gte=timezone.now().date(),
         ).select_related("brand", "owner")
 
-        # Exclude the current user's own cards if authenticated
-        if self.request.user.is_authenticated:
-            qs = qs.exclude(owner=self.request.user)
 
-        return qs
+# ─── Marketplace Facets View ───
+
+
+class MarketplaceFacetsView(APIView):
+    """
+    GET /api/marketplace/facets/ -- Counts of available cards per brand,
+    category, listing type and value bucket for the marketplace filters in
+    the query string (the same parameters as /api/marketplace/, including
+    ``search``).  Read from the precomputed facet table (see
+    ``core.facets``), so the cost follows the number of facets, not of
+    listings.  Responses are cached under the listings version, like the
+    marketplace itself.
+    """
+
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        entry_key = listing_cache.key("facets", listing_cache.version(), request)
+        body = listing_cache.lookup(entry_key)
+        if body is None:
+            body = self._facets(request)
+            listing_cache.store(entry_key, body)
+        return Response(body)
+
+    def _facets(self, request):
+        filterset = MarketplaceFilter(request.query_params, queryset=GiftCard.objects.none())
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        params = filterset.form.cleaned_data
+
+        brand_ids = None
+        query = request.query_params.get(filters.SearchFilter.search_param, "")
+        if search.terms(query):
+            brand_ids = search.search_brands(query)
+
+        return facets.facet_counts(
+            brand=params.get("brand"),
+            category=params.get("category"),
+            listing_type=params.get("listing_type"),
+            min_value=params.get("min_value"),
+            max_value=params.get("max_value"),
+            brand_ids=brand_ids,
+        )
 
 
 # ─── Gift Card Code View ───
@@ -1,11 +1,20 @@
+from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from core.matching import get_swap_suggestions
+from core.api.pagination import MatchCursorPagination
+from core.match_reasons import attach_reasons
+from core.matching import build_swap_suggestions
+from core.models import GiftCard, MatchCandidate
+from core.singleflight import SingleFlight
+from core.swap_cycles import find_user_cycles, get_shared_graph
 
+# Coalesces identical concurrent requests (e.g. retries, parallel page loads).
+match_flight = SingleFlight("matches")
 
-class MatchSuggestionsView(APIView):
+
+class MatchSuggestionsView(generics.ListAPIView):
     """
     GET /api/matches/
 
@@ -13,18 +22,85 @@ class MatchSuggestionsView(APIView):
     Each suggestion pairs one of the user's active swap-listed cards
     with another user's active swap-listed card, scored by value
     similarity, brand preference, reputation, and recency.
+
+    Suggestions are read from the precomputed match index (see
+    ``core.match_index``) and paginated by cursor; ``limit`` sets the
+    page size.
+    """
+
+    permission_classes = [IsAuthenticated]
+    pagination_class = MatchCursorPagination
+    filter_backends = []
+
+    def get_queryset(self):
+        return MatchCandidate.objects.filter(user=self.request.user).select_related(
+            "user_card__brand",
+            "suggested_card__brand",
+            "suggested_card__owner",
+        )
+
+    def list(self, request, *args, **kwargs):
+        key = (request.user.pk, request.build_absolute_uri())
+        return Response(match_flight.do(key, lambda: self._build_page(request)))
+
+    def _build_page(self, request):
+        page = self.paginate_queryset(self.get_queryset())
+        suggestions = build_swap_suggestions(
+            [(entry.user_card, entry.suggested_card, entry.score) for entry in page]
+        )
+        suggestions = attach_reasons(suggestions)
+        return self.get_paginated_response(suggestions).data
+
+
+class SwapCycleView(APIView):
+    """
+    GET /api/matches/cycles/
+
+    Returns 3- and 4-way swap cycles that include one of the authenticated
+    user's active swap-listed cards, best first.  Each leg lists the card
+    an owner gives and the card they receive.  ``limit`` (max 50) sets how
+    many cycles are returned.
     """
 
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        limit = request.query_params.get("limit", 10)
         try:
-            limit = int(limit)
-            if limit < 1:
-                limit = 10
-        except (TypeError, ValueError):
+            limit = min(max(int(request.query_params.get("limit", 10)), 1), 50)
+        except ValueError:
             limit = 10
 
-        suggestions = get_swap_suggestions(request.user, limit=limit)
-        return Response(suggestions)
+        graph = get_shared_graph()
+        cycles = find_user_cycles(graph, request.user.pk, limit=limit)
+
+        card_ids = graph.snapshot.card_ids
+        cards = GiftCard.objects.filter(
+            listing_type=GiftCard.ListingType.SWAP,
+            status=GiftCard.Status.ACTIVE,
+        ).select_related("brand", "owner").in_bulk(
+            {int(card_ids[row]) for _, _, rows in cycles for row in rows}
+        )
+
+        def describe(card):
+            return {"id": card.id, "brand": card.brand.name, "value": str(card.value)}
+
+        results = []
+        for score, weakest_hop, rows in cycles:
+            legs = [cards.get(int(card_ids[row])) for row in rows]
+            if None in legs:
+                # A card was delisted since the graph was loaded.
+                continue
+            results.append({
+                "match_score": score,
+                "weakest_hop_score": weakest_hop,
+                "length": len(legs),
+                "legs": [
+                    {
+                        "owner_username": card.owner.username,
+                        "gives": describe(card),
+                        "receives": describe(legs[(i + 1) % len(legs)]),
+                    }
+                    for i, card in enumerate(legs)
+                ],
+            })
+        return Response(results)
@@ -3,7 +3,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from core.api.pagination import StandardPagination
+from core.api.pagination import KeysetPagination
 from core.api.serializers.notifications import (
     NotificationSerializer,
     NotificationUpdateSerializer,
@@ -14,7 +14,7 @@ from core.models import Notification
 class NotificationListView(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardPagination
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         qs = Notification.objects.filter(user=self.request.user)
@@ -5,7 +5,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from core.api.pagination import StandardPagination
+from core.api.pagination import KeysetPagination
 from core.api.serializers.sales import (
     SaleCreateSerializer,
     SaleDetailSerializer,
@@ -19,7 +19,7 @@ from core.models import GiftCard, Sale
 
 class SaleListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardPagination
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
         if self.request.method == "POST":
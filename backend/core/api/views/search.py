@@ -0,0 +1,57 @@
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import search
+from core.api.serializers.gift_cards import BrandSerializer
+from core.models import Brand
+
+
+def _limit(request, default=10, maximum=50):
+    try:
+        return max(1, min(int(request.query_params.get("limit", default)), maximum))
+    except ValueError:
+        return default
+
+
+class BrandSearchView(APIView):
+    """
+    GET /api/search/?q= -- Active brands matching every word of ``q`` (as
+    prefixes, by name or category), most relevant first.  ``limit`` sets
+    how many are returned (default 10, at most 50).
+    """
+
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        query = request.query_params.get("q", "")
+        brand_ids = search.search_brands(query, _limit(request))
+        brands = Brand.objects.in_bulk(brand_ids)
+        results = [brands[pk] for pk in brand_ids if pk in brands]
+        return Response({
+            "query": query,
+            "results": BrandSerializer(results, many=True, context={"request": request}).data,
+        })
+
+
+class BrandAutocompleteView(APIView):
+    """
+    GET /api/search/autocomplete/?q= -- Brand names starting with ``q``
+    (or with a later word starting with it), popular brands first; at
+    most ``limit`` (default and maximum 10).  Served from memory; runs no
+    queries once the trie is loaded.
+    """
+
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        query = request.query_params.get("q", "")
+        limit = _limit(request, maximum=search.AUTOCOMPLETE_SIZE)
+        suggestions = search.autocomplete(query)[:limit]
+        return Response({
+            "query": query,
+            "suggestions": [
+                {"id": brand["id"], "name": brand["name"], "category": brand["category"]}
+                for brand in suggestions
+            ],
+        })
@@ -0,0 +1,252 @@
+"""
+Collusion and wash-trading ring detection.
+
+Rings of accounts can farm trust tiers by swapping cards back and forth,
+since ``check_and_upgrade_trust_tier`` only counts completed trades.  The
+analyzer streams completed trades in primary-key order and keeps only
+bounded summaries, so memory does not grow with the number of trades:
+
+1. **Pair counts**: a Misra-Gries summary of trades per (unordered) user
+   pair.  With ``pair_capacity`` slots it keeps every pair that makes up
+   more than 1/``pair_capacity`` of the stream.
+2. **Card returns**: the last move of each recently traded card, in an LRU
+   map of ``card_memory`` cards.  A card moving straight back to the user
+   who gave it away ("ping-pong") counts against that pair.
+3. A second pass counts trades exactly, for the surviving pairs only.
+
+Pairs with at least ``RING_MIN_PAIR_TRADES`` trades or any card return are
+suspicious edges.  Union-find over those edges groups users into clusters,
+and a cluster is flagged when it returns cards repeatedly, or when it has
+enough trades among itself to reach a trust tier and makes most of its
+members' trades internally.
+"""
+
+import logging
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+
+from django.db import models
+
+from core.fraud_detection import (
+    TIER_1_SUCCESSFUL_TRADES,
+    _create_flag,
+    _has_existing_pending_flag,
+)
+from core.models import FraudFlag, Trade, User
+
+logger = logging.getLogger("core")
+
+# ─── Thresholds ───
+RING_MIN_PAIR_TRADES = 3  # Trades between two users that make them an edge
+RING_MIN_CARD_RETURNS = 2  # Cards handed straight back within a cluster
+RING_MIN_INTERNAL_TRADES = TIER_1_SUCCESSFUL_TRADES  # Enough to reach a trust tier
+RING_MIN_INSULARITY = 0.8  # Share of members' trades made inside the cluster
+
+PAIR_CAPACITY = 100_000
+CARD_MEMORY = 200_000
+
+# Keeps ``IN (...)`` lists under SQLite's bound-parameter limit.
+_CHUNK_SIZE = 500
+_STREAM_CHUNK_SIZE = 5_000
+
+
+class MisraGries:
+    """Counts of the heaviest keys in a stream, using at most ``capacity`` slots."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, key):
+        counts = self.counts
+        if key in counts:
+            counts[key] += 1
+        elif len(counts) < self.capacity:
+            counts[key] = 1
+        else:
+            # Every decrement cancels capacity + 1 occurrences, so this runs
+            # at most len(stream) / (capacity + 1) times.
+            for other in list(counts):
+                if counts[other] == 1:
+                    del counts[other]
+                else:
+                    counts[other] -= 1
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        root = self.parent.setdefault(item, item)
+        while root != self.parent[root]:
+            root = self.parent[root]
+        while item != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    def groups(self):
+        members = defaultdict(list)
+        for item in self.parent:
+            members[self.find(item)].append(item)
+        return [sorted(group) for group in members.values()]
+
+
+@dataclass
+class Cluster:
+    user_ids: list
+    internal_trades: int = 0
+    card_returns: int = 0
+    total_trades: int = 0
+
+    @property
+    def insularity(self):
+        # An internal trade counts once for each of its two members.
+        return 2 * self.internal_trades / self.total_trades if self.total_trades else 0.0
+
+    @property
+    def is_suspicious(self):
+        if self.card_returns >= RING_MIN_CARD_RETURNS:
+            return True
+        return (
+            self.internal_trades >= RING_MIN_INTERNAL_TRADES
+            and self.insularity >= RING_MIN_INSULARITY
+        )
+
+
+def _pair(a, b):
+    return (a, b) if a < b else (b, a)
+
+
+def _completed_trades(since=None):
+    trades = Trade.objects.filter(status=Trade.Status.COMPLETED).exclude(
+        initiator_id=models.F("responder_id")
+    )
+    if since is not None:
+        trades = trades.filter(updated_at__gte=since)
+    return trades.order_by("pk")
+
+
+def _stream(trades, *fields):
+    return trades.values_list(*fields).iterator(chunk_size=_STREAM_CHUNK_SIZE)
+
+
+def _summarize(trades, pair_capacity, card_memory):
+    """First pass: heavy pairs and card returns per pair."""
+    pairs = MisraGries(pair_capacity)
+    returns = MisraGries(pair_capacity)
+    last_moves = OrderedDict()
+    streamed = 0
+
+    def move(card_id, giver, receiver):
+        previous = last_moves.pop(card_id, None)
+        if previous == (receiver, giver):
+            returns.add(_pair(giver, receiver))
+        last_moves[card_id] = (giver, receiver)
+        if len(last_moves) > card_memory:
+            last_moves.popitem(last=False)
+
+    for initiator, responder, initiator_card, responder_card in _stream(
+        trades, "initiator_id", "responder_id", "initiator_card_id", "responder_card_id"
+    ):
+        streamed += 1
+        pairs.add(_pair(initiator, responder))
+        move(initiator_card, initiator, responder)
+        move(responder_card, responder, initiator)
+
+    return streamed, pairs.counts, returns.counts
+
+
+def _exact_pair_counts(trades, candidates):
+    """Second pass: exact trade counts for ``candidates`` pairs only."""
+    counts = dict.fromkeys(candidates, 0)
+    for initiator, responder in _stream(trades, "initiator_id", "responder_id"):
+        key = _pair(initiator, responder)
+        if key in counts:
+            counts[key] += 1
+    return counts
+
+
+def _total_trade_counts(trades, user_ids):
+    """Completed trades per user, on either side, for ``user_ids``."""
+    totals = defaultdict(int)
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), _CHUNK_SIZE):
+        chunk = user_ids[start:start + _CHUNK_SIZE]
+        for side in ("initiator_id", "responder_id"):
+            rows = (
+                trades.filter(**{f"{side}__in": chunk})
+                .order_by()
+                .values(side)
+                .annotate(total=models.Count("id"))
+            )
+            for row in rows:
+                totals[row[side]] += row["total"]
+    return totals
+
+
+def find_collusion_clusters(
+    since=None, pair_capacity=PAIR_CAPACITY, card_memory=CARD_MEMORY
+):
+    """
+    Group users linked by repeated trades or card returns into clusters.
+
+    Returns ``(trades_streamed, clusters)``; clusters include unsuspicious
+    ones, check ``Cluster.is_suspicious``.
+    """
+    trades = _completed_trades(since)
+    streamed, heavy_pairs, return_pairs = _summarize(trades, pair_capacity, card_memory)
+    pair_counts = _exact_pair_counts(trades, set(heavy_pairs) | set(return_pairs))
+
+    edges = UnionFind()
+    for key, count in pair_counts.items():
+        if count >= RING_MIN_PAIR_TRADES or key in return_pairs:
+            edges.union(*key)
+
+    clusters = {}
+    for user_ids in edges.groups():
+        cluster = Cluster(user_ids)
+        for user_id in user_ids:
+            clusters[user_id] = cluster
+    for key, count in pair_counts.items():
+        cluster = clusters.get(key[0])
+        if cluster is not None and key[1] in cluster.user_ids:
+            cluster.internal_trades += count
+            cluster.card_returns += return_pairs.get(key, 0)
+
+    totals = _total_trade_counts(trades, clusters)
+    for user_id, cluster in clusters.items():
+        cluster.total_trades += totals[user_id]
+
+    unique = {id(cluster): cluster for cluster in clusters.values()}
+    return streamed, sorted(unique.values(), key=lambda c: c.user_ids)
+
+
+def flag_collusion_clusters(clusters):
+    """Flag active members of suspicious clusters; returns the new flags."""
+    new_flags = []
+    for cluster in clusters:
+        if not cluster.is_suspicious:
+            continue
+        members = list(User.objects.filter(pk__in=cluster.user_ids).order_by("pk"))
+        names = ", ".join(member.username for member in members[:10])
+        if len(members) > 10:
+            names += f" and {len(members) - 10} more"
+        for user in members:
+            if user.status != User.Status.ACTIVE:
+                continue
+            if _has_existing_pending_flag(user, FraudFlag.FlagType.COLLUSION_RING):
+                continue
+            details = (
+                f"User {user.username} is in a cluster of {len(members)} accounts ({names}) "
+                f"with {cluster.internal_trades} trades among them, "
+                f"{cluster.card_returns} card(s) handed straight back, and "
+                f"{cluster.insularity:.0%} of their trades made inside the cluster."
+            )
+            new_flags.append(_create_flag(user, FraudFlag.FlagType.COLLUSION_RING, details))
+    return new_flags
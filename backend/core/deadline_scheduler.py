@@ -0,0 +1,148 @@
+"""
+In-process scheduler that finalizes trades as their confirmation windows
+close.
+
+The scheduler keeps the upcoming escrow confirmation deadlines in a
+min-heap, sleeps until the earliest one, and hands every trade that is
+due to ``trade_state.finalize_expired`` (which re-checks eligibility, so
+heap entries for trades that were confirmed or disputed in the meantime
+are simply dropped).
+
+- The heap is rebuilt from an indexed query (``confirmation_deadline``) at
+  start-up, so a restart loses nothing: overdue trades are finalized on
+  the first pass.
+- New deadlines are picked up by a short poll.  A window opened after the
+  last poll can't close sooner than ``confirmation_window_minutes`` after
+  it, so each poll only reads deadlines from that point on.  A periodic
+  full rebuild covers anything the poll can't see (for example the
+  window setting being shortened).
+- Memory is bounded: at most ``capacity`` deadlines are held.  Deadlines
+  that don't fit are loaded by a rebuild once the heap has drained (or by
+  the next periodic one).
+"""
+
+import heapq
+import logging
+from datetime import timedelta
+
+from django.utils import timezone
+
+from core import trade_state
+from core.models import EscrowSession, PlatformSettings, Trade
+
+logger = logging.getLogger("core")
+
+# Trades still eligible after a pass (their rows were locked by another
+# request) are retried this much later.
+RETRY_DELAY = timedelta(seconds=1)
+
+
+class DeadlineScheduler:
+    def __init__(self, capacity=10_000, poll_interval=5.0, rebuild_interval=600.0):
+        self.capacity = capacity
+        self.poll_interval = timedelta(seconds=poll_interval)
+        self.rebuild_interval = timedelta(seconds=rebuild_interval)
+        self._heap = []  # (deadline, trade pk)
+        self._scheduled = set()
+        self._truncated = False
+        self._polled_at = None
+        self._rebuilt_at = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _deadlines(self):
+        return EscrowSession.objects.filter(
+            trade__status=Trade.Status.CONFIRMING,
+            confirmation_deadline__isnull=False,
+        ).order_by("confirmation_deadline")
+
+    def schedule(self, deadline, trade_pk):
+        """Track ``trade_pk``; returns False if it is already tracked or the heap is full."""
+        if trade_pk in self._scheduled:
+            return False
+        if len(self._heap) >= self.capacity:
+            # Picked up by the rebuild once the heap drains (or at the next
+            # periodic rebuild, if it is earlier than what is held).
+            self._truncated = True
+            return False
+        heapq.heappush(self._heap, (deadline, trade_pk))
+        self._scheduled.add(trade_pk)
+        return True
+
+    def rebuild(self, now=None):
+        """Reload the earliest ``capacity`` deadlines from the database."""
+        now = now or timezone.now()
+        rows = list(
+            self._deadlines().values_list("confirmation_deadline", "trade_id")[: self.capacity + 1]
+        )
+        self._truncated = len(rows) > self.capacity
+        self._heap = rows[: self.capacity]
+        heapq.heapify(self._heap)
+        self._scheduled = {trade_pk for _, trade_pk in self._heap}
+        self._polled_at = self._rebuilt_at = now
+        return len(self._heap)
+
+    def poll(self, now=None):
+        """Schedule deadlines opened since the last poll; returns how many were new."""
+        now = now or timezone.now()
+        window = timedelta(minutes=PlatformSettings.get_int("confirmation_window_minutes", 60))
+        # Allow a little clock skew between this process and the web servers.
+        since = self._polled_at + window - self.poll_interval
+        added = sum(
+            self.schedule(deadline, trade_pk)
+            for deadline, trade_pk in self._deadlines()
+            .filter(confirmation_deadline__gte=since)
+            .values_list("confirmation_deadline", "trade_id")[: self.capacity]
+        )
+        self._polled_at = now
+        return added
+
+    def pop_due(self, now=None):
+        """Remove and return the trade pks whose deadline has passed."""
+        now = now or timezone.now()
+        due = []
+        while self._heap and self._heap[0][0] < now:
+            _, trade_pk = heapq.heappop(self._heap)
+            self._scheduled.discard(trade_pk)
+            due.append(trade_pk)
+        return due
+
+    def run_due(self, now=None):
+        """Finalize every trade that is due; returns the rows finalized."""
+        now = now or timezone.now()
+        due = self.pop_due(now)
+        if not due:
+            return []
+        rows = trade_state.finalize_expired(due, now)
+        if rows:
+            logger.info("Auto-finalized %d trade(s) at their confirmation deadline", len(rows))
+        finalized = {row[0] for row in rows}
+        retry = set(due) - finalized
+        if retry:
+            still_eligible = trade_state.expired_confirmations(now).filter(pk__in=retry)
+            for trade_pk in still_eligible.values_list("pk", flat=True):
+                self.schedule(now + RETRY_DELAY, trade_pk)
+        return rows
+
+    def tick(self, now=None):
+        """
+        One scheduler step: rebuild or poll if it is time, then finalize
+        what is due.  Returns ``(rows finalized, seconds to sleep)``.
+        """
+        now = now or timezone.now()
+        if (
+            self._rebuilt_at is None
+            or now - self._rebuilt_at >= self.rebuild_interval
+            or (self._truncated and not self._heap)
+        ):
+            self.rebuild(now)
+        elif now - self._polled_at >= self.poll_interval:
+            self.poll(now)
+
+        rows = self.run_due(now)
+
+        wake = self._polled_at + self.poll_interval
+        if self._heap:
+            wake = min(wake, self._heap[0][0])
+        return rows, max((wake - timezone.now()).total_seconds(), 0.0)
@@ -1,6 +1,9 @@
 """
 Centralized email sending for Perkify.
-Uses Django's email framework backed by SendGrid Web API.
+Uses Django's email framework backed by SendGrid Web API.  Emails are
+queued as background jobs, so requests never wait on SendGrid.  Jobs
+carry only the user's id: OTP codes and reset tokens are read or made by
+the worker, so they are never stored in ``Job.kwargs``.
 """
 
 import logging
@@ -14,13 +17,16 @@ from django.utils import timezone
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 
+from core import jobs
+from core.models import User
+
 logger = logging.getLogger("core")
 
 FRONTEND_URL = getattr(settings, "FRONTEND_URL", "http://localhost:3000")
 
 
-def _send(subject, text_body, html_body, to_email):
-    """Send an email via SendGrid Web API."""
+def deliver_email(subject, text_body, html_body, to_email):
+    """Send an email via SendGrid Web API.  Raises on failure, so the calling job is retried."""
     msg = EmailMultiAlternatives(
         subject=subject,
         body=text_body,
@@ -29,11 +35,8 @@ def _send(subject, text_body, html_body, to_email):
         reply_to=[getattr(settings, "REPLY_TO_EMAIL", settings.DEFAULT_FROM_EMAIL)],
     )
     msg.attach_alternative(html_body, "text/html")
-    try:
-        msg.send()
-        logger.info("Email sent to %s: %s", to_email, subject)
-    except Exception as exc:
-        logger.error("Failed to send email to %s: %s", to_email, exc)
+    msg.send()
+    logger.info("Email sent to %s: %s", to_email, subject)
 
 
 def generate_otp(user):
@@ -47,7 +50,17 @@ def generate_otp(user):
 
 def send_verification_email(user):
     """Send a 6-digit OTP code via email for account verification."""
-    otp = generate_otp(user)
+    generate_otp(user)
+    jobs.enqueue("core.emails.deliver_verification_email", {"user_id": user.pk})
+
+
+def deliver_verification_email(user_id):
+    """Job task: email the user's current OTP, unless it was used or has expired."""
+    user = User.objects.filter(pk=user_id).first()
+    if user is None or not user.otp_code or user.otp_expires_at <= timezone.now():
+        logger.info("Verification email for user %s skipped: no current code", user_id)
+        return
+    otp = user.otp_code
 
     subject = "Verify your Perkify account"
 
@@ -91,11 +104,19 @@ def send_verification_email(user):
     </div>
     """
 
-    _send(subject, text_body, html_body, user.email)
+    deliver_email(subject, text_body, html_body, user.email)
 
 
 def send_password_reset_email(user):
     """Send password reset link."""
+    jobs.enqueue("core.emails.deliver_password_reset_email", {"user_id": user.pk})
+
+
+def deliver_password_reset_email(user_id):
+    """Job task: make a reset token for the user and email the link."""
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return
     uid = urlsafe_base64_encode(force_bytes(user.pk))
     token = default_token_generator.make_token(user)
     reset_url = f"{FRONTEND_URL}/auth/reset-password?uid={uid}&token={token}"
@@ -137,4 +158,4 @@ def send_password_reset_email(user):
     </div>
     """
 
-    _send(subject, text_body, html_body, user.email)
+    deliver_email(subject, text_body, html_body, user.email)
@@ -0,0 +1,253 @@
+"""
+Denormalized marketplace facet counts (``ListingFacet``).
+
+Each row counts the active gift cards in one cell: a brand, a listing
+type and a value bucket.  A card that enters, leaves or moves between
+cells applies a +1/-1 to them with ``F()`` expressions, in the same
+transaction as the change (``core.signals`` calls in from the save and
+delete handlers).  Bulk ``QuerySet.update()`` calls bypass the signals,
+so callers recompute the cells of the cards they changed instead.
+
+Cells are created on first use: an increment that finds no row computes
+the cell from ``GiftCard``.  ``reconcile_listing_facets`` compares every cell
+against the source table.
+
+``facet_counts()`` answers the marketplace's filter sidebar from these
+rows.  Counts include cards whose expiry date has passed until
+``check_expiry`` marks them expired, and a user's own cards.
+"""
+
+from bisect import bisect_right
+from collections import Counter
+from decimal import Decimal
+
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+
+from core.models import GiftCard, ListingFacet
+
+# Lower bounds of the value buckets; the last one is open-ended.
+VALUE_BUCKETS = (0, 25, 50, 100, 250, 500)
+
+# Brands listed in the brand facet, most cards first.
+FACET_BRAND_LIMIT = 50
+
+_CHUNK_SIZE = 500
+
+
+def value_bucket(value):
+    """The lower bound of the bucket ``value`` falls in."""
+    return VALUE_BUCKETS[max(bisect_right(VALUE_BUCKETS, value) - 1, 0)]
+
+
+def bucket_range(lower):
+    """``(lower, upper)`` of a bucket; ``upper`` is None for the last one."""
+    index = VALUE_BUCKETS.index(lower)
+    upper = VALUE_BUCKETS[index + 1] if index + 1 < len(VALUE_BUCKETS) else None
+    return lower, upper
+
+
+def _cell(state):
+    """The ``(brand_id, listing_type, value_bucket)`` a card in ``state`` counts in, or None."""
+    if not state or state.get("status") != GiftCard.Status.ACTIVE:
+        return None
+    if state.get("brand_id") is None or state.get("value") is None:
+        # Deferred when the card was loaded; reconciliation catches it.
+        return None
+    return (state["brand_id"], state["listing_type"], value_bucket(state["value"]))
+
+
+def _cell_filter(cell):
+    brand_id, listing_type, lower = cell
+    return {"brand_id": brand_id, "listing_type": listing_type, "value_bucket": lower}
+
+
+def _apply(deltas):
+    """Add ``deltas`` (``{cell: delta}``) to the stored rows; compute rows that don't exist yet."""
+    missing = []
+    for cell, delta in deltas.items():
+        if not delta:
+            continue
+        updated = ListingFacet.objects.filter(**_cell_filter(cell)).update(count=F("count") + delta)
+        # A cell with no row has nothing to take away from (and may be in
+        # the middle of a cascading brand delete).
+        if not updated and delta > 0:
+            missing.append(cell)
+    if missing:
+        # Computed from GiftCard, which already includes this change.
+        recompute_cells(missing)
+
+
+def card_changed(card, old_state):
+    """Apply a card's move from ``old_state`` (its ``listing_state()`` when loaded; None if new)."""
+    old, new = _cell(old_state), _cell(card.listing_state())
+    if old != new:
+        deltas = Counter()
+        if old:
+            deltas[old] -= 1
+        if new:
+            deltas[new] += 1
+        _apply(deltas)
+
+
+def cards_moved(cards, old_status, new_status):
+    """Apply a bulk status change of the loaded ``cards`` from ``old_status`` to ``new_status``."""
+    deltas = Counter()
+    for card in cards:
+        state = card.listing_state()
+        old = _cell({**state, "status": old_status})
+        new = _cell({**state, "status": new_status})
+        if old != new:
+            if old:
+                deltas[old] -= 1
+            if new:
+                deltas[new] += 1
+    _apply(deltas)
+
+
+def card_deleted(card):
+    cell = _cell(card.listing_state())
+    if cell:
+        _apply({cell: -1})
+
+
+# ─── Recomputation ───
+
+
+def _bucket_expression():
+    return Case(
+        *[
+            When(value__lt=upper, then=Value(lower))
+            for lower, upper in zip(VALUE_BUCKETS, VALUE_BUCKETS[1:])
+        ],
+        default=Value(VALUE_BUCKETS[-1]),
+        output_field=IntegerField(),
+    )
+
+
+def compute_cells(brand_ids=None):
+    """``{cell: count}`` of active cards, for ``brand_ids`` (or every brand)."""
+    cards = GiftCard.objects.filter(status=GiftCard.Status.ACTIVE)
+    if brand_ids is not None:
+        cards = cards.filter(brand_id__in=brand_ids)
+    rows = (
+        cards.order_by()
+        .annotate(bucket=_bucket_expression())
+        .values("brand_id", "listing_type", "bucket")
+        .annotate(total=Count("id"))
+    )
+    return {(row["brand_id"], row["listing_type"], row["bucket"]): row["total"] for row in rows}
+
+
+def recompute_cells(cells):
+    """Overwrite (or create) the rows of ``cells`` from ``GiftCard``."""
+    cells = list(set(cells))
+    for start in range(0, len(cells), _CHUNK_SIZE):
+        chunk = cells[start:start + _CHUNK_SIZE]
+        counts = compute_cells({brand_id for brand_id, _, _ in chunk})
+        store({cell: counts.get(cell, 0) for cell in chunk})
+
+
+def recompute_cards(card_ids):
+    """Recompute the cells of ``card_ids`` after a bulk status change."""
+    card_ids = list(card_ids)
+    cells = set()
+    for start in range(0, len(card_ids), _CHUNK_SIZE):
+        cards = GiftCard.objects.filter(pk__in=card_ids[start:start + _CHUNK_SIZE])
+        for brand_id, listing_type, value in cards.values_list("brand_id", "listing_type", "value"):
+            cells.add((brand_id, listing_type, value_bucket(value)))
+    recompute_cells(cells)
+
+
+def store(counts):
+    """Upsert ``{cell: count}``."""
+    ListingFacet.objects.bulk_create(
+        [ListingFacet(**_cell_filter(cell), count=count) for cell, count in counts.items()],
+        batch_size=_CHUNK_SIZE,
+        update_conflicts=True,
+        unique_fields=["brand", "listing_type", "value_bucket"],
+        update_fields=["count"],
+    )
+
+
+# ─── Reads ───
+
+
+def _sum(rows, *fields, order=None):
+    return (
+        rows.values(*fields)
+        .annotate(count=Sum("count"))
+        .filter(count__gt=0)
+        .order_by(*(order or fields))
+    )
+
+
+def _exact(min_value, max_value):
+    """True if the value bounds fall on bucket edges (values have two decimal places)."""
+    if min_value is not None and min_value > 0 and min_value not in VALUE_BUCKETS:
+        return False
+    if max_value is not None:
+        _, upper = bucket_range(value_bucket(max_value))
+        return upper is not None and max_value >= upper - Decimal("0.01")
+    return True
+
+
+def facet_counts(
+    brand=None,
+    category=None,
+    listing_type=None,
+    min_value=None,
+    max_value=None,
+    brand_ids=None,
+    brand_limit=FACET_BRAND_LIMIT,
+):
+    """
+    Facet counts for a marketplace filter set (``MarketplaceFilter``
+    fields, plus ``brand_ids`` matched by a search).  Each facet applies
+    every filter except its own, so the sidebar can show the alternatives
+    to a selected option; the category facet also ignores the brand.
+    Only the ``brand_limit`` brands with the most cards are listed.
+
+    Value filters apply at bucket granularity: a bucket counts if it
+    overlaps ``[min_value, max_value]``.  ``exact`` is False when a bound
+    falls inside a bucket, so the counts include cards just outside the
+    range.
+    """
+    facets = ListingFacet.objects.filter(count__gt=0, brand__is_active=True)
+    if brand_ids is not None:
+        facets = facets.filter(brand_id__in=brand_ids)
+
+    by_brand = Q(brand_id=brand) if brand is not None else Q()
+    by_category = Q(brand__category=category) if category else Q()
+    by_type = Q(listing_type=listing_type) if listing_type else Q()
+    by_value = Q()
+    if min_value is not None:
+        by_value &= Q(value_bucket__gte=value_bucket(min_value))
+    if max_value is not None:
+        by_value &= Q(value_bucket__lte=max_value)
+
+    total = facets.filter(by_brand, by_category, by_type, by_value).aggregate(total=Sum("count"))
+    return {
+        "total": total["total"] or 0,
+        "brands": [
+            {"id": row["brand_id"], "name": row["brand__name"], "count": row["count"]}
+            for row in _sum(
+                facets.filter(by_category, by_type, by_value),
+                "brand_id",
+                "brand__name",
+                order=("-count", "brand__name"),
+            )[:brand_limit]
+        ],
+        "categories": [
+            {"category": row["brand__category"], "count": row["count"]}
+            for row in _sum(facets.filter(by_type, by_value), "brand__category")
+        ],
+        "listing_types": [
+            {"listing_type": row["listing_type"], "count": row["count"]}
+            for row in _sum(facets.filter(by_brand, by_category, by_value), "listing_type")
+        ],
+        "value_buckets": [
+            dict(zip(("min", "max"), bucket_range(row["value_bucket"])), count=row["count"])
+            for row in _sum(facets.filter(by_brand, by_category, by_type), "value_bucket")
+        ],
+        "exact": _exact(min_value, max_value),
+    }
@@ -1,11 +1,24 @@
 import logging
+from collections import defaultdict
 from datetime import timedelta
 from decimal import Decimal
 
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
-from core.models import Dispute, FraudFlag, GiftCard, Trade, User
+from core.ip_tracking import distinct_ip_count, distinct_ip_counts_over
+from core.models import (
+    Dispute,
+    FraudFlag,
+    FraudScanRun,
+    GiftCard,
+    LoginIPBucket,
+    Sale,
+    Trade,
+    User,
+)
+from core.user_stats import get_stats, get_stats_for
+from core.velocity import SlidingWindowCounter
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +30,14 @@ RAPID_TRADES_WINDOW_HOURS = 1
 REPEATED_DISPUTES_THRESHOLD = 2  # More than this many disputes in the window
 REPEATED_DISPUTES_WINDOW_DAYS = 7
 
+MULTI_IP_THRESHOLD = 5  # More than this many distinct login IPs in the window
+MULTI_IP_WINDOW_HOURS = 24
+
 ABNORMAL_VALUE_THRESHOLD = Decimal("500.00")
 ABNORMAL_VALUE_TRUST_TIER = 0  # Only applies to new users
 
+DAILY_VALUE_VELOCITY_THRESHOLD = Decimal("2000.00")  # Value traded or bought in 24 hours
+
 AUTO_RESTRICT_FLAG_THRESHOLD = 2  # 2+ unresolved flags triggers auto-restrict
 
 # Trust tier upgrade requirements
@@ -161,12 +179,22 @@ def check_repeated_disputes(user):
 
 def check_multi_ip(user):
     """
-    Placeholder for multi-IP detection.
-    Would need request logging / IP tracking to be implemented.
+    Check if user has logged in from more than MULTI_IP_THRESHOLD distinct
+    IP addresses in the last MULTI_IP_WINDOW_HOURS hours.
     """
-    # TODO: Implement once request IP logging is in place.
-    # This would check if a user has logged in from an unusual number
-    # of distinct IP addresses within a short time window.
+    if _has_existing_pending_flag(user, FraudFlag.FlagType.MULTI_IP):
+        return None
+
+    ip_count = distinct_ip_count(user, MULTI_IP_WINDOW_HOURS)
+
+    if ip_count > MULTI_IP_THRESHOLD:
+        details = (
+            f"User {user.username} has logged in from {ip_count} IP addresses in the last "
+            f"{MULTI_IP_WINDOW_HOURS} hours, exceeding the threshold of "
+            f"{MULTI_IP_THRESHOLD}."
+        )
+        return _create_flag(user, FraudFlag.FlagType.MULTI_IP, details)
+
     return None
 
 
@@ -234,9 +262,365 @@ def run_fraud_checks(user=None):
     return new_flags
 
 
+# ─── Bulk Evaluation ───
+#
+# ``run_fraud_checks(user=None)`` issues several queries per user.  The bulk
+# path below evaluates every active user with a fixed number of grouped
+# queries, diffs the results against unresolved flags in memory, and writes
+# new flags and auto-restrictions in bulk.  It applies the same rules, in the
+# same order, with the same flag details as the per-user checks.
+
+_UNRESOLVED_STATUSES = [FraudFlag.Status.PENDING, FraudFlag.Status.REVIEWED]
+
+# Keeps ``IN (...)`` lists under SQLite's bound-parameter limit.
+_BULK_CHUNK_SIZE = 500
+
+
+def _chunks(items, size=_BULK_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _scoped(queryset, field, user_ids):
+    """
+    Yield ``queryset`` filtered to ``user_ids`` on ``field`` in chunks, or
+    unfiltered when ``user_ids`` is None (all users).
+    """
+    if user_ids is None:
+        yield queryset
+        return
+    for chunk in _chunks(user_ids):
+        yield queryset.filter(**{f"{field}__in": chunk})
+
+
+def _bulk_rapid_trade_counts(now, user_ids=None):
+    """``{user_id: trade count}`` over the rapid-trade window, above the threshold."""
+    trades = Trade.objects.filter(
+        created_at__gte=now - timedelta(hours=RAPID_TRADES_WINDOW_HOURS),
+    ).exclude(
+        status__in=[Trade.Status.CANCELLED],
+    )
+    counts = defaultdict(int)
+    for qs in _scoped(trades, "initiator_id", user_ids):
+        for row in qs.values("initiator_id").annotate(total=models.Count("id")):
+            counts[row["initiator_id"]] += row["total"]
+    # A trade with the same user on both sides is only counted once.
+    responder_trades = trades.exclude(initiator_id=models.F("responder_id"))
+    for qs in _scoped(responder_trades, "responder_id", user_ids):
+        for row in qs.values("responder_id").annotate(total=models.Count("id")):
+            counts[row["responder_id"]] += row["total"]
+    return {user_id: n for user_id, n in counts.items() if n > RAPID_TRADES_THRESHOLD}
+
+
+def _bulk_dispute_counts(now, user_ids=None):
+    """``{user_id: dispute count}`` over the dispute window, above the threshold."""
+    disputes = Dispute.objects.filter(
+        created_at__gte=now - timedelta(days=REPEATED_DISPUTES_WINDOW_DAYS),
+    )
+    counts = {}
+    for qs in _scoped(disputes, "raised_by_id", user_ids):
+        rows = (
+            qs.values("raised_by_id")
+            .annotate(total=models.Count("id"))
+            .filter(total__gt=REPEATED_DISPUTES_THRESHOLD)
+        )
+        counts.update((row["raised_by_id"], row["total"]) for row in rows)
+    return counts
+
+
+def _bulk_multi_ip_counts(now, user_ids=None):
+    """``{user_id: distinct IP count}`` over the multi-IP window, above the threshold."""
+    counts = {}
+    for chunk in [None] if user_ids is None else _chunks(user_ids):
+        counts.update(
+            distinct_ip_counts_over(MULTI_IP_THRESHOLD, MULTI_IP_WINDOW_HOURS, now, chunk)
+        )
+    return counts
+
+
+def _bulk_abnormal_values(user_ids=None):
+    """``{user_id: max card value}`` for new users whose max exceeds the threshold."""
+    trades = Trade.objects.exclude(status=Trade.Status.CANCELLED)
+    max_values = {}
+    for side in ("initiator", "responder"):
+        side_trades = trades.filter(**{f"{side}__trust_tier": ABNORMAL_VALUE_TRUST_TIER})
+        for qs in _scoped(side_trades, f"{side}_id", user_ids):
+            rows = (
+                qs.values(f"{side}_id")
+                .annotate(max_val=models.Max(f"{side}_card__value"))
+                .filter(max_val__gt=ABNORMAL_VALUE_THRESHOLD)
+            )
+            for row in rows:
+                user_id = row[f"{side}_id"]
+                max_values[user_id] = max(max_values.get(user_id, row["max_val"]), row["max_val"])
+    return max_values
+
+
+def run_bulk_fraud_checks(user_ids=None):
+    """
+    Run all fraud checks in bulk for every active user, or only for the
+    active users among ``user_ids``.
+
+    Returns the list of newly created FraudFlag instances, like
+    ``run_fraud_checks(user=None)``.
+    """
+    now = timezone.now()
+    if user_ids is not None:
+        user_ids = sorted(set(user_ids))
+    rapid_trades = _bulk_rapid_trade_counts(now, user_ids)
+    disputes = _bulk_dispute_counts(now, user_ids)
+    multi_ips = _bulk_multi_ip_counts(now, user_ids)
+    abnormal_values = _bulk_abnormal_values(user_ids)
+
+    candidate_ids = set(rapid_trades) | set(disputes) | set(multi_ips) | set(abnormal_values)
+    users = []
+    unresolved = defaultdict(set)
+    unresolved_counts = defaultdict(int)
+    for chunk in _chunks(candidate_ids):
+        users.extend(
+            User.objects.filter(
+                pk__in=chunk, status=User.Status.ACTIVE, is_active=True
+            ).only("id", "username", "trust_tier", "status", "date_joined")
+        )
+        for user_id, flag_type in FraudFlag.objects.filter(
+            user_id__in=chunk, status__in=_UNRESOLVED_STATUSES
+        ).values_list("user_id", "flag_type"):
+            unresolved[user_id].add(flag_type)
+            unresolved_counts[user_id] += 1
+    # Same order as the per-user scan (User.Meta.ordering).
+    users.sort(key=lambda u: (u.date_joined, u.pk), reverse=True)
+
+    new_flags = []
+    restricted = []
+    for user in users:
+        found = []
+        if (
+            user.pk in rapid_trades
+            and FraudFlag.FlagType.RAPID_TRADES not in unresolved[user.pk]
+        ):
+            found.append((
+                FraudFlag.FlagType.RAPID_TRADES,
+                f"User {user.username} has {rapid_trades[user.pk]} trades in the last "
+                f"{RAPID_TRADES_WINDOW_HOURS} hour(s), exceeding the threshold of "
+                f"{RAPID_TRADES_THRESHOLD}.",
+            ))
+        if (
+            user.pk in disputes
+            and FraudFlag.FlagType.REPEATED_DISPUTES not in unresolved[user.pk]
+        ):
+            found.append((
+                FraudFlag.FlagType.REPEATED_DISPUTES,
+                f"User {user.username} has filed {disputes[user.pk]} disputes in the last "
+                f"{REPEATED_DISPUTES_WINDOW_DAYS} days, exceeding the threshold of "
+                f"{REPEATED_DISPUTES_THRESHOLD}.",
+            ))
+        if (
+            user.pk in multi_ips
+            and FraudFlag.FlagType.MULTI_IP not in unresolved[user.pk]
+        ):
+            found.append((
+                FraudFlag.FlagType.MULTI_IP,
+                f"User {user.username} has logged in from {multi_ips[user.pk]} IP addresses "
+                f"in the last {MULTI_IP_WINDOW_HOURS} hours, exceeding the threshold of "
+                f"{MULTI_IP_THRESHOLD}.",
+            ))
+        if (
+            user.trust_tier == ABNORMAL_VALUE_TRUST_TIER
+            and user.pk in abnormal_values
+            and FraudFlag.FlagType.ABNORMAL_VALUE not in unresolved[user.pk]
+        ):
+            found.append((
+                FraudFlag.FlagType.ABNORMAL_VALUE,
+                f"New user {user.username} (trust_tier={user.trust_tier}) has a trade "
+                f"involving a card valued at ${abnormal_values[user.pk]}, exceeding the "
+                f"threshold of ${ABNORMAL_VALUE_THRESHOLD} for new users.",
+            ))
+
+        for flag_type, details in found:
+            flag = FraudFlag(user=user, flag_type=flag_type, details=details)
+            logger.info(
+                "Fraud flag created: %s for user %s (id=%d)", flag_type, user.username, user.pk
+            )
+            unresolved_counts[user.pk] += 1
+            if unresolved_counts[user.pk] >= AUTO_RESTRICT_FLAG_THRESHOLD:
+                if user.status != User.Status.RESTRICTED:
+                    user.status = User.Status.RESTRICTED
+                    restricted.append(user.pk)
+                    logger.warning(
+                        "User %s (id=%d) auto-restricted due to %d unresolved fraud flags",
+                        user.username,
+                        user.pk,
+                        unresolved_counts[user.pk],
+                    )
+                flag.auto_restricted = True
+            new_flags.append(flag)
+
+    with transaction.atomic():
+        FraudFlag.objects.bulk_create(new_flags, batch_size=_BULK_CHUNK_SIZE)
+        for chunk in _chunks(restricted):
+            User.objects.filter(pk__in=chunk).update(status=User.Status.RESTRICTED)
+
+    return new_flags
+
+
+# ─── Incremental Scans ───
+#
+# Fraud signals only change when a user creates activity: the windowed
+# counts can only shrink as time passes, and the value check only looks at
+# the user's own trades.  So a run only needs to re-check users with
+# trades, disputes, sales or new login IPs since the previous run's
+# watermark.  A full
+# sweep still catches anything that changed another way (e.g. a dismissed
+# flag or a trust-tier downgrade).
+
+# Re-scan a little before the watermark so rows committed late by a
+# transaction that started before the previous run are not missed.
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+
+def _users_active_since(since):
+    """Ids of users with trades, disputes, sales or new login IPs since ``since``."""
+    user_ids = set()
+    trades = Trade.objects.filter(created_at__gte=since)
+    user_ids.update(trades.values_list("initiator_id", flat=True))
+    user_ids.update(trades.values_list("responder_id", flat=True))
+    user_ids.update(
+        Dispute.objects.filter(created_at__gte=since).values_list("raised_by_id", flat=True)
+    )
+    sales = Sale.objects.filter(created_at__gte=since)
+    user_ids.update(sales.values_list("buyer_id", flat=True))
+    user_ids.update(sales.values_list("seller_id", flat=True))
+    user_ids.update(
+        LoginIPBucket.objects.filter(updated_at__gte=since).values_list("user_id", flat=True)
+    )
+    return user_ids
+
+
+def run_incremental_fraud_checks(full=False):
+    """
+    Scan users active since the last finished run (or everyone when
+    ``full`` is set or no run has finished yet) and record the run.
+
+    Returns ``(run, new_flags)``.
+    """
+    previous = FraudScanRun.objects.filter(finished_at__isnull=False).first()
+    run = FraudScanRun.objects.create(
+        is_full=full or previous is None,
+        watermark=timezone.now(),
+    )
+
+    if run.is_full:
+        run.users_scanned = User.objects.filter(
+            status=User.Status.ACTIVE, is_active=True
+        ).count()
+        new_flags = run_bulk_fraud_checks()
+    else:
+        user_ids = _users_active_since(previous.watermark - WATERMARK_OVERLAP)
+        run.users_scanned = len(user_ids)
+        new_flags = run_bulk_fraud_checks(user_ids) if user_ids else []
+
+    run.flags_created = len(new_flags)
+    run.finished_at = timezone.now()
+    run.save(update_fields=["users_scanned", "flags_created", "finished_at"])
+    return run, new_flags
+
+
+# ─── Real-time Velocity ───
+#
+# Trade and sale creation update per-user sliding-window counters so rapid
+# activity is flagged on the request that crosses a threshold, not on the
+# next scan.  Both parties count towards the hourly rates (as in
+# ``check_rapid_trades``); the daily value is charged to the user who
+# created the trade or sale, like ``daily_trade_value``; crossing the daily
+# threshold raises its own VALUE_VELOCITY flag, so a pending per-card
+# ABNORMAL_VALUE flag never hides it (or the other way round).  The counters
+# are approximate, so the batch scan stays the source of truth.
+
+TRADE_VELOCITY = SlidingWindowCounter("trades", RAPID_TRADES_WINDOW_HOURS * 3600)
+SALE_VELOCITY = SlidingWindowCounter("sales", RAPID_TRADES_WINDOW_HOURS * 3600)
+VALUE_VELOCITY = SlidingWindowCounter("value_cents", 24 * 3600)
+
+
+def _to_cents(amount):
+    return int(amount * 100)
+
+
+def _velocity_flag(user, flag_type, details):
+    if user.status != User.Status.ACTIVE:
+        return None
+    if _has_existing_pending_flag(user, flag_type):
+        return None
+    return _create_flag(user, flag_type, details)
+
+
+def _record_hourly(counter, user, noun):
+    before, after = counter.add(user.pk)
+    if before <= RAPID_TRADES_THRESHOLD < after:
+        details = (
+            f"User {user.username} has about {after:.0f} {noun} in the last "
+            f"{RAPID_TRADES_WINDOW_HOURS} hour(s), exceeding the threshold of "
+            f"{RAPID_TRADES_THRESHOLD}."
+        )
+        return _velocity_flag(user, FraudFlag.FlagType.RAPID_TRADES, details)
+    return None
+
+
+def _record_daily_value(user, amount):
+    before, after = VALUE_VELOCITY.add(user.pk, _to_cents(amount))
+    threshold = _to_cents(DAILY_VALUE_VELOCITY_THRESHOLD)
+    if before <= threshold < after:
+        details = (
+            f"User {user.username} has traded about ${after / 100:.2f} in the last "
+            f"24 hours, exceeding the threshold of ${DAILY_VALUE_VELOCITY_THRESHOLD}."
+        )
+        return _velocity_flag(user, FraudFlag.FlagType.VALUE_VELOCITY, details)
+    return None
+
+
+def record_trade_velocity(trade):
+    """Count a newly created trade; returns any flags raised."""
+    flags = [
+        _record_hourly(TRADE_VELOCITY, trade.initiator, "trades"),
+        _record_hourly(TRADE_VELOCITY, trade.responder, "trades"),
+        _record_daily_value(trade.initiator, trade.initiator_card.value),
+    ]
+    return [flag for flag in flags if flag is not None]
+
+
+def record_sale_velocity(sale):
+    """Count a newly created sale; returns any flags raised."""
+    flags = [
+        _record_hourly(SALE_VELOCITY, sale.buyer, "purchases"),
+        _record_hourly(SALE_VELOCITY, sale.seller, "sales"),
+        _record_daily_value(sale.buyer, sale.amount),
+    ]
+    return [flag for flag in flags if flag is not None]
+
+
 # ─── Trust Tier Upgrades ───
 
 
+def _next_trust_tier(tier, successful_trades):
+    """The tier a user with ``successful_trades`` moves up to, or None."""
+    if tier == User.TrustTier.NEW and successful_trades >= TIER_1_SUCCESSFUL_TRADES:
+        return User.TrustTier.ESTABLISHED
+    if tier == User.TrustTier.ESTABLISHED and successful_trades >= TIER_2_SUCCESSFUL_TRADES:
+        return User.TrustTier.TRUSTED
+    return None
+
+
+def _log_upgrade(username, user_id, tier, successful_trades):
+    logger.info(
+        "User %s (id=%d) upgraded to trust tier %d (%s) with %d successful trades",
+        username,
+        user_id,
+        tier,
+        User.TrustTier(tier).label,
+        successful_trades,
+    )
+
+
 def check_and_upgrade_trust_tier(user):
     """
     Evaluate whether a user qualifies for a trust tier upgrade based on
@@ -248,10 +632,7 @@ def check_and_upgrade_trust_tier(user):
 
     Returns True if the user's tier was upgraded, False otherwise.
     """
-    successful_trades = Trade.objects.filter(
-        models.Q(initiator=user) | models.Q(responder=user),
-        status=Trade.Status.COMPLETED,
-    ).count()
+    successful_trades = get_stats(user).successful_trades
 
     confirmed_fraud = FraudFlag.objects.filter(
         user=user,
@@ -261,29 +642,41 @@ def check_and_upgrade_trust_tier(user):
     if confirmed_fraud > 0:
         return False
 
-    upgraded = False
+    new_tier = _next_trust_tier(user.trust_tier, successful_trades)
+    if new_tier is None:
+        return False
 
-    if user.trust_tier == User.TrustTier.NEW and successful_trades >= TIER_1_SUCCESSFUL_TRADES:
-        user.trust_tier = User.TrustTier.ESTABLISHED
-        upgraded = True
-        logger.info(
-            "User %s (id=%d) upgraded to trust tier 1 (Established) with %d successful trades",
-            user.username,
-            user.pk,
-            successful_trades,
-        )
+    user.trust_tier = new_tier
+    user.save(update_fields=["trust_tier"])
+    _log_upgrade(user.username, user.pk, new_tier, successful_trades)
+    return True
 
-    elif user.trust_tier == User.TrustTier.ESTABLISHED and successful_trades >= TIER_2_SUCCESSFUL_TRADES:
-        user.trust_tier = User.TrustTier.TRUSTED
-        upgraded = True
-        logger.info(
-            "User %s (id=%d) upgraded to trust tier 2 (Trusted) with %d successful trades",
-            user.username,
-            user.pk,
-            successful_trades,
-        )
 
-    if upgraded:
-        user.save(update_fields=["trust_tier"])
+def upgrade_trust_tiers(user_ids):
+    """
+    ``check_and_upgrade_trust_tier`` for many users at once: a few queries
+    per 500 users plus one update per tier reached.
 
+    Returns ``{user_id: new tier}`` for the users upgraded.
+    """
+    user_ids = list(user_ids)
+    upgraded = {}
+    for start in range(0, len(user_ids), 500):
+        chunk = user_ids[start:start + 500]
+        candidates = list(
+            User.objects.filter(pk__in=chunk, trust_tier__lt=User.TrustTier.TRUSTED)
+            .exclude(fraud_flags__status=FraudFlag.Status.CONFIRMED)
+            .values_list("pk", "username", "trust_tier")
+        )
+        stats = get_stats_for(pk for pk, _, _ in candidates)
+        by_tier = defaultdict(list)
+        for pk, username, tier in candidates:
+            successful_trades = stats[pk].successful_trades
+            new_tier = _next_trust_tier(tier, successful_trades)
+            if new_tier is not None:
+                by_tier[new_tier].append(pk)
+                upgraded[pk] = new_tier
+                _log_upgrade(username, pk, new_tier, successful_trades)
+        for new_tier, pks in by_tier.items():
+            User.objects.filter(pk__in=pks).update(trust_tier=new_tier)
     return upgraded
@@ -0,0 +1,191 @@
+"""
+Login IP tracking.
+
+Every login and token refresh records the client IP in the user's
+``LoginIPBucket`` for the current ``BUCKET_HOURS``-long bucket.  A bucket
+keeps the exact set of addresses until it holds more than
+``EXACT_IP_LIMIT`` of them, then switches to a fixed-size HyperLogLog
+sketch, so a bucket never grows past ~1 KB however many addresses a user
+cycles through.
+
+Distinct-IP counts over a window merge that window's buckets (a fixed
+number of rows per user) and never look at individual logins.  Buckets
+older than ``RETENTION`` are deleted whenever a user starts a new bucket.
+"""
+
+import hashlib
+import math
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.models import LoginIPBucket
+
+BUCKET_HOURS = 1
+RETENTION = timedelta(days=7)
+EXACT_IP_LIMIT = 32
+
+# 2**10 one-byte registers: ~3% standard error.
+_HLL_PRECISION = 10
+_HLL_REGISTERS = 1 << _HLL_PRECISION
+_HLL_HASH_BITS = 64 - _HLL_PRECISION
+
+# Keeps ``IN (...)`` lists under SQLite's bound-parameter limit.
+_IN_CHUNK_SIZE = 500
+
+
+class HyperLogLog:
+    """A HyperLogLog distinct-count sketch over strings."""
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers else bytearray(_HLL_REGISTERS)
+
+    def add(self, item):
+        digest = hashlib.sha1(item.encode()).digest()
+        value = int.from_bytes(digest[:8], "big")
+        index = value >> _HLL_HASH_BITS
+        rank = _HLL_HASH_BITS - (value & ((1 << _HLL_HASH_BITS) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        m = _HLL_REGISTERS
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities.
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+
+def get_client_ip(request):
+    """The client address, preferring the first ``X-Forwarded-For`` hop."""
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")[0].strip()
+    return forwarded or request.META.get("REMOTE_ADDR")
+
+
+def _bucket_start(when):
+    return when.replace(
+        hour=when.hour - when.hour % BUCKET_HOURS, minute=0, second=0, microsecond=0
+    )
+
+
+def record_login_ip(user, ip, when=None):
+    """Add ``ip`` to ``user``'s bucket for ``when`` (default: now)."""
+    if not ip:
+        return
+    when = when or timezone.now()
+    bucket_start = _bucket_start(when)
+
+    with transaction.atomic():
+        bucket, created = LoginIPBucket.objects.select_for_update().get_or_create(
+            user=user,
+            bucket_start=bucket_start,
+            defaults={"ips": [ip], "ip_count": 1, "updated_at": when},
+        )
+        if created:
+            LoginIPBucket.objects.filter(
+                user=user, bucket_start__lt=bucket_start - RETENTION
+            ).delete()
+            return
+
+        if bucket.sketch is not None:
+            sketch = HyperLogLog(bucket.sketch)
+            sketch.add(ip)
+            ip_count = sketch.count()
+            if ip_count == bucket.ip_count:
+                return
+            bucket.sketch = sketch.to_bytes()
+        elif ip in bucket.ips:
+            return
+        elif len(bucket.ips) < EXACT_IP_LIMIT:
+            bucket.ips.append(ip)
+            ip_count = len(bucket.ips)
+        else:
+            sketch = HyperLogLog()
+            sketch.update(bucket.ips)
+            sketch.add(ip)
+            bucket.sketch = sketch.to_bytes()
+            bucket.ips = []
+            ip_count = sketch.count()
+
+        bucket.ip_count = ip_count
+        bucket.updated_at = when
+        bucket.save(update_fields=["ips", "sketch", "ip_count", "updated_at"])
+
+
+def _window_buckets(hours, now):
+    """Buckets overlapping the last ``hours`` hours."""
+    cutoff = now - timedelta(hours=hours)
+    return LoginIPBucket.objects.filter(bucket_start__gt=cutoff - timedelta(hours=BUCKET_HOURS))
+
+
+def _merge(rows):
+    """Distinct count over ``(ips, sketch)`` rows: exact unless any row is sketched."""
+    exact = set()
+    sketch = None
+    for ips, registers in rows:
+        if registers is None:
+            exact.update(ips)
+        else:
+            if sketch is None:
+                sketch = HyperLogLog()
+            sketch.merge(HyperLogLog(registers))
+    if sketch is None:
+        return len(exact)
+    sketch.update(exact)
+    return sketch.count()
+
+
+def distinct_ip_count(user, hours, now=None):
+    """Distinct IPs ``user`` logged in from in the last ``hours`` hours."""
+    buckets = _window_buckets(hours, now or timezone.now()).filter(user=user)
+    return _merge(buckets.values_list("ips", "sketch"))
+
+
+def distinct_ip_counts_over(threshold, hours, now=None, user_ids=None):
+    """
+    ``{user_id: count}`` for users with more than ``threshold`` distinct
+    IPs in the last ``hours`` hours, optionally limited to ``user_ids``.
+
+    A user's distinct count can't exceed the sum of their bucket counts,
+    so only users whose sum does are merged.
+    """
+    buckets = _window_buckets(hours, now or timezone.now())
+    if user_ids is not None:
+        buckets = buckets.filter(user_id__in=user_ids)
+    candidates = list(
+        buckets.order_by()
+        .values("user_id")
+        .annotate(total=Sum("ip_count"))
+        .filter(total__gt=threshold)
+        .values_list("user_id", flat=True)
+    )
+
+    rows = {}
+    for start in range(0, len(candidates), _IN_CHUNK_SIZE):
+        chunk = candidates[start:start + _IN_CHUNK_SIZE]
+        for user_id, ips, registers in buckets.filter(user_id__in=chunk).values_list(
+            "user_id", "ips", "sketch"
+        ):
+            rows.setdefault(user_id, []).append((ips, registers))
+
+    counts = {}
+    for user_id, user_rows in rows.items():
+        count = _merge(user_rows)
+        if count > threshold:
+            counts[user_id] = count
+    return counts
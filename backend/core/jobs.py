@@ -0,0 +1,260 @@
+"""
+Database-backed background jobs.
+
+Requests hand slow work to ``enqueue()``, which stores a ``Job`` row (in
+the caller's transaction, so a job for a rolled-back change is never
+run) and returns straight away.  ``run_workers`` runs worker processes
+that claim due jobs and call them:
+
+- Claiming uses ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database
+  supports it, so workers never wait on each other's rows.  Elsewhere
+  (SQLite) a conditional ``UPDATE ... WHERE status = 'queued'`` claims the
+  rows; SQLite serializes writers, so no row is claimed twice.
+- A job that raises is re-queued with exponential backoff (plus jitter)
+  until it has used ``max_attempts``, then marked failed.
+- While a job runs, a heartbeat thread refreshes its claim every
+  ``JOB_HEARTBEAT_SECONDS``; jobs whose claim has not been refreshed for
+  ``JOB_STALE_SECONDS`` (their worker died) are re-queued.  A long
+  periodic command is never re-queued while it is still running.
+- ``PERIODIC_COMMANDS`` replaces cron: each command is enqueued once per
+  interval, keyed by its time slot so several supervisors never enqueue
+  the same run twice.
+"""
+
+import logging
+import random
+import socket
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import (
+    IntegrityError,
+    close_old_connections,
+    connection,
+    connections,
+    transaction,
+)
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.models import Job
+
+logger = logging.getLogger("core")
+
+JOB_BACKOFF_SECONDS = getattr(settings, "JOB_BACKOFF_SECONDS", 30)
+JOB_MAX_BACKOFF_SECONDS = getattr(settings, "JOB_MAX_BACKOFF_SECONDS", 3600)
+JOB_STALE_SECONDS = getattr(settings, "JOB_STALE_SECONDS", 900)
+JOB_HEARTBEAT_SECONDS = getattr(settings, "JOB_HEARTBEAT_SECONDS", 60)
+JOB_RETENTION_DAYS = getattr(settings, "JOB_RETENTION_DAYS", 7)
+
+# Management command -> interval in seconds.
+PERIODIC_COMMANDS = getattr(
+    settings,
+    "PERIODIC_COMMANDS",
+    {
+        "auto_finalize_trades": 60,
+        "check_fraud_flags": 15 * 60,
+        "check_expiry": 24 * 60 * 60,
+        "reconcile_listing_facets": 60 * 60,
+    },
+)
+
+
+def enqueue(task, kwargs=None, delay=0, key=None, max_attempts=5):
+    """
+    Queue ``task`` (a dotted path) to be called with ``kwargs``, which must
+    be JSON-serializable.  Returns the job, or None if ``key`` is already taken.
+    """
+    job = Job(
+        task=task,
+        kwargs=kwargs or {},
+        key=key,
+        max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    if key is None:
+        job.save()
+        return job
+    # Only a keyed insert can collide; keep a duplicate from breaking the
+    # caller's transaction.
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return None
+    return job
+
+
+def run_command(command, **options):
+    """Job task that runs a management command (used for periodic jobs)."""
+    call_command(command, **options)
+
+
+def schedule_periodic(now=None):
+    """Enqueue each periodic command whose current time slot has no job yet."""
+    now = now or timezone.now()
+    jobs = []
+    for command, interval in PERIODIC_COMMANDS.items():
+        slot = int(now.timestamp() // interval)
+        jobs.append(
+            Job(
+                task="core.jobs.run_command",
+                kwargs={"command": command},
+                key=f"periodic:{command}:{slot}",
+                max_attempts=1,
+                run_after=now,
+            )
+        )
+    Job.objects.bulk_create(jobs, ignore_conflicts=True)
+
+
+# ─── Claiming ───
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{uuid.uuid4().hex[:8]}"
+
+
+def claim(worker, limit=1, now=None):
+    """Claim up to ``limit`` due jobs for ``worker``; returns them."""
+    now = now or timezone.now()
+    due = Job.objects.filter(status=Job.Status.QUEUED, run_after__lte=now).order_by(
+        "run_after", "pk"
+    )
+    claimed = {
+        "status": Job.Status.RUNNING,
+        "locked_by": worker,
+        "locked_at": now,
+        "attempts": F("attempts") + 1,
+    }
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            pks = list(due.select_for_update(skip_locked=True).values_list("pk", flat=True)[:limit])
+            Job.objects.filter(pk__in=pks).update(**claimed)
+        else:
+            pks = list(due.values_list("pk", flat=True)[:limit])
+            Job.objects.filter(pk__in=pks, status=Job.Status.QUEUED).update(**claimed)
+        return list(
+            Job.objects.filter(pk__in=pks, status=Job.Status.RUNNING, locked_by=worker)
+        )
+
+
+def _backoff(attempts):
+    delay = min(JOB_BACKOFF_SECONDS * 2 ** (attempts - 1), JOB_MAX_BACKOFF_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+class _Heartbeat(threading.Thread):
+    """Refreshes a running job's ``locked_at`` so ``requeue_stale()`` leaves it alone."""
+
+    def __init__(self, job):
+        super().__init__(name=f"job-{job.pk}-heartbeat", daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def beat(self):
+        return Job.objects.filter(pk=self.job.pk, locked_by=self.job.locked_by).update(
+            locked_at=timezone.now()
+        )
+
+    def run(self):
+        try:
+            while not self.stopped.wait(JOB_HEARTBEAT_SECONDS):
+                try:
+                    self.beat()
+                except Exception as exc:
+                    logger.warning("Heartbeat for job %s failed: %s", self.job.pk, exc)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run(job):
+    """Call a claimed job and record the outcome; returns True on success."""
+    heartbeat = _Heartbeat(job)
+    heartbeat.start()
+    try:
+        import_string(job.task)(**job.kwargs)
+    except Exception as exc:
+        now = timezone.now()
+        error = "".join(traceback.format_exception(exc))[-4000:]
+        if job.attempts >= job.max_attempts:
+            logger.error("Job %s (%s) failed for good: %s", job.pk, job.task, exc)
+            changes = {"status": Job.Status.FAILED, "finished_at": now}
+        else:
+            logger.warning("Job %s (%s) failed, attempt %d: %s", job.pk, job.task, job.attempts, exc)
+            changes = {"status": Job.Status.QUEUED, "run_after": now + _backoff(job.attempts)}
+        Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+            locked_by="", last_error=error, **changes
+        )
+        return False
+    finally:
+        heartbeat.stop()
+
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        status=Job.Status.DONE, locked_by="", finished_at=timezone.now()
+    )
+    return True
+
+
+def run_pending(worker=None, limit=None):
+    """Run due jobs in this process until none are left; returns how many ran."""
+    worker = worker or worker_name()
+    ran = 0
+    while limit is None or ran < limit:
+        jobs = claim(worker)
+        if not jobs:
+            break
+        for job in jobs:
+            run(job)
+            ran += 1
+    return ran
+
+
+def work(stop, poll_interval=1.0):
+    """Worker process loop: run due jobs until ``stop`` (an ``Event``) is set."""
+    worker = worker_name()
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                ran = run_pending(worker, limit=100)
+            except Exception:
+                logger.exception("Job worker %s failed to claim jobs", worker)
+                ran = 0
+            if not ran:
+                stop.wait(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connections.close_all()
+
+
+# ─── Housekeeping ───
+
+
+def requeue_stale(now=None):
+    """Re-queue jobs whose worker stopped before finishing them (no heartbeat)."""
+    now = now or timezone.now()
+    return Job.objects.filter(
+        status=Job.Status.RUNNING,
+        locked_at__lt=now - timedelta(seconds=JOB_STALE_SECONDS),
+    ).update(status=Job.Status.QUEUED, locked_by="", run_after=now)
+
+
+def prune(now=None):
+    """Delete finished jobs older than ``JOB_RETENTION_DAYS``."""
+    now = now or timezone.now()
+    deleted, _ = Job.objects.filter(
+        status__in=[Job.Status.DONE, Job.Status.FAILED],
+        finished_at__lt=now - timedelta(days=JOB_RETENTION_DAYS),
+    ).delete()
+    return deleted
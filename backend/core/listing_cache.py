@@ -0,0 +1,73 @@
+"""
+Cache of the public listing responses (marketplace and brands).
+
+Entries are keyed by the view, the normalized query string and the
+shared "listings version" (see ``core.versions``).  Anything that changes
+what those pages show bumps the version (``core.signals`` for saved gift
+cards and brands, and the callers of bulk ``QuerySet.update()``s), once
+the change has committed.  Entries under an old version are never read
+again and age out of the cache.  The process that made a change stops
+serving the old entries at once; other processes within
+``VERSION_CHECK_SECONDS``, so a card that was traded, sold, repriced or
+withdrawn can stay listed elsewhere for up to that long.
+"""
+
+import hashlib
+import logging
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from core.versions import SharedVersion
+
+logger = logging.getLogger("core")
+
+LISTING_CACHE_SECONDS = getattr(settings, "LISTING_CACHE_SECONDS", 300)
+VERSION_CHECK_SECONDS = 1.0
+
+_shared_version = SharedVersion("listings", VERSION_CHECK_SECONDS)
+
+
+def version():
+    """The current listings version."""
+    return _shared_version.get()
+
+
+def bump():
+    """Retire every cached listing response."""
+    _shared_version.bump()
+
+
+def key(name, current_version, request):
+    """
+    Cache key for ``request`` to the ``name`` view.  Query parameters are
+    sorted and empty ones dropped, so equivalent URLs share an entry.  The
+    date is part of the key because expired cards drop out at midnight
+    without any write.
+    """
+    params = sorted(
+        (param, value)
+        for param, values in request.query_params.lists()
+        for value in values
+        if value != ""
+    )
+    raw = f"{request.scheme}://{request.get_host()}?{urlencode(params)}"
+    digest = hashlib.sha1(raw.encode()).hexdigest()
+    return f"listings:{name}:{current_version}:{timezone.now().date()}:{digest}"
+
+
+def lookup(entry_key):
+    try:
+        return cache.get(entry_key)
+    except Exception as exc:
+        logger.warning("Listing cache read failed: %s", exc)
+        return None
+
+
+def store(entry_key, entry):
+    try:
+        cache.set(entry_key, entry, timeout=LISTING_CACHE_SECONDS)
+    except Exception as exc:
+        logger.warning("Listing cache write failed: %s", exc)
@@ -1,21 +1,32 @@
 """
 Management command: auto_finalize_trades
 
-Scans all trades in ``confirming`` status whose escrow confirmation_deadline
-has passed.  If no dispute has been filed, the trade is automatically
-finalized: status set to ``completed``, escrow set to ``finalized``,
-both parties marked as confirmed, and the gift cards marked as ``swapped``.
+Finds all trades in ``confirming`` status whose escrow confirmation_deadline
+has passed and that have no open dispute, and finalizes them as if both
+parties had confirmed: status set to ``completed``, escrow set to
+``finalized``, both parties marked as confirmed, and the gift cards swapped.
+Trades are finalized in chunks, each with a handful of bulk updates in one
+transaction (see ``core.trade_state.finalize_expired``).
+
+With ``--loop`` the command keeps running and sleeps until the next
+confirmation deadline instead of being polled from cron.  A window opened
+while it sleeps can't close before ``confirmation_window_minutes`` from
+now, so it never sleeps longer than that (or ``--max-sleep``).
 
 Usage:
     python manage.py auto_finalize_trades
     python manage.py auto_finalize_trades --dry-run
+    python manage.py auto_finalize_trades --loop
 """
 
+import time
+
 from django.core.management.base import BaseCommand
+from django.db import close_old_connections
 from django.utils import timezone
 
-from core.fraud_detection import check_and_upgrade_trust_tier
-from core.models import Dispute, EscrowSession, GiftCard, Trade
+from core import trade_state
+from core.models import PlatformSettings, Trade, User
 
 
 class Command(BaseCommand):
@@ -30,91 +41,92 @@ class Command(BaseCommand):
             action="store_true",
             help="Show what would happen without making changes.",
         )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=200,
+            help="Trades finalized per transaction (default: 200).",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running, waking up at each confirmation deadline.",
+        )
+        parser.add_argument(
+            "--max-sleep",
+            type=float,
+            default=300,
+            help="Longest sleep between passes in --loop mode, in seconds (default: 300).",
+        )
 
     def handle(self, *args, **options):
+        if not options["loop"]:
+            self.run_once(options)
+            return
+
+        self.stdout.write("Auto-finalizing in a loop; press Ctrl+C to stop.")
+        try:
+            while True:
+                # Drop connections the database closed while we slept.
+                close_old_connections()
+                self.run_once(options)
+                if options["dry_run"]:
+                    return
+                time.sleep(self.seconds_until_next_pass(options["max_sleep"]))
+        except KeyboardInterrupt:
+            self.stdout.write("\nStopped.")
+
+    def seconds_until_next_pass(self, max_sleep):
+        now = timezone.now()
+        window_minutes = PlatformSettings.get_int("confirmation_window_minutes", 60)
+        sleep = min(max_sleep, window_minutes * 60)
+        deadline = trade_state.next_confirmation_deadline(now)
+        if deadline is not None:
+            # Wake just after the deadline; the scan compares strictly.
+            sleep = min(sleep, (deadline - now).total_seconds() + 0.1)
+        return max(sleep, 0.1)
+
+    def run_once(self, options):
         now = timezone.now()
         dry_run = options["dry_run"]
-
-        # Find all trades in "confirming" status with an expired
-        # confirmation deadline on the escrow.
-        eligible_trades = Trade.objects.filter(
-            status=Trade.Status.CONFIRMING,
-            escrow__confirmation_deadline__lt=now,
-        ).select_related(
-            "escrow",
-            "initiator",
-            "responder",
-            "initiator_card",
-            "responder_card",
+        verbose = options["verbosity"] >= 1
+
+        eligible = trade_state.expired_confirmations(now)
+        trade_ids = list(eligible.order_by("pk").values_list("pk", flat=True))
+        skipped = list(
+            Trade.objects.filter(
+                status=Trade.Status.CONFIRMING,
+                escrow__confirmation_deadline__lt=now,
+            )
+            .exclude(pk__in=trade_ids)
+            .order_by("pk")
+            .values_list("trade_id", flat=True)
         )
+        if verbose:
+            for trade_id in skipped:
+                self.stdout.write(f"  SKIP  {trade_id} -- dispute filed, skipping.")
 
         finalized_count = 0
-        skipped_count = 0
-
-        for trade in eligible_trades:
-            # Check if a dispute has been filed for this trade.
-            has_dispute = Dispute.objects.filter(trade=trade).exclude(
-                status=Dispute.Status.DISMISSED,
-            ).exists()
-
-            if has_dispute:
+        if dry_run:
+            for trade in eligible.select_related("initiator", "responder").order_by("pk"):
                 self.stdout.write(
-                    f"  SKIP  {trade.trade_id} -- dispute filed, skipping."
+                    f"  AUTO  {trade.trade_id} "
+                    f"({trade.initiator.username} <-> {trade.responder.username})"
                 )
-                skipped_count += 1
-                continue
-
-            self.stdout.write(
-                f"  AUTO  {trade.trade_id} "
-                f"({trade.initiator.username} <-> {trade.responder.username})"
-            )
-
-            if dry_run:
-                finalized_count += 1
-                continue
-
-            # ── Finalize the trade ──
-            trade.status = Trade.Status.COMPLETED
-            trade.initiator_confirmed = True
-            trade.responder_confirmed = True
-            trade.save(
-                update_fields=[
-                    "status",
-                    "initiator_confirmed",
-                    "responder_confirmed",
-                    "updated_at",
-                ]
-            )
-
-            # ── Finalize the escrow ──
-            escrow = trade.escrow
-            escrow.status = EscrowSession.Status.FINALIZED
-            escrow.finalized_at = now
-            escrow.save(update_fields=["status", "finalized_at"])
-
-            # ── Swap card ownership / mark as swapped ──
-            initiator_card = trade.initiator_card
-            responder_card = trade.responder_card
-
-            initiator_card.owner = trade.responder
-            initiator_card.status = GiftCard.Status.SWAPPED
-            initiator_card.save(update_fields=["owner", "status", "updated_at"])
-
-            responder_card.owner = trade.initiator
-            responder_card.status = GiftCard.Status.SWAPPED
-            responder_card.save(update_fields=["owner", "status", "updated_at"])
-
-            # Check trust tier upgrades for both participants
-            check_and_upgrade_trust_tier(trade.initiator)
-            check_and_upgrade_trust_tier(trade.responder)
-
-            finalized_count += 1
+            finalized_count = len(trade_ids)
+        else:
+            chunk_size = options["chunk_size"]
+            for start in range(0, len(trade_ids), chunk_size):
+                rows = trade_state.finalize_expired(trade_ids[start:start + chunk_size], now)
+                finalized_count += len(rows)
+                if verbose:
+                    self.write_finalized(rows)
 
         # ── Summary ──
         self.stdout.write(f"\n{'=' * 50}")
         self.stdout.write(f"Auto-Finalize Trades Summary ({now:%Y-%m-%d %H:%M})")
         self.stdout.write(f"  Finalized:  {finalized_count}")
-        self.stdout.write(f"  Skipped:    {skipped_count}")
+        self.stdout.write(f"  Skipped:    {len(skipped)} (open dispute)")
         if dry_run:
             self.stdout.write(self.style.WARNING("  [DRY RUN] No changes made."))
         else:
@@ -124,3 +136,12 @@ class Command(BaseCommand):
                 )
             )
         self.stdout.write(f"{'=' * 50}")
+
+    def write_finalized(self, rows):
+        user_ids = {user_id for row in rows for user_id in row[2:]}
+        usernames = dict(User.objects.filter(pk__in=user_ids).values_list("pk", "username"))
+        for _, trade_id, initiator_id, responder_id in rows:
+            self.stdout.write(
+                f"  AUTO  {trade_id} "
+                f"({usernames[initiator_id]} <-> {usernames[responder_id]})"
+            )
@@ -0,0 +1,123 @@
+"""
+Management command: benchmark_swap_cycles
+
+Benchmarks multi-party swap cycle detection on a synthetic marketplace built
+in memory (nothing is written to the database).  Reports the time to build
+the value indexes and the full "wants" graph, per-user cycle query latency,
+and cycle enumeration throughput.
+
+Usage:
+    python manage.py benchmark_swap_cycles
+    python manage.py benchmark_swap_cycles --cards 100000 --users 40000 --queries 2000
+    python manage.py benchmark_swap_cycles --full
+"""
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.matching import SwapListingSnapshot, _to_micros
+from core.swap_cycles import WantsGraph, find_all_cycles, find_user_cycles
+
+
+def _synthetic_snapshot(rng, cards, users, brands, categories):
+    """Random active swap listings with log-uniform values between $5 and $500."""
+    brand_ids = rng.integers(1, brands + 1, cards)
+    brand_categories = [f"Category {i % categories}" if i % 10 else "" for i in range(brands + 1)]
+    values = np.rint(np.exp(rng.uniform(np.log(500), np.log(50_000), cards)))
+    now = _to_micros(timezone.now())
+    return SwapListingSnapshot(
+        card_ids=np.arange(1, cards + 1),
+        owner_ids=rng.integers(1, users + 1, cards),
+        values=values.astype(np.int64),
+        brand_ids=brand_ids,
+        categories=[brand_categories[b] for b in brand_ids.tolist()],
+        trust_scores=rng.integers(0, 101, cards),
+        is_verified=rng.random(cards) < 0.3,
+        created_at=now - rng.integers(0, 30 * 86_400 * 1_000_000, cards),
+    )
+
+
+def _synthetic_brand_history(rng, users, brands):
+    """A third of users have received one to three brands in past trades."""
+    history = {}
+    for user_id in rng.choice(np.arange(1, users + 1), users // 3, replace=False).tolist():
+        history[user_id] = set(rng.integers(1, brands + 1, rng.integers(1, 4)).tolist())
+    return history
+
+
+class Command(BaseCommand):
+    help = "Benchmark 3- and 4-way swap cycle detection on a synthetic marketplace."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cards", type=int, default=100_000, help="Swap listings (default: 100000).")
+        parser.add_argument("--users", type=int, default=40_000, help="Distinct owners (default: 40000).")
+        parser.add_argument("--brands", type=int, default=300, help="Distinct brands (default: 300).")
+        parser.add_argument("--categories", type=int, default=12, help="Brand categories (default: 12).")
+        parser.add_argument("--queries", type=int, default=1000, help="Per-user queries to time (default: 1000).")
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Enumerate every cycle in the graph instead of a 5%% sample of start nodes.",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0).")
+
+    def handle(self, *args, **options):
+        if options["queries"] < 1:
+            raise CommandError("--queries must be at least 1.")
+        rng = np.random.default_rng(options["seed"])
+        cards, users = options["cards"], options["users"]
+
+        self.stdout.write(f"\nSwap Cycle Benchmark — {cards} cards, {users} users")
+        self.stdout.write("=" * 50)
+
+        snapshot = _synthetic_snapshot(rng, cards, users, options["brands"], options["categories"])
+        history = _synthetic_brand_history(rng, users, options["brands"])
+
+        started = time.perf_counter()
+        graph = WantsGraph(snapshot, history)
+        index_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        degrees = [len(graph.neighbors(row)) for row in range(cards)]
+        edge_seconds = time.perf_counter() - started
+        self.stdout.write(f"  Index build:        {index_seconds:.2f}s")
+        self.stdout.write(
+            f"  Edge build:         {edge_seconds:.2f}s "
+            f"({sum(degrees)} edges, mean out-degree {np.mean(degrees):.1f})"
+        )
+
+        owners = np.unique(snapshot.owner_ids)
+        # Small --cards runs can have fewer owners than requested queries.
+        query_users = rng.choice(owners, min(options["queries"], len(owners)), replace=False)
+        latencies, found = [], 0
+        for user_id in query_users.tolist():
+            started = time.perf_counter()
+            found += len(find_user_cycles(graph, user_id))
+            latencies.append(time.perf_counter() - started)
+        latencies = np.array(latencies) * 1000
+        self.stdout.write(
+            f"  User query:         p50 {np.percentile(latencies, 50):.2f}ms, "
+            f"p95 {np.percentile(latencies, 95):.2f}ms, max {latencies.max():.2f}ms"
+        )
+        self.stdout.write(f"  Cycles per user:    {found / len(query_users):.1f} (top 10 kept)")
+
+        if options["full"]:
+            start_rows = range(cards)
+        else:
+            start_rows = rng.choice(cards, max(cards // 20, 1), replace=False).tolist()
+        started = time.perf_counter()
+        cycles = find_all_cycles(graph, start_rows=start_rows)
+        enum_seconds = time.perf_counter() - started
+        lengths = np.bincount([len(cycle) for cycle in cycles], minlength=5)
+        self.stdout.write(
+            f"  Enumeration:        {len(cycles)} cycles from {len(start_rows)} starts "
+            f"in {enum_seconds:.2f}s ({len(start_rows) / enum_seconds:.0f} starts/sec)"
+        )
+        self.stdout.write(f"  3-way / 4-way:      {lengths[3]} / {lengths[4]}")
+
+        self.stdout.write(f"\n{'=' * 50}")
+        self.stdout.write(self.style.SUCCESS("Benchmark complete"))
+        self.stdout.write(f"{'=' * 50}")
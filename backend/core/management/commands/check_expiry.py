@@ -14,6 +14,7 @@ Usage:
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
+from core import facets, listing_cache, match_index
 from core.models import GiftCard
 
 
@@ -56,7 +57,11 @@ class Command(BaseCommand):
                 )
 
             if not dry_run:
+                expired_ids = list(expired_qs.values_list("id", flat=True))
                 expired_qs.update(status=GiftCard.Status.EXPIRED)
+                match_index.remove_cards(expired_ids)
+                facets.recompute_cards(expired_ids)
+                listing_cache.bump()
                 self.stdout.write(
                     self.style.SUCCESS(
                         f"Expired {expired_count} gift card(s)."
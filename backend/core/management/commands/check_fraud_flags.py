@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from core.fraud_detection import run_fraud_checks
+from core.fraud_detection import run_fraud_checks, run_incremental_fraud_checks
 from core.models import User
 
 
@@ -20,6 +20,16 @@ class Command(BaseCommand):
             action="store_true",
             help="Show what would be flagged without creating records (not yet implemented)",
         )
+        parser.add_argument(
+            "--per-user",
+            action="store_true",
+            help="Check users one at a time instead of the bulk scan (slow; for comparison)",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Sweep all active users instead of only those active since the last run",
+        )
 
     def handle(self, *args, **options):
         start_time = timezone.now()
@@ -36,7 +46,7 @@ class Command(BaseCommand):
             except User.DoesNotExist:
                 self.stderr.write(self.style.ERROR(f"User with id={user_id} not found."))
                 return
-        else:
+        elif options["per_user"]:
             active_users = User.objects.filter(
                 status=User.Status.ACTIVE,
                 is_active=True,
@@ -44,6 +54,10 @@ class Command(BaseCommand):
             user_count = active_users.count()
             self.stdout.write(f"Scanning {user_count} active user(s)...")
             new_flags = run_fraud_checks(user=None)
+        else:
+            run, new_flags = run_incremental_fraud_checks(full=options["full"])
+            mode = "Full sweep" if run.is_full else "Incremental"
+            self.stdout.write(f"{mode}: scanned {run.users_scanned} user(s)")
 
         # Print summary of new flags
         if new_flags:
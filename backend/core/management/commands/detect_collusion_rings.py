@@ -0,0 +1,100 @@
+"""
+Management command: detect_collusion_rings
+
+Offline analyzer for collusion and wash-trading rings.  Streams completed
+trades twice with bounded memory (see ``core.collusion``), groups users
+linked by repeated trades or cards handed straight back, and raises a
+COLLUSION_RING fraud flag for each active member of a suspicious cluster.
+
+Usage:
+    python manage.py detect_collusion_rings
+    python manage.py detect_collusion_rings --days 90
+    python manage.py detect_collusion_rings --dry-run
+
+Schedule nightly:
+    30 3 * * * cd /path/to/backend && python manage.py detect_collusion_rings --days 90
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import collusion
+
+
+class Command(BaseCommand):
+    help = "Detect rings of accounts trading among themselves and flag their members."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Only analyze trades completed in the last N days (default: all).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report suspicious clusters without creating flags.",
+        )
+        parser.add_argument(
+            "--pair-capacity",
+            type=int,
+            default=collusion.PAIR_CAPACITY,
+            help=f"User pairs tracked in the first pass (default: {collusion.PAIR_CAPACITY}).",
+        )
+        parser.add_argument(
+            "--card-memory",
+            type=int,
+            default=collusion.CARD_MEMORY,
+            help=f"Recent card moves remembered (default: {collusion.CARD_MEMORY}).",
+        )
+
+    def handle(self, *args, **options):
+        start_time = timezone.now()
+        since = start_time - timedelta(days=options["days"]) if options["days"] else None
+
+        self.stdout.write(f"\nCollusion Ring Scan — {start_time:%Y-%m-%d %H:%M:%S}")
+        self.stdout.write("=" * 50)
+
+        streamed, clusters = collusion.find_collusion_clusters(
+            since=since,
+            pair_capacity=options["pair_capacity"],
+            card_memory=options["card_memory"],
+        )
+        suspicious = [cluster for cluster in clusters if cluster.is_suspicious]
+        self.stdout.write(f"Trades streamed:      {streamed}")
+        self.stdout.write(f"Linked clusters:      {len(clusters)}")
+        self.stdout.write(f"Suspicious clusters:  {len(suspicious)}")
+
+        for cluster in suspicious:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"  - {len(cluster.user_ids)} users {cluster.user_ids[:10]} | "
+                    f"{cluster.internal_trades} internal trades, "
+                    f"{cluster.card_returns} card returns, "
+                    f"{cluster.insularity:.0%} insular"
+                )
+            )
+
+        if options["dry_run"]:
+            self.stdout.write("\nDry run: no flags created.")
+        else:
+            new_flags = collusion.flag_collusion_clusters(suspicious)
+            auto_restricted = sum(1 for flag in new_flags if flag.auto_restricted)
+            if new_flags:
+                self.stdout.write(
+                    self.style.WARNING(f"\nNew fraud flags created: {len(new_flags)}")
+                )
+                if auto_restricted:
+                    self.stdout.write(
+                        self.style.WARNING(f"Users auto-restricted: {auto_restricted}")
+                    )
+            else:
+                self.stdout.write(self.style.SUCCESS("\nNo new fraud flags created."))
+
+        elapsed = (timezone.now() - start_time).total_seconds()
+        self.stdout.write(f"\n{'=' * 50}")
+        self.stdout.write(f"Completed in {elapsed:.2f}s")
+        self.stdout.write(f"{'=' * 50}")
@@ -0,0 +1,53 @@
+"""
+Management command: rebuild_match_index
+
+Recomputes the precomputed swap-match index (``MatchCandidate``) from the
+current marketplace.  The index is normally maintained incrementally as
+listings and trades change; use this command after deploying the index,
+to recover from drift, or to refresh time-based recency scores.
+
+Usage:
+    python manage.py rebuild_match_index
+    python manage.py rebuild_match_index --user-id 42
+"""
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import match_index
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed swap-match index for all users or a single user."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user-id",
+            type=int,
+            default=None,
+            help="Rebuild the index for a specific user ID only.",
+        )
+
+    def handle(self, *args, **options):
+        start_time = timezone.now()
+        user_id = options["user_id"]
+
+        self.stdout.write(f"\nMatch Index Rebuild — {start_time:%Y-%m-%d %H:%M:%S}")
+        self.stdout.write("=" * 50)
+
+        if user_id:
+            if not User.objects.filter(pk=user_id).exists():
+                self.stderr.write(self.style.ERROR(f"User with id={user_id} not found."))
+                return
+            user_count = 1
+            entry_count = match_index.rebuild_users([user_id])
+        else:
+            user_count, entry_count = match_index.rebuild_all(stdout=self.stdout)
+
+        elapsed = (timezone.now() - start_time).total_seconds()
+        self.stdout.write(f"\n{'=' * 50}")
+        self.stdout.write(f"  Users indexed:  {user_count}")
+        self.stdout.write(f"  Entries:        {entry_count}")
+        self.stdout.write(self.style.SUCCESS(f"Completed in {elapsed:.2f}s"))
+        self.stdout.write(f"{'=' * 50}")
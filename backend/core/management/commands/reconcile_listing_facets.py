@@ -0,0 +1,86 @@
+"""
+Management command: reconcile_listing_facets
+
+Recomputes the marketplace facet counts (``ListingFacet``) from the gift
+card table, brand by brand, and repairs cells that are missing or
+disagree; rows for cells with no active cards left are deleted.  Runs
+periodically from the job queue (see ``core.jobs.PERIODIC_COMMANDS``).
+
+Usage:
+    python manage.py reconcile_listing_facets
+    python manage.py reconcile_listing_facets --dry-run
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core import facets
+from core.models import Brand, ListingFacet
+
+
+class Command(BaseCommand):
+    help = "Verify marketplace facet counts against the gift card table and repair them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report mismatched cells without changing them.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Brands compared per batch (default: 500).",
+        )
+
+    def handle(self, *args, **options):
+        start_time = timezone.now()
+        dry_run = options["dry_run"]
+        self.stdout.write(f"\nListing Facet Reconciliation — {start_time:%Y-%m-%d %H:%M:%S}")
+        self.stdout.write("=" * 50)
+
+        brand_ids = list(Brand.objects.order_by("pk").values_list("pk", flat=True))
+        chunk_size = options["chunk_size"]
+        checked = wrong = removed = 0
+        for start in range(0, len(brand_ids), chunk_size):
+            chunk = brand_ids[start:start + chunk_size]
+            # Read both sides in one transaction so concurrent changes can't
+            # show up on one side only.
+            with transaction.atomic():
+                expected = facets.compute_cells(chunk)
+                stored = {
+                    (row.brand_id, row.listing_type, row.value_bucket): row
+                    for row in ListingFacet.objects.filter(brand_id__in=chunk)
+                }
+                stale = {
+                    cell: count
+                    for cell, count in expected.items()
+                    if cell not in stored or stored[cell].count != count
+                }
+                empty = [row.pk for cell, row in stored.items() if cell not in expected]
+                for cell, count in stale.items():
+                    have = stored[cell].count if cell in stored else None
+                    self.stdout.write(self.style.WARNING(f"  {cell}: {have} != {count}"))
+                checked += len(set(expected) | set(stored))
+                wrong += len(stale)
+                removed += len(empty)
+                if not dry_run:
+                    facets.store(stale)
+                    ListingFacet.objects.filter(pk__in=empty).delete()
+
+        self.stdout.write(f"Cells checked:    {checked}")
+        self.stdout.write(f"Mismatched cells: {wrong}")
+        self.stdout.write(f"Empty cells:      {removed}")
+        if dry_run:
+            self.stdout.write(self.style.WARNING("[DRY RUN] No changes made."))
+        elif wrong or removed:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {wrong + removed} cell(s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS("All stored counts match."))
+
+        elapsed = (timezone.now() - start_time).total_seconds()
+        self.stdout.write(f"\n{'=' * 50}")
+        self.stdout.write(f"Completed in {elapsed:.2f}s")
+        self.stdout.write(f"{'=' * 50}")
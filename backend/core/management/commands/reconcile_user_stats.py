@@ -0,0 +1,101 @@
+"""
+Management command: reconcile_user_stats
+
+Recomputes every user's ``UserStats`` counters from the trade, sale and
+dispute tables and reports rows that are missing or disagree.  With
+``--fix`` the stored rows are overwritten with the recomputed values.
+
+Usage:
+    python manage.py reconcile_user_stats
+    python manage.py reconcile_user_stats --fix
+    python manage.py reconcile_user_stats --user-id 42 --fix
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core import user_stats
+from core.models import User, UserStats
+
+
+class Command(BaseCommand):
+    help = "Verify denormalized user stats against the source tables (and repair with --fix)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Overwrite missing or mismatched rows with the recomputed values.",
+        )
+        parser.add_argument(
+            "--user-id",
+            type=int,
+            default=None,
+            help="Reconcile a single user.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Users compared per batch (default: 500).",
+        )
+
+    def handle(self, *args, **options):
+        start_time = timezone.now()
+        self.stdout.write(f"\nUser Stats Reconciliation — {start_time:%Y-%m-%d %H:%M:%S}")
+        self.stdout.write("=" * 50)
+
+        user_ids = User.objects.order_by("pk").values_list("pk", flat=True)
+        if options["user_id"]:
+            user_ids = user_ids.filter(pk=options["user_id"])
+        user_ids = list(user_ids)
+
+        chunk_size = options["chunk_size"]
+        missing = mismatched = 0
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            # Read both sides in one transaction so concurrent changes can't
+            # show up on one side only.
+            with transaction.atomic():
+                expected = user_stats.compute_stats(chunk)
+                stored = {
+                    row["user_id"]: row
+                    for row in UserStats.objects.filter(user_id__in=chunk).values(
+                        "user_id", *user_stats.STAT_FIELDS
+                    )
+                }
+                stale = []
+                for user_id, values in expected.items():
+                    row = stored.get(user_id)
+                    if row is None:
+                        missing += 1
+                        stale.append(user_id)
+                        continue
+                    diffs = {
+                        field: (row[field], value)
+                        for field, value in values.items()
+                        if row[field] != value
+                    }
+                    if diffs:
+                        mismatched += 1
+                        stale.append(user_id)
+                        details = ", ".join(
+                            f"{field} {have} != {want}" for field, (have, want) in diffs.items()
+                        )
+                        self.stdout.write(self.style.WARNING(f"  user {user_id}: {details}"))
+                if options["fix"] and stale:
+                    user_stats.recompute_users(stale)
+
+        self.stdout.write(f"Users checked:    {len(user_ids)}")
+        self.stdout.write(f"Missing rows:     {missing}")
+        self.stdout.write(f"Mismatched rows:  {mismatched}")
+        if options["fix"] and (missing or mismatched):
+            self.stdout.write(self.style.SUCCESS(f"Repaired {missing + mismatched} row(s)."))
+        elif not mismatched:
+            self.stdout.write(self.style.SUCCESS("All stored stats match."))
+
+        elapsed = (timezone.now() - start_time).total_seconds()
+        self.stdout.write(f"\n{'=' * 50}")
+        self.stdout.write(f"Completed in {elapsed:.2f}s")
+        self.stdout.write(f"{'=' * 50}")
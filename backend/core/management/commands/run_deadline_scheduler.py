@@ -0,0 +1,74 @@
+"""
+Management command: run_deadline_scheduler
+
+Long-running service that finalizes trades within seconds of their escrow
+confirmation deadline (see ``core.deadline_scheduler``).  Upcoming
+deadlines are held in a min-heap rebuilt from the database at start-up
+and refreshed by a short poll, so the service can be restarted at any
+time.  ``auto_finalize_trades`` remains available as a cron fallback.
+
+Usage:
+    python manage.py run_deadline_scheduler
+    python manage.py run_deadline_scheduler --poll-interval 2 --capacity 50000
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core.deadline_scheduler import DeadlineScheduler
+
+
+class Command(BaseCommand):
+    help = "Finalize trades as their confirmation windows close."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--capacity",
+            type=int,
+            default=10_000,
+            help="Most deadlines held in memory (default: 10000).",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds between polls for new deadlines (default: 5).",
+        )
+        parser.add_argument(
+            "--rebuild-interval",
+            type=float,
+            default=600.0,
+            help="Seconds between full reloads of the deadline heap (default: 600).",
+        )
+
+    def handle(self, *args, **options):
+        scheduler = DeadlineScheduler(
+            capacity=options["capacity"],
+            poll_interval=options["poll_interval"],
+            rebuild_interval=options["rebuild_interval"],
+        )
+        self.stdout.write(
+            f"\nDeadline Scheduler — started {timezone.now():%Y-%m-%d %H:%M:%S}"
+        )
+        self.stdout.write("=" * 50)
+        self.stdout.write("Press Ctrl+C to stop.")
+
+        finalized = 0
+        try:
+            while True:
+                # Drop connections the database closed while we slept.
+                close_old_connections()
+                rows, sleep = scheduler.tick()
+                for _, trade_id, _, _ in rows:
+                    self.stdout.write(f"  AUTO  {trade_id}")
+                finalized += len(rows)
+                time.sleep(sleep)
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(f"\n{'=' * 50}")
+        self.stdout.write(f"Stopped after finalizing {finalized} trade(s).")
+        self.stdout.write(f"{'=' * 50}")
@@ -0,0 +1,113 @@
+"""
+Management command: run_workers
+
+Runs background job workers (see ``core.jobs``): N worker processes that
+claim and run queued jobs, supervised by this process, which also
+enqueues the periodic commands (``auto_finalize_trades``,
+``check_fraud_flags``, ``check_expiry``, ``reconcile_listing_facets``) in
+place of cron, re-queues jobs abandoned by dead workers and restarts
+workers that exit.
+
+Usage:
+    python manage.py run_workers
+    python manage.py run_workers --processes 4
+    python manage.py run_workers --once          # drain the queue in-process and exit
+"""
+
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from core import jobs
+
+SUPERVISE_SECONDS = 5
+PRUNE_SECONDS = 60 * 60
+
+
+class Command(BaseCommand):
+    help = "Run background job workers and schedule periodic jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=2,
+            help="Worker processes (default: 2).",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds an idle worker waits before checking for jobs (default: 1).",
+        )
+        parser.add_argument(
+            "--no-periodic",
+            action="store_true",
+            help="Don't enqueue periodic commands (another supervisor does).",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run every due job in this process, then exit.",
+        )
+
+    def handle(self, *args, **options):
+        start_time = timezone.now()
+        self.stdout.write(f"\nJob Workers — {start_time:%Y-%m-%d %H:%M:%S}")
+        self.stdout.write("=" * 50)
+
+        if options["once"]:
+            if not options["no_periodic"]:
+                jobs.schedule_periodic()
+            ran = jobs.run_pending()
+            elapsed = (timezone.now() - start_time).total_seconds()
+            self.stdout.write(f"Jobs run:  {ran}")
+            self.stdout.write(f"\n{'=' * 50}")
+            self.stdout.write(f"Completed in {elapsed:.2f}s")
+            self.stdout.write(f"{'=' * 50}")
+            return
+
+        context = multiprocessing.get_context(
+            "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+        stop = context.Event()
+        workers = []
+        self.stdout.write(f"Starting {options['processes']} worker(s); press Ctrl+C to stop.")
+
+        last_prune = 0.0
+        try:
+            while True:
+                workers = [worker for worker in workers if worker.is_alive()]
+                if len(workers) < options["processes"]:
+                    # Children must open their own connections, never share ours.
+                    connections.close_all()
+                    while len(workers) < options["processes"]:
+                        worker = context.Process(
+                            target=jobs.work, args=(stop, options["poll_interval"]), daemon=True
+                        )
+                        worker.start()
+                        workers.append(worker)
+
+                if not options["no_periodic"]:
+                    jobs.schedule_periodic()
+                requeued = jobs.requeue_stale()
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f"  Re-queued {requeued} stale job(s)"))
+                if time.monotonic() - last_prune >= PRUNE_SECONDS:
+                    jobs.prune()
+                    last_prune = time.monotonic()
+                time.sleep(SUPERVISE_SECONDS)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join(timeout=30)
+
+        elapsed = (timezone.now() - start_time).total_seconds()
+        self.stdout.write(f"\n{'=' * 50}")
+        self.stdout.write(f"Stopped after {elapsed:.2f}s")
+        self.stdout.write(f"{'=' * 50}")
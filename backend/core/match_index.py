@@ -0,0 +1,422 @@
+"""
+Persistent swap-match index.
+
+Each user's top ``MATCH_INDEX_SIZE`` swap partners are stored as
+``MatchCandidate`` rows so ``/api/matches/`` is a single indexed read.
+The index is maintained incrementally:
+
+- When a card starts or stops being an active swap listing (or its value,
+  brand or owner changes), rows referencing it are dropped, the users who
+  lost rows are re-ranked, and the card is offered as a new candidate to
+  every other user whose list it would enter.
+- When a trade completes, both parties are re-ranked because their brand
+  history (and therefore brand preference scores) changed.
+
+Requests (card saves and deletes, trade transitions, admin moderation)
+queue this work as background jobs (see ``core.jobs``), so they never
+load the marketplace snapshot.
+
+``rebuild_match_index`` recomputes everything for recovery, and the nightly
+``compute_matches`` job recomputes it across a process pool and notifies
+users about new high-scoring matches.
+"""
+
+import multiprocessing
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, Min, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from core.matching import (
+    _NO_CATEGORY,
+    SwapListingSnapshot,
+    _get_received_brand_ids_by_user,
+    _recency_scores,
+    _to_micros,
+    _value_similarity_scores,
+    find_top_swap_pairs,
+)
+from core.models import (
+    Brand,
+    GiftCard,
+    MatchCandidate,
+    Notification,
+    NotificationRule,
+    Trade,
+    User,
+)
+
+MATCH_INDEX_SIZE = getattr(settings, "MATCH_INDEX_SIZE", 50)
+MATCH_NOTIFY_MIN_SCORE = getattr(settings, "MATCH_NOTIFY_MIN_SCORE", 85)
+
+
+# ─── Full Re-ranking ───
+
+
+def _notified_pairs(user_ids):
+    """``(user_id, user_card_id, suggested_card_id)`` of pairs already notified."""
+    return set(
+        MatchCandidate.objects.filter(user_id__in=user_ids, is_notified=True).values_list(
+            "user_id", "user_card_id", "suggested_card_id"
+        )
+    )
+
+
+def rebuild_users(user_ids, snapshot=None):
+    """
+    Recompute the top-K list of each given user from scratch.  Job task
+    (queued when a card is deleted or a trade completes) and called
+    directly by the rebuilds.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return 0
+    if snapshot is None:
+        snapshot = SwapListingSnapshot.load()
+    notified = _notified_pairs(user_ids)
+
+    rows = []
+    for user in User.objects.filter(pk__in=user_ids):
+        pairs = find_top_swap_pairs(user, limit=MATCH_INDEX_SIZE, snapshot=snapshot)
+        rows.extend(
+            MatchCandidate(
+                user_id=user.pk,
+                user_card_id=user_card_id,
+                suggested_card_id=suggested_card_id,
+                score=score,
+                is_notified=(user.pk, user_card_id, suggested_card_id) in notified,
+            )
+            for user_card_id, suggested_card_id, score in pairs
+        )
+
+    with transaction.atomic():
+        MatchCandidate.objects.filter(user_id__in=user_ids).delete()
+        MatchCandidate.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rebuild_all(batch_size=500, stdout=None):
+    """Recompute the whole index for every user with swap listings."""
+    snapshot = SwapListingSnapshot.load()
+    user_ids = sorted(set(snapshot.owner_ids.tolist()))
+
+    # Users who no longer have any swap listing keep no index rows; the rest
+    # are replaced user by user, keeping which pairs were already notified.
+    MatchCandidate.objects.exclude(user_id__in=user_ids).delete()
+    total = 0
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        total += rebuild_users(batch, snapshot=snapshot)
+        if stdout is not None:
+            stdout.write(f"  Indexed {min(start + batch_size, len(user_ids))}/{len(user_ids)} users")
+    return len(user_ids), total
+
+
+# ─── Batch Computation ───
+#
+# The parent loads the marketplace once and forks the pool, so workers
+# inherit the snapshot and per-user brand history without pickling them and
+# never touch the database.  Workers only rank shards of users; the parent
+# writes each shard's results (and notifications) in one transaction.
+
+_batch_state = {}
+
+
+def _rank_shard(user_ids):
+    snapshot = _batch_state["snapshot"]
+    received = _batch_state["received"]
+    empty = set()
+    results = []
+    for user_id in user_ids:
+        pairs = find_top_swap_pairs(
+            User(pk=user_id),
+            limit=MATCH_INDEX_SIZE,
+            snapshot=snapshot,
+            received_brand_ids=received.get(user_id, empty),
+        )
+        results.append((user_id, pairs))
+    return results
+
+
+def _match_notification(rule, user_card, suggested_card, score, new_count, brand_names):
+    """Build the MATCH notification for a user's best new match."""
+    context = {
+        "brand": brand_names.get(suggested_card[0], ""),
+        "value": suggested_card[1],
+        "your_brand": brand_names.get(user_card[0], ""),
+        "your_value": user_card[1],
+        "score": score,
+        "count": new_count,
+    }
+    title = "New swap match found"
+    message = (
+        f"Your {context['your_brand']} ${context['your_value']} card has a "
+        f"{score}/100 match with a {context['brand']} ${context['value']} card."
+    )
+    if new_count > 1:
+        message += f" {new_count - 1} more new matches are waiting for you."
+    if rule is not None:
+        try:
+            title = rule.template_subject.format(**context) or title
+            message = rule.template_body.format(**context) or message
+        except (KeyError, IndexError, ValueError):
+            pass
+    return title, message
+
+
+def _store_shard(results, notify, rule, card_info, brand_names):
+    """Replace the shard's index rows and notify users of new high-score pairs."""
+    user_ids = [user_id for user_id, _ in results]
+    notified = _notified_pairs(user_ids)
+
+    rows, notifications = [], []
+    for user_id, pairs in results:
+        new_pairs = []
+        for user_card_id, suggested_card_id, score in pairs:
+            is_notified = (user_id, user_card_id, suggested_card_id) in notified
+            if notify and not is_notified and score >= MATCH_NOTIFY_MIN_SCORE:
+                new_pairs.append((user_card_id, suggested_card_id, score))
+                is_notified = True
+            rows.append(
+                MatchCandidate(
+                    user_id=user_id,
+                    user_card_id=user_card_id,
+                    suggested_card_id=suggested_card_id,
+                    score=score,
+                    is_notified=is_notified,
+                )
+            )
+        if new_pairs:
+            user_card_id, suggested_card_id, score = new_pairs[0]
+            title, message = _match_notification(
+                rule,
+                card_info[user_card_id],
+                card_info[suggested_card_id],
+                score,
+                len(new_pairs),
+                brand_names,
+            )
+            notifications.append(
+                Notification(
+                    user_id=user_id,
+                    type=Notification.Type.MATCH,
+                    title=title,
+                    message=message,
+                )
+            )
+
+    with transaction.atomic():
+        MatchCandidate.objects.filter(user_id__in=user_ids).delete()
+        MatchCandidate.objects.bulk_create(rows, batch_size=1000)
+        Notification.objects.bulk_create(notifications, batch_size=1000)
+    return len(rows), len(notifications)
+
+
+def compute_all(processes=None, shard_size=200, notify=True, stdout=None):
+    """
+    Recompute the whole index across a process pool.
+
+    Returns ``(user_count, entry_count, notification_count)``.  Falls back to
+    ranking in-process when ``processes`` is 1 or the platform cannot fork.
+    Notifications are skipped when the MATCH_FOUND rule exists but is
+    inactive.
+    """
+    snapshot = SwapListingSnapshot.load()
+    user_ids = sorted(set(snapshot.owner_ids.tolist()))
+
+    rule = NotificationRule.objects.filter(
+        event_type=NotificationRule.EventType.MATCH_FOUND
+    ).first()
+    notify = notify and (rule is None or rule.is_active)
+    brand_names = dict(Brand.objects.values_list("id", "name"))
+    card_info = {
+        card_id: (brand_id, f"{cents / 100:.2f}")
+        for card_id, brand_id, cents in zip(
+            snapshot.card_ids.tolist(),
+            snapshot.brand_ids.tolist(),
+            snapshot.value_cents.tolist(),
+        )
+    }
+
+    # Users who no longer have any swap listing keep no index rows.
+    stale = set(MatchCandidate.objects.values_list("user_id", flat=True).distinct())
+    stale.difference_update(user_ids)
+    if stale:
+        MatchCandidate.objects.filter(user_id__in=stale).delete()
+
+    _batch_state.update(
+        snapshot=snapshot,
+        received=_get_received_brand_ids_by_user(),
+    )
+    shards = [user_ids[i:i + shard_size] for i in range(0, len(user_ids), shard_size)]
+    processes = processes or multiprocessing.cpu_count()
+    if "fork" not in multiprocessing.get_all_start_methods():
+        processes = 1
+
+    entries = notified = done = 0
+    pool = None
+    try:
+        if processes > 1 and len(shards) > 1:
+            # Children must open their own connections, never share ours.
+            connections.close_all()
+            pool = multiprocessing.get_context("fork").Pool(processes)
+            ranked = pool.imap_unordered(_rank_shard, shards)
+        else:
+            ranked = map(_rank_shard, shards)
+        for results in ranked:
+            stored, sent = _store_shard(results, notify, rule, card_info, brand_names)
+            entries += stored
+            notified += sent
+            done += len(results)
+            if stdout is not None:
+                stdout.write(f"  Ranked {done}/{len(user_ids)} users")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _batch_state.clear()
+    return len(user_ids), entries, notified
+
+
+# ─── Incremental Maintenance ───
+
+
+def _offer_candidate(card, snapshot):
+    """
+    Insert ``card`` into every other user's list where it now ranks in the top K.
+
+    Scores the card against all other users' swap listings in one vector,
+    compares each pair with the owner's current K-th best score, inserts the
+    winners and trims lists that grew past K.
+    """
+    position = np.flatnonzero(snapshot.card_ids == card.pk)
+    rows = np.flatnonzero(snapshot.owner_ids != card.owner_id)
+    if not len(position) or not len(rows):
+        return set()
+    position = position[:1]
+
+    # Users that have received this brand in a completed trade get +20.
+    received_by = set()
+    for initiator_id, responder_id, initiator_brand, responder_brand in Trade.objects.filter(
+        Q(initiator_card__brand_id=card.brand_id) | Q(responder_card__brand_id=card.brand_id),
+        status=Trade.Status.COMPLETED,
+    ).values_list(
+        "initiator_id", "responder_id", "initiator_card__brand_id", "responder_card__brand_id"
+    ):
+        if responder_brand == card.brand_id:
+            received_by.add(initiator_id)
+        if initiator_brand == card.brand_id:
+            received_by.add(responder_id)
+
+    owners = snapshot.owner_ids[rows]
+    same_category = (snapshot.categories[rows] == snapshot.categories[position]) & (
+        snapshot.categories[rows] != _NO_CATEGORY
+    )
+    scores = (
+        _value_similarity_scores(snapshot.value_cents[rows], snapshot.value_cents[position])[:, 0]
+        + np.where(np.isin(owners, list(received_by)), 20, np.where(same_category, 10, 0))
+        + snapshot.reputation_scores[position]
+        + _recency_scores(snapshot.created_micros[position], _to_micros(timezone.now()))
+    )
+
+    floors = {
+        row["user_id"]: (row["size"], row["floor"])
+        for row in MatchCandidate.objects.filter(user_id__in=set(owners.tolist()))
+        .values("user_id")
+        .annotate(size=Count("id"), floor=Min("score"))
+    }
+
+    new_rows = []
+    for row, owner_id, score in zip(rows.tolist(), owners.tolist(), scores.tolist()):
+        size, floor = floors.get(owner_id, (0, -1))
+        if size < MATCH_INDEX_SIZE or score > floor:
+            new_rows.append(
+                MatchCandidate(
+                    user_id=owner_id,
+                    user_card_id=int(snapshot.card_ids[row]),
+                    suggested_card_id=card.pk,
+                    score=score,
+                )
+            )
+    if not new_rows:
+        return set()
+
+    MatchCandidate.objects.bulk_create(new_rows, batch_size=1000, ignore_conflicts=True)
+    touched = {row.user_id for row in new_rows}
+    _trim(touched)
+    return touched
+
+
+def _trim(user_ids):
+    """Delete entries ranked below MATCH_INDEX_SIZE for the given users."""
+    ranked = MatchCandidate.objects.filter(user_id__in=user_ids).annotate(
+        rank=Window(
+            RowNumber(),
+            partition_by=[F("user_id")],
+            order_by=[F("score").desc(), F("id").asc()],
+        )
+    )
+    overflow = list(ranked.filter(rank__gt=MATCH_INDEX_SIZE).values_list("pk", flat=True))
+    if overflow:
+        MatchCandidate.objects.filter(pk__in=overflow).delete()
+
+
+def _users_referencing(card_ids):
+    """Users whose lists contain any of ``card_ids`` as either side of a pair."""
+    return set(
+        MatchCandidate.objects.filter(
+            Q(user_card_id__in=card_ids) | Q(suggested_card_id__in=card_ids)
+        ).values_list("user_id", flat=True).distinct()
+    )
+
+
+def refresh_card(card_id):
+    """Re-index one card after its listing state changed."""
+    refresh_cards([card_id])
+
+
+def remove_cards(card_ids):
+    """Drop cards that stopped being listed through a bulk ``update()``."""
+    card_ids = list(card_ids)
+    if not card_ids:
+        return
+    affected = _users_referencing(card_ids)
+    MatchCandidate.objects.filter(
+        Q(user_card_id__in=card_ids) | Q(suggested_card_id__in=card_ids)
+    ).delete()
+    rebuild_users(affected)
+
+
+def refresh_cards(card_ids):
+    """
+    Re-index cards whose listing state changed.  Job task (queued when a
+    card is saved, locked in a trade or moderated) and called directly
+    after bulk ``update()``s.  The marketplace snapshot is loaded once for the whole
+    batch.
+    """
+    card_ids = set(card_ids)
+    if not card_ids:
+        return
+    affected = _users_referencing(card_ids)
+    MatchCandidate.objects.filter(
+        Q(user_card_id__in=card_ids) | Q(suggested_card_id__in=card_ids)
+    ).delete()
+
+    listed = list(
+        GiftCard.objects.filter(
+            pk__in=card_ids,
+            listing_type=GiftCard.ListingType.SWAP,
+            status=GiftCard.Status.ACTIVE,
+        )
+    )
+    affected.update(card.owner_id for card in listed)
+    if not affected:
+        return
+
+    snapshot = SwapListingSnapshot.load()
+    rebuild_users(affected, snapshot=snapshot)
+    for card in listed:
+        _offer_candidate(card, snapshot)
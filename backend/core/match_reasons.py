@@ -0,0 +1,171 @@
+"""
+AI-generated match reasons.
+
+Reasons are cached per (user_card, suggested_card, score bucket) in the
+``match_reasons`` cache, which expires entries after a TTL and evicts the
+least recently used ones when full.  Requests never wait on OpenAI: cached
+reasons are attached straight away, and misses are generated by a small
+background pool.  Each OpenAI call is bounded by ``MATCH_REASON_TIMEOUT``
+and never retried, and at most ``MATCH_REASON_MAX_PENDING`` reasons are
+queued at once, so a slow upstream cannot pile up work.
+
+Set ``OPENAI_BASE_URL`` to point the client at a local fake server.
+"""
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from openai import OpenAI
+
+logger = logging.getLogger("core")
+
+# Scores are bucketed so a small score drift reuses the cached reason.
+SCORE_BUCKET_SIZE = 10
+
+_lock = threading.Lock()
+_executor = None
+_in_flight = set()
+
+
+def _cache():
+    return caches["match_reasons"]
+
+
+def cache_key(match):
+    """Cache key of a suggestion: its card pair and score bucket."""
+    return "match-reason:{}:{}:{}".format(
+        match["user_card"]["id"],
+        match["suggested_card"]["id"],
+        match["match_score"] // SCORE_BUCKET_SIZE,
+    )
+
+
+def _describe(index, match):
+    return (
+        f"{index}. Your {match['user_card']['brand']} (${match['user_card']['value']}) "
+        f"↔ {match['suggested_card']['owner_username']}'s "
+        f"{match['suggested_card']['brand']} (${match['suggested_card']['value']}) "
+        f"— score {match['match_score']}/100, "
+        f"trust {match['owner_reputation']['trust_score']}/100"
+    )
+
+
+# ─── Generation ───
+
+
+def generate_reasons(descriptions):
+    """
+    Ask OpenAI for one short reason per match description.
+
+    Blocking; raises on timeout, API or parse errors.  Only called from the
+    background pool.
+    """
+    prompt = (
+        "You are a gift card swap assistant for Perkify. "
+        "For each match below, write a short (1 sentence, max 20 words) reason "
+        "why this swap is a good deal. Be specific about value, brand, or trust. "
+        "Return ONLY a JSON array of strings, one reason per match.\n\n"
+        "Matches:\n" + "\n".join(descriptions)
+    )
+
+    client = OpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=getattr(settings, "OPENAI_BASE_URL", "") or None,
+        timeout=getattr(settings, "MATCH_REASON_TIMEOUT", 4.0),
+        max_retries=0,
+    )
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.7,
+        max_tokens=500,
+    )
+    content = response.choices[0].message.content.strip()
+    # Parse JSON array from response
+    if content.startswith("```"):
+        content = content.split("```")[1]
+        if content.startswith("json"):
+            content = content[4:]
+    return json.loads(content)
+
+
+def _fill(keys, descriptions):
+    try:
+        reasons = generate_reasons(descriptions)
+        _cache().set_many({
+            key: reason
+            for key, reason in zip(keys, reasons)
+            if isinstance(reason, str)
+        })
+    except Exception as exc:
+        logger.warning("OpenAI match enrichment failed: %s", exc)
+    finally:
+        with _lock:
+            _in_flight.difference_update(keys)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "MATCH_REASON_WORKERS", 2),
+            thread_name_prefix="match-reasons",
+        )
+    return _executor
+
+
+# ─── Public API ───
+
+
+def request_reasons(matches):
+    """
+    Queue background generation of reasons for ``matches``.
+
+    Matches already being generated are skipped, and nothing is queued when
+    the pending budget is exhausted.  Returns the ``Future`` of the queued
+    batch, or ``None`` if nothing was queued.
+    """
+    max_pending = getattr(settings, "MATCH_REASON_MAX_PENDING", 100)
+    with _lock:
+        batch = {}
+        for match in matches:
+            key = cache_key(match)
+            if key not in _in_flight and key not in batch:
+                batch[key] = match
+        if not batch:
+            return None
+        if len(_in_flight) + len(batch) > max_pending:
+            logger.info("Match reason queue full; skipping %d reasons", len(batch))
+            return None
+        _in_flight.update(batch)
+        executor = _get_executor()
+
+    keys = list(batch)
+    descriptions = [_describe(i + 1, match) for i, match in enumerate(batch.values())]
+    return executor.submit(_fill, keys, descriptions)
+
+
+def attach_reasons(matches):
+    """
+    Set ``ai_match_reason`` on every match with a cached reason and queue
+    the rest.  Never waits on OpenAI; matches work fine without reasons.
+    """
+    if not matches or not getattr(settings, "OPENAI_API_KEY", ""):
+        return matches
+
+    keys = [cache_key(match) for match in matches]
+    cached = _cache().get_many(keys)
+    missing = []
+    for key, match in zip(keys, matches):
+        if key in cached:
+            match["ai_match_reason"] = cached[key]
+        else:
+            missing.append(match)
+
+    if missing:
+        request_reasons(missing)
+    return matches
@@ -1,13 +1,15 @@
-import json
 import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
 from decimal import Decimal
 
-from django.conf import settings
+import numpy as np
 from django.db.models import Q
 from django.utils import timezone
-from openai import OpenAI
-
+from core.match_reasons import attach_reasons
 from core.models import GiftCard, Trade
+from core.user_stats import get_stats_for
 
 logger = logging.getLogger("core")
 
@@ -38,46 +40,6 @@ def _calculate_value_similarity(user_card_value, other_card_value):
     return max(0, round(score))
 
 
-def _calculate_brand_preference(user, other_card, user_card):
-    """
-    Brand preference score (0-20 points).
-
-    +20 if the user has previously completed a trade for this brand.
-    +10 if the other card's brand is in the same category as the user's card brand.
-    These are not cumulative beyond 20; the max is 20.
-    """
-    score = 0
-
-    # Check if user has previously completed trades involving this brand
-    # (i.e., the user received a card of this brand in a completed trade)
-    completed_trades_with_brand = Trade.objects.filter(
-        Q(
-            initiator=user,
-            responder_card__brand=other_card.brand,
-            status="completed",
-        )
-        | Q(
-            responder=user,
-            initiator_card__brand=other_card.brand,
-            status="completed",
-        )
-    ).exists()
-
-    if completed_trades_with_brand:
-        score += 20
-
-    # Check if brands share the same category
-    if (
-        score < 20
-        and user_card.brand.category
-        and other_card.brand.category
-        and user_card.brand.category == other_card.brand.category
-    ):
-        score += 10
-
-    return min(score, 20)
-
-
 def _calculate_reputation_score(other_user):
     """
     Reputation score (0-25 points).
@@ -114,153 +76,519 @@ def _calculate_recency_score(card):
         return 5
 
 
-def get_swap_suggestions(user, limit=10):
+# ─── Vectorized Scoring Engine ───
+#
+# The scalar ``_calculate_*`` helpers above define the scoring rules.  The
+# engine below evaluates the same rules for every (user_card, other_card)
+# pair at once over columnar NumPy arrays, so a request costs a handful of
+# array operations instead of a Python loop over the whole marketplace.
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+_MICROS_PER_DAY = 86_400 * 1_000_000
+
+# Category code used for blank categories; never equal to a real category.
+_NO_CATEGORY = -1
+
+
+def _to_cents(value):
+    """Convert a 2-decimal-place Decimal to an exact integer number of cents."""
+    return int(value.scaleb(2))
+
+
+def _to_micros(dt):
+    """Convert an aware datetime to exact integer microseconds since the epoch."""
+    return (dt - _EPOCH) // _ONE_MICROSECOND
+
+
+class SwapListingSnapshot:
     """
-    Rule-based matching algorithm that suggests swap partners for the
-    authenticated user.
+    Columnar snapshot of every active swap listing.
 
-    Steps:
-    1. Get user's active swap-listed cards.
-    2. Get other users' active swap-listed cards (excluding user's own).
-    3. For each potential swap pair, calculate a composite score from
-       value similarity, brand preference, reputation, and recency.
-    4. Sort by score descending, return top ``limit`` results.
-    5. Each result contains match_score, suggested_card, user_card,
-       owner_reputation, value_difference, and estimated_fee.
+    Rows keep the marketplace's default ``-created_at`` order so ties between
+    equal scores resolve exactly as the old nested loop did.  Owner reputation
+    points only depend on the owner, so they are computed once per row at load
+    time; recency is computed at scoring time against the caller's ``now``.
+
+    ``value_order`` is a secondary index of row positions sorted by value, so
+    the rows within a value range can be found with a binary search.
     """
-    # 1. Get user's active swap-listed cards
-    user_cards = GiftCard.objects.filter(
-        owner=user,
-        listing_type=GiftCard.ListingType.SWAP,
-        status=GiftCard.Status.ACTIVE,
-    ).select_related("brand")
 
-    if not user_cards.exists():
-        return []
+    def __init__(self, card_ids, owner_ids, values, brand_ids, categories,
+                 trust_scores, is_verified, created_at):
+        self.card_ids = np.asarray(card_ids, dtype=np.int64)
+        self.owner_ids = np.asarray(owner_ids, dtype=np.int64)
+        self.value_cents = np.asarray(values, dtype=np.int64)
+        self.brand_ids = np.asarray(brand_ids, dtype=np.int64)
+        self.created_micros = np.asarray(created_at, dtype=np.int64)
+
+        # Map category strings to small integer codes for vectorized equality.
+        self.category_codes = {}
+        codes = []
+        for category in categories:
+            if not category:
+                codes.append(_NO_CATEGORY)
+                continue
+            code = self.category_codes.setdefault(category, len(self.category_codes))
+            codes.append(code)
+        self.categories = np.asarray(codes, dtype=np.int64)
+
+        self.reputation_scores = _reputation_scores(
+            np.asarray(trust_scores, dtype=np.int64),
+            np.asarray(is_verified, dtype=bool),
+        )
 
-    # 2. Get other users' active swap-listed cards
-    other_cards = (
-        GiftCard.objects.filter(
-            listing_type=GiftCard.ListingType.SWAP,
-            status=GiftCard.Status.ACTIVE,
+        self.value_order = np.argsort(self.value_cents, kind="stable")
+        self.sorted_values = self.value_cents[self.value_order]
+        # Per-snapshot ceilings used to bound the score of unscored pairs.
+        self.max_reputation_score = int(self.reputation_scores.max(initial=0))
+        self.newest_micros = int(self.created_micros.max(initial=0))
+
+    def __len__(self):
+        return len(self.card_ids)
+
+    @classmethod
+    def load(cls):
+        """Load all active swap listings with a single query."""
+        rows = (
+            GiftCard.objects.filter(
+                listing_type=GiftCard.ListingType.SWAP,
+                status=GiftCard.Status.ACTIVE,
+            )
+            .order_by("-created_at")
+            .values_list(
+                "id",
+                "owner_id",
+                "value",
+                "brand_id",
+                "brand__category",
+                "owner__trust_score",
+                "owner__is_verified",
+                "created_at",
+            )
+        )
+        columns = [[] for _ in range(8)]
+        for row in rows:
+            for column, item in zip(columns, row):
+                column.append(item)
+        card_ids, owner_ids, values, brand_ids, categories, trust, verified, created = columns
+        return cls(
+            card_ids,
+            owner_ids,
+            [_to_cents(v) for v in values],
+            brand_ids,
+            categories,
+            trust,
+            verified,
+            [_to_micros(c) for c in created],
         )
-        .exclude(owner=user)
-        .select_related("brand", "owner")
+
+    def rows_in_value_range(self, low, high):
+        """Row positions of listings valued between ``low`` and ``high`` cents inclusive."""
+        start = np.searchsorted(self.sorted_values, low, side="left")
+        stop = np.searchsorted(self.sorted_values, high, side="right")
+        return self.value_order[start:stop]
+
+    def category_code(self, category):
+        """Return the code for ``category``; unknown or blank categories never match."""
+        if not category:
+            return _NO_CATEGORY
+        return self.category_codes.get(category, _NO_CATEGORY)
+
+
+def _value_similarity(user_cents, other_cents):
+    """
+    Vectorized ``_calculate_value_similarity`` over integer cent amounts.
+
+    Operates elementwise (with broadcasting).  With u = user value and
+    d = |u - other|, the Decimal rules reduce to: 40 if 5d <= u, 0 if d >= u,
+    else round(40 * (1 - (5d - u) / (4u))).  The comparisons are exact in
+    integers, and the decay term is the same correctly rounded float the
+    Decimal path produces, so results match.
+    """
+    diff = np.abs(other_cents - user_cents)
+    safe_user = np.where(user_cents == 0, 1, user_cents)
+    decay = np.rint(40 * (1 - (5 * diff - user_cents) / (4 * safe_user)))
+    scores = np.where(5 * diff <= user_cents, 40, np.where(diff >= user_cents, 0, decay))
+    scores = np.where(user_cents == 0, 0, scores)
+    return scores.astype(np.int64)
+
+
+def _value_similarity_scores(user_cents, other_cents):
+    """``len(user_cents) x len(other_cents)`` matrix of value similarity points."""
+    return _value_similarity(user_cents[:, None], other_cents[None, :])
+
+
+def _reputation_scores(trust_scores, is_verified):
+    """Vectorized ``_calculate_reputation_score``."""
+    score = np.minimum(trust_scores, 100) / 100 * 25
+    score = score + np.where(is_verified, 5, 0)
+    return np.minimum(np.rint(score), 25).astype(np.int64)
+
+
+def _recency_scores(created_micros, now_micros):
+    """Vectorized ``_calculate_recency_score``."""
+    age = now_micros - created_micros
+    return np.where(
+        age <= _MICROS_PER_DAY,
+        15,
+        np.where(age < 8 * _MICROS_PER_DAY, 10, 5),
+    ).astype(np.int64)
+
+
+def _brand_preference_scores(user_categories, other_categories, received_mask):
+    """
+    Vectorized brand preference (0-20 points).
+
+    +20 if the user has previously received the other card's brand in a
+    completed trade, otherwise +10 if both brands share a non-blank category.
+    """
+    same_category = (user_categories[:, None] == other_categories[None, :]) & (
+        user_categories[:, None] != _NO_CATEGORY
     )
+    return np.where(received_mask[None, :], 20, np.where(same_category, 10, 0))
 
-    if not other_cards.exists():
-        return []
 
-    # 3. Score every (user_card, other_card) pair
-    scored_matches = []
-    fee_rate = Decimal("0.05")
+def _get_received_brand_ids(user):
+    """
+    Brands the user has received in completed trades, in a single query.
 
-    for user_card in user_cards:
-        for other_card in other_cards:
-            value_score = _calculate_value_similarity(
-                user_card.value, other_card.value
-            )
-            brand_score = _calculate_brand_preference(user, other_card, user_card)
-            reputation_score = _calculate_reputation_score(other_card.owner)
-            recency_score = _calculate_recency_score(other_card)
-
-            total_score = value_score + brand_score + reputation_score + recency_score
-
-            other_user = other_card.owner
-            rep = other_user.reputation
-
-            scored_matches.append({
-                "match_score": total_score,
-                "suggested_card": {
-                    "id": other_card.id,
-                    "brand": other_card.brand.name,
-                    "value": str(other_card.value),
-                    "listing_type": other_card.listing_type,
-                    "expiry_date": (
-                        other_card.expiry_date.isoformat()
-                        if other_card.expiry_date
-                        else None
-                    ),
-                    "owner_username": other_user.username,
-                },
-                "user_card": {
-                    "id": user_card.id,
-                    "brand": user_card.brand.name,
-                    "value": str(user_card.value),
-                },
-                "owner_reputation": {
-                    "total_trades": rep["total_trades"],
-                    "successful_trades": rep["successful_trades"],
-                    "disputes": rep["disputes"],
-                    "is_verified": other_user.is_verified,
-                    "trust_score": other_user.trust_score,
-                },
-                "value_difference": str(abs(user_card.value - other_card.value)),
-                "estimated_fee": str((user_card.value * fee_rate).quantize(
-                    Decimal("0.01")
-                )),
-            })
-
-    # 4. Sort by score descending
-    scored_matches.sort(key=lambda m: m["match_score"], reverse=True)
-
-    # 5. Return top ``limit`` results
-    top_matches = scored_matches[:limit]
-
-    # 6. Enrich with AI-generated match reasons via OpenAI
-    top_matches = _enrich_with_ai_reasons(top_matches)
+    The initiator receives the responder's card and vice versa.
+    """
+    rows = Trade.objects.filter(
+        Q(initiator=user) | Q(responder=user),
+        status=Trade.Status.COMPLETED,
+    ).values_list(
+        "initiator_id",
+        "responder_id",
+        "initiator_card__brand_id",
+        "responder_card__brand_id",
+    )
+    received = set()
+    for initiator_id, responder_id, initiator_brand, responder_brand in rows:
+        if initiator_id == user.pk:
+            received.add(responder_brand)
+        if responder_id == user.pk:
+            received.add(initiator_brand)
+    return received
+
+
+def _get_received_brand_ids_by_user():
+    """``{user_id: received brand ids}`` for every user, in a single query."""
+    rows = Trade.objects.filter(status=Trade.Status.COMPLETED).values_list(
+        "initiator_id",
+        "responder_id",
+        "initiator_card__brand_id",
+        "responder_card__brand_id",
+    )
+    received = defaultdict(set)
+    for initiator_id, responder_id, initiator_brand, responder_brand in rows:
+        received[initiator_id].add(responder_brand)
+        received[responder_id].add(initiator_brand)
+    return received
 
-    return top_matches
+
+def _get_owner_reputations(owner_ids):
+    """
+    Reputation stats for many users at once.
+
+    Returns ``{user_id: {"total_trades", "successful_trades", "disputes"}}``
+    with the same semantics as ``User.reputation``, from one ``UserStats``
+    query regardless of how many users are requested.
+    """
+    return {
+        user_id: {
+            "total_trades": stats.total_trades,
+            "successful_trades": stats.successful_trades,
+            "disputes": stats.disputes_raised,
+        }
+        for user_id, stats in get_stats_for(owner_ids).items()
+    }
 
 
-def _enrich_with_ai_reasons(matches):
+def _top_pair_indices(scores, limit):
     """
-    Use OpenAI to generate a short, human-friendly reason for each match.
-    Falls back gracefully — if OpenAI is unavailable, matches are returned as-is.
+    Return (row, column) indices of the ``limit`` best pairs, best first.
+
+    Ties are broken by row-major position, matching a stable descending sort
+    of the pairs in (user_card, other_card) loop order.
+    """
+    flat = scores.ravel()
+    size = flat.size
+    if size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    # Unique composite key: higher score first, then lower flat position.
+    keys = flat * size + (size - 1 - np.arange(size, dtype=np.int64))
+    limit = min(limit, size)
+    if limit < size:
+        top = np.argpartition(-keys, limit - 1)[:limit]
+    else:
+        top = np.arange(size)
+    top = top[np.argsort(-keys[top])]
+    return np.divmod(top, scores.shape[1])
+
+
+def score_swap_pairs(user, snapshot, now=None, received_brand_ids=None):
     """
-    if not matches or not getattr(settings, "OPENAI_API_KEY", ""):
-        return matches
+    Score the user's active swap listings against everyone else's.
 
-    # Build a concise prompt describing the top matches
-    match_summaries = []
-    for i, m in enumerate(matches):
-        match_summaries.append(
-            f"{i+1}. Your {m['user_card']['brand']} (${m['user_card']['value']}) "
-            f"↔ {m['suggested_card']['owner_username']}'s "
-            f"{m['suggested_card']['brand']} (${m['suggested_card']['value']}) "
-            f"— score {m['match_score']}/100, "
-            f"trust {m['owner_reputation']['trust_score']}/100"
+    Returns ``(user_rows, other_rows, scores)`` where ``user_rows`` and
+    ``other_rows`` index into ``snapshot`` and ``scores`` is the
+    ``len(user_rows) x len(other_rows)`` matrix of composite match scores.
+    """
+    now = now or timezone.now()
+    is_own = snapshot.owner_ids == user.pk
+    user_rows = np.flatnonzero(is_own)
+    other_rows = np.flatnonzero(~is_own)
+    if received_brand_ids is None:
+        received_brand_ids = _get_received_brand_ids(user)
+
+    user_categories = snapshot.categories[user_rows]
+    other_categories = snapshot.categories[other_rows]
+    other_brands = snapshot.brand_ids[other_rows]
+
+    received_mask = np.isin(other_brands, list(received_brand_ids))
+
+    scores = (
+        _value_similarity_scores(
+            snapshot.value_cents[user_rows], snapshot.value_cents[other_rows]
         )
+        + _brand_preference_scores(user_categories, other_categories, received_mask)
+        + snapshot.reputation_scores[other_rows][None, :]
+        + _recency_scores(snapshot.created_micros[other_rows], _to_micros(now))[None, :]
+    )
+    return user_rows, other_rows, scores
+
+
+# ─── Value-Range Candidate Pruning ───
+#
+# Value similarity is the largest score component, so a user's best pairs
+# sit close in value.  Rather than scoring every other listing, each user
+# card is first paired only with the listings in a value window around it,
+# found by binary search on the snapshot's value index.
+#
+# The window for level ``w`` keeps other cards with
+# ``|u - o| / u <= (101 - 2w) / 100``; outside it the unrounded value score
+# is below ``w - 0.5``, so a pair left out earns at most ``w - 1`` value
+# points.  With ``B`` the most brand, reputation and recency points any other
+# listing can add, no unscored pair beats ``w - 1 + B``.  So once the k-th
+# best scored pair reaches ``S``, widening the window to level ``S - B`` is
+# enough to prove the top k exactly; if the tightest window already covers
+# that, the first pass is the answer.
+
+_TIGHTEST_WINDOW_LEVEL = 40
+
+# Once the windows hold this share of all pairs, score the full matrix instead.
+_FULL_SCAN_SHARE = 0.5
+
+
+def _value_window_pairs(snapshot, user_rows, is_own, level):
+    """
+    Candidate pairs inside the value windows of ``level``.
+
+    Returns ``(user_positions, other_rows)``: positions into ``user_rows``
+    and the snapshot rows paired with them.
+    """
+    user_positions, other_rows = [], []
+    for position, user_cents in enumerate(snapshot.value_cents[user_rows].tolist()):
+        reach = (101 - 2 * level) * user_cents // 100
+        rows = snapshot.rows_in_value_range(user_cents - reach, user_cents + reach)
+        rows = rows[~is_own[rows]]
+        user_positions.append(np.full(len(rows), position, dtype=np.int64))
+        other_rows.append(rows)
+    return np.concatenate(user_positions), np.concatenate(other_rows)
 
-    prompt = (
-        "You are a gift card swap assistant for Perkify. "
-        "For each match below, write a short (1 sentence, max 20 words) reason "
-        "why this swap is a good deal. Be specific about value, brand, or trust. "
-        "Return ONLY a JSON array of strings, one reason per match.\n\n"
-        "Matches:\n" + "\n".join(match_summaries)
+
+def _score_pair_list(snapshot, user_rows, user_positions, other_rows, received, recency):
+    """
+    Composite scores of an explicit list of pairs (elementwise ``score_swap_pairs``).
+
+    ``received`` and ``recency`` are per-row columns over the whole snapshot.
+    """
+    user_cards = user_rows[user_positions]
+    user_categories = snapshot.categories[user_cards]
+    same_category = (user_categories == snapshot.categories[other_rows]) & (
+        user_categories != _NO_CATEGORY
     )
+    return (
+        _value_similarity(snapshot.value_cents[user_cards], snapshot.value_cents[other_rows])
+        + np.where(received[other_rows], 20, np.where(same_category, 10, 0))
+        + snapshot.reputation_scores[other_rows]
+        + recency[other_rows]
+    )
+
 
-    try:
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=500,
+def _windowed_top_pairs(snapshot, user_rows, is_own, limit, received_brand_ids, now_micros):
+    """
+    Top ``limit`` pairs found through value windows, as
+    ``(user_positions, other_rows, scores)``, or ``None`` when the windows
+    would cover most pairs anyway and the full matrix should be scored.
+    """
+    full_scan_pairs = _FULL_SCAN_SHARE * len(user_rows) * np.count_nonzero(~is_own)
+
+    received = np.isin(snapshot.brand_ids, list(received_brand_ids))
+    recency = _recency_scores(snapshot.created_micros, now_micros)
+    # Most brand + reputation + recency points any other listing can add.
+    user_has_category = bool(np.any(snapshot.categories[user_rows] != _NO_CATEGORY))
+    brand_ceiling = np.where(
+        received, 20, np.where(user_has_category & (snapshot.categories != _NO_CATEGORY), 10, 0)
+    )
+    bonus = int((brand_ceiling + snapshot.reputation_scores + recency)[~is_own].max())
+
+    level = _TIGHTEST_WINDOW_LEVEL
+    while True:
+        user_positions, other_rows = _value_window_pairs(snapshot, user_rows, is_own, level)
+        if len(other_rows) >= full_scan_pairs:
+            return None
+        scores = _score_pair_list(
+            snapshot, user_rows, user_positions, other_rows, received, recency
         )
-        content = response.choices[0].message.content.strip()
-        # Parse JSON array from response
-        if content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-        reasons = json.loads(content)
-
-        for i, match in enumerate(matches):
-            if i < len(reasons):
-                match["ai_match_reason"] = reasons[i]
-    except Exception as exc:
-        logger.warning("OpenAI match enrichment failed: %s", exc)
-        # Graceful fallback — matches work fine without AI reasons
-
-    return matches
+        if len(scores) >= limit:
+            kth_best = int(np.partition(scores, len(scores) - limit)[len(scores) - limit])
+            required_level = kth_best - bonus
+        else:
+            kth_best, required_level = None, 0
+        if required_level >= level:
+            break
+        if level == 1:
+            return None
+        # Any level below 1 cannot prune anything; try the widest window once.
+        level = max(required_level, 1)
+
+    # Every pair scoring at least ``kth_best`` beats all unscored pairs.  Best
+    # score first; ties in (user_card, other_card) row order as in the full
+    # matrix, where other rows keep their snapshot order.
+    winners = np.flatnonzero(scores >= kth_best)
+    order = np.lexsort((other_rows[winners], user_positions[winners], -scores[winners]))
+    top = winners[order[:limit]]
+    return user_positions[top], other_rows[top], scores[top]
+
+
+def find_top_swap_pairs(user, limit=10, snapshot=None, received_brand_ids=None):
+    """
+    Return the user's ``limit`` best swap pairs as
+    ``(user_card_id, suggested_card_id, match_score)`` tuples, best first.
+
+    ``snapshot`` (and the user's ``received_brand_ids``) may be passed in to
+    reuse one load across many users.
+    Candidates are pruned by value range first (see above); the full pair
+    matrix is only scored when the windows cannot prove the top ``limit``.
+    """
+    if snapshot is None:
+        snapshot = SwapListingSnapshot.load()
+
+    is_own = snapshot.owner_ids == user.pk
+    user_rows = np.flatnonzero(is_own)
+    if not len(user_rows) or len(user_rows) == len(snapshot) or limit <= 0:
+        return []
+
+    now = timezone.now()
+    if received_brand_ids is None:
+        received_brand_ids = _get_received_brand_ids(user)
+
+    windowed = _windowed_top_pairs(
+        snapshot, user_rows, is_own, limit, received_brand_ids, _to_micros(now)
+    )
+    if windowed is not None:
+        user_positions, suggested_rows, scores = windowed
+    else:
+        _, other_rows, matrix = score_swap_pairs(
+            user, snapshot, now=now, received_brand_ids=received_brand_ids
+        )
+        user_positions, columns = _top_pair_indices(matrix, limit)
+        suggested_rows, scores = other_rows[columns], matrix[user_positions, columns]
+
+    return list(zip(
+        snapshot.card_ids[user_rows[user_positions]].tolist(),
+        snapshot.card_ids[suggested_rows].tolist(),
+        scores.tolist(),
+    ))
+
+
+def build_swap_suggestions(pairs):
+    """
+    Render ``(user_card, suggested_card, match_score)`` triples as API results.
+
+    Cards must have ``brand`` and (for suggested cards) ``owner`` loaded.
+    Owner reputation for all results is aggregated in one grouped pass.
+    """
+    reputations = _get_owner_reputations(
+        {other_card.owner_id for _, other_card, _ in pairs}
+    )
+
+    suggestions = []
+    fee_rate = Decimal("0.05")
+
+    for user_card, other_card, total_score in pairs:
+        other_user = other_card.owner
+        rep = reputations[other_user.pk]
+
+        suggestions.append({
+            "match_score": total_score,
+            "suggested_card": {
+                "id": other_card.id,
+                "brand": other_card.brand.name,
+                "value": str(other_card.value),
+                "listing_type": other_card.listing_type,
+                "expiry_date": (
+                    other_card.expiry_date.isoformat()
+                    if other_card.expiry_date
+                    else None
+                ),
+                "owner_username": other_user.username,
+            },
+            "user_card": {
+                "id": user_card.id,
+                "brand": user_card.brand.name,
+                "value": str(user_card.value),
+            },
+            "owner_reputation": {
+                "total_trades": rep["total_trades"],
+                "successful_trades": rep["successful_trades"],
+                "disputes": rep["disputes"],
+                "is_verified": other_user.is_verified,
+                "trust_score": other_user.trust_score,
+            },
+            "value_difference": str(abs(user_card.value - other_card.value)),
+            "estimated_fee": str((user_card.value * fee_rate).quantize(
+                Decimal("0.01")
+            )),
+        })
+
+    return suggestions
+
+
+def get_swap_suggestions(user, limit=10, snapshot=None):
+    """
+    Rule-based matching algorithm that suggests swap partners for the
+    authenticated user.
+
+    Steps:
+    1. Load all active swap listings into a columnar snapshot (one query).
+    2. Split them into the user's cards and other users' cards, and
+       prefetch the brands the user has received in completed trades.
+    3. Score every (user_card, other_card) pair as one batch of array
+       operations over value similarity, brand preference, reputation,
+       and recency.
+    4. Select the top ``limit`` pairs with ``argpartition``.
+    5. Each result contains match_score, suggested_card, user_card,
+       owner_reputation, value_difference, and estimated_fee.
+
+    The number of queries is constant in the size of the marketplace.
+    """
+    pairs = find_top_swap_pairs(user, limit=limit, snapshot=snapshot)
+    if not pairs:
+        return []
+
+    cards = GiftCard.objects.select_related("brand", "owner").in_bulk(
+        {card_id for pair in pairs for card_id in pair[:2]}
+    )
+    top_matches = build_swap_suggestions([
+        (cards[user_card_id], cards[other_card_id], score)
+        for user_card_id, other_card_id, score in pairs
+    ])
+
+    # Attach cached AI match reasons; misses are generated in the background
+    top_matches = attach_reasons(top_matches)
+
+    return top_matches
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_add_user_tos_agreement_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveSmallIntegerField()),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('suggested_card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.giftcard')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='match_candidates', to=settings.AUTH_USER_MODEL)),
+                ('user_card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.giftcard')),
+            ],
+            options={
+                'ordering': ['-score', 'id'],
+                'indexes': [models.Index(fields=['user', '-score', 'id'], name='core_matchc_user_id_39595c_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_card', 'suggested_card'), name='unique_match_candidate_pair')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_add_match_candidate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchcandidate',
+            name='is_notified',
+            field=models.BooleanField(default=False),
+        ),
+    ]
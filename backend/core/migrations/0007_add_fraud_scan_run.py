@@ -0,0 +1,27 @@
+# Generated by Django 6.0.2 on 2026-10-17 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_add_match_candidate_is_notified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FraudScanRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_full', models.BooleanField(default=False)),
+                ('watermark', models.DateTimeField()),
+                ('users_scanned', models.PositiveIntegerField(default=0)),
+                ('flags_created', models.PositiveIntegerField(default=0)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-watermark'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.2 on 2026-10-17 11:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_add_fraud_scan_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoginIPBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('ips', models.JSONField(blank=True, default=list)),
+                ('sketch', models.BinaryField(blank=True, null=True)),
+                ('ip_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='login_ip_buckets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-bucket_start'],
+                'indexes': [models.Index(fields=['updated_at'], name='core_logini_updated_af0383_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'bucket_start'), name='unique_login_ip_bucket')],
+            },
+        ),
+    ]
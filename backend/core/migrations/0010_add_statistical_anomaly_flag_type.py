@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_add_collusion_ring_flag_type'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fraudflag',
+            name='flag_type',
+            field=models.CharField(choices=[('rapid_trades', 'Rapid Trades'), ('repeated_disputes', 'Repeated Disputes'), ('multi_ip', 'Multiple IPs'), ('abnormal_value', 'Abnormal Value'), ('collusion_ring', 'Collusion Ring'), ('statistical_anomaly', 'Statistical Anomaly')], max_length=25),
+        ),
+    ]
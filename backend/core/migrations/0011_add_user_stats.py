@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-17 13:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_add_statistical_anomaly_flag_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_trades', models.PositiveIntegerField(default=0)),
+                ('successful_trades', models.PositiveIntegerField(default=0)),
+                ('active_trades', models.PositiveIntegerField(default=0)),
+                ('disputes_raised', models.PositiveIntegerField(default=0)),
+                ('completed_sales', models.PositiveIntegerField(default=0)),
+                ('earnings', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'User Stats',
+            },
+        ),
+    ]
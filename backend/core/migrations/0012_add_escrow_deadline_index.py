@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-17 13:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_add_user_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='escrowsession',
+            index=models.Index(fields=['confirmation_deadline'], name='core_escrow_confirm_74e180_idx'),
+        ),
+    ]
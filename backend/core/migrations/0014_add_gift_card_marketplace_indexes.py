@@ -0,0 +1,33 @@
+# Generated by Django 6.0.2 on 2026-10-17 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_add_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='giftcard',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['created_at', 'id'], name='giftcard_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='giftcard',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['value', 'id'], name='giftcard_active_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='giftcard',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['selling_price', 'id'], name='giftcard_active_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='giftcard',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['expiry_date', 'id'], name='giftcard_active_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='giftcard',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['brand', 'created_at'], name='giftcard_active_brand_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Full-text index for brand search (see core.search).
+
+from django.db import migrations
+
+SEARCH_INDEX_SQL = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE core_brand_fts USING fts5("
+        "name, category, content='core_brand', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')",
+        "CREATE TRIGGER core_brand_fts_insert AFTER INSERT ON core_brand BEGIN "
+        "INSERT INTO core_brand_fts(rowid, name, category) "
+        "VALUES (new.id, new.name, new.category); END",
+        "CREATE TRIGGER core_brand_fts_delete AFTER DELETE ON core_brand BEGIN "
+        "INSERT INTO core_brand_fts(core_brand_fts, rowid, name, category) "
+        "VALUES ('delete', old.id, old.name, old.category); END",
+        "CREATE TRIGGER core_brand_fts_update AFTER UPDATE OF name, category ON core_brand BEGIN "
+        "INSERT INTO core_brand_fts(core_brand_fts, rowid, name, category) "
+        "VALUES ('delete', old.id, old.name, old.category); "
+        "INSERT INTO core_brand_fts(rowid, name, category) "
+        "VALUES (new.id, new.name, new.category); END",
+        "INSERT INTO core_brand_fts(core_brand_fts) VALUES ('rebuild')",
+    ],
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX core_brand_search_idx ON core_brand "
+        "USING gin (to_tsvector('simple', name || ' ' || category))",
+        "CREATE INDEX core_brand_name_trgm_idx ON core_brand USING gin (name gin_trgm_ops)",
+    ],
+}
+
+DROP_SEARCH_INDEX_SQL = {
+    "sqlite": [
+        "DROP TRIGGER IF EXISTS core_brand_fts_insert",
+        "DROP TRIGGER IF EXISTS core_brand_fts_delete",
+        "DROP TRIGGER IF EXISTS core_brand_fts_update",
+        "DROP TABLE IF EXISTS core_brand_fts",
+    ],
+    "postgresql": [
+        "DROP INDEX IF EXISTS core_brand_search_idx",
+        "DROP INDEX IF EXISTS core_brand_name_trgm_idx",
+    ],
+}
+
+
+def create_search_index(apps, schema_editor):
+    for sql in SEARCH_INDEX_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    for sql in DROP_SEARCH_INDEX_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_add_gift_card_marketplace_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
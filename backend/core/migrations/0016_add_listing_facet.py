@@ -0,0 +1,63 @@
+# Generated by Django 6.0.2 on 2026-10-17 15:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# core.facets.VALUE_BUCKETS when this migration was written.
+VALUE_BUCKETS = (0, 25, 50, 100, 250, 500)
+
+
+def populate_facets(apps, schema_editor):
+    GiftCard = apps.get_model("core", "GiftCard")
+    ListingFacet = apps.get_model("core", "ListingFacet")
+    bucket = models.Case(
+        *[
+            models.When(value__lt=upper, then=models.Value(lower))
+            for lower, upper in zip(VALUE_BUCKETS, VALUE_BUCKETS[1:])
+        ],
+        default=models.Value(VALUE_BUCKETS[-1]),
+        output_field=models.IntegerField(),
+    )
+    rows = (
+        GiftCard.objects.filter(status="active")
+        .order_by()
+        .annotate(bucket=bucket)
+        .values("brand_id", "listing_type", "bucket")
+        .annotate(total=models.Count("id"))
+    )
+    ListingFacet.objects.bulk_create(
+        [
+            ListingFacet(
+                brand_id=row["brand_id"],
+                listing_type=row["listing_type"],
+                value_bucket=row["bucket"],
+                count=row["total"],
+            )
+            for row in rows
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_add_brand_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_type', models.CharField(choices=[('swap', 'Swap'), ('sell', 'Sell')], max_length=10)),
+                ('value_bucket', models.PositiveIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('brand', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='core.brand')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('brand', 'listing_type', 'value_bucket'), name='unique_listing_facet')],
+            },
+        ),
+        migrations.RunPython(populate_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.2 on 2026-10-17 16:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_add_cache_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VelocityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('bucket', models.BigIntegerField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='velocity_buckets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'name', 'bucket'), name='unique_velocity_bucket')],
+            },
+        ),
+    ]
@@ -3,7 +3,7 @@ import uuid
 from cryptography.fernet import Fernet
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 
@@ -82,47 +82,37 @@ class User(AbstractUser):
     def max_daily_trades(self):
         defaults = {0: 3, 1: 10, 2: 25}
         keys = {0: "max_daily_trades_new", 1: "max_daily_trades_established", 2: "max_daily_trades_trusted"}
+        default = defaults.get(self.trust_tier, 3)
         key = keys.get(self.trust_tier)
-        if key:
-            val = PlatformSettings.get(key)
-            if val is not None:
-                return int(val)
-        return defaults.get(self.trust_tier, 3)
+        return PlatformSettings.get_int(key, default) if key else default
 
     @property
     def max_daily_value(self):
         from decimal import Decimal
         defaults = {0: Decimal("200"), 1: Decimal("500"), 2: Decimal("2000")}
         keys = {0: "max_daily_value_new", 1: "max_daily_value_established", 2: "max_daily_value_trusted"}
+        default = defaults.get(self.trust_tier, Decimal("200"))
         key = keys.get(self.trust_tier)
-        if key:
-            val = PlatformSettings.get(key)
-            if val is not None:
-                return Decimal(val)
-        return defaults.get(self.trust_tier, Decimal("200"))
+        return PlatformSettings.get_decimal(key, default) if key else default
 
     @property
     def max_active_trades(self):
         defaults = {0: 1, 1: 5, 2: 10}
         keys = {0: "max_active_trades_new", 1: "max_active_trades_established", 2: "max_active_trades_trusted"}
+        default = defaults.get(self.trust_tier, 1)
         key = keys.get(self.trust_tier)
-        if key:
-            val = PlatformSettings.get(key)
-            if val is not None:
-                return int(val)
-        return defaults.get(self.trust_tier, 1)
+        return PlatformSettings.get_int(key, default) if key else default
 
     @property
     def reputation(self):
-        total = Trade.objects.filter(
-            models.Q(initiator=self) | models.Q(responder=self)
-        ).exclude(status__in=["proposed", "cancelled"]).count()
-        successful = Trade.objects.filter(
-            (models.Q(initiator=self) | models.Q(responder=self)),
-            status="completed",
-        ).count()
-        disputes = Dispute.objects.filter(raised_by=self).count()
-        return {"total_trades": total, "successful_trades": successful, "disputes": disputes}
+        from core.user_stats import get_stats
+
+        stats = get_stats(self)
+        return {
+            "total_trades": stats.total_trades,
+            "successful_trades": stats.successful_trades,
+            "disputes": stats.disputes_raised,
+        }
 
 
 # ─── Brand ───
@@ -175,12 +165,77 @@ class GiftCard(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Fields whose changes affect marketplace availability and swap matching.
+    LISTING_FIELDS = ("owner_id", "brand_id", "value", "listing_type", "status", "expiry_date")
+    # LISTING_FIELDS plus what only the marketplace listings show.
+    MARKETPLACE_FIELDS = LISTING_FIELDS + ("selling_price",)
+
     class Meta:
         ordering = ["-created_at"]
+        # Marketplace access paths: only active cards are listed, filtered
+        # by brand or value range and ordered by any of the sortable
+        # columns (plus id, for keyset pages).  Partial on backends that
+        # support it, so the indexes stay small and are skipped elsewhere.
+        indexes = [
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(status="active"),
+                name="giftcard_active_created_idx",
+            ),
+            models.Index(
+                fields=["value", "id"],
+                condition=models.Q(status="active"),
+                name="giftcard_active_value_idx",
+            ),
+            models.Index(
+                fields=["selling_price", "id"],
+                condition=models.Q(status="active"),
+                name="giftcard_active_price_idx",
+            ),
+            models.Index(
+                fields=["expiry_date", "id"],
+                condition=models.Q(status="active"),
+                name="giftcard_active_expiry_idx",
+            ),
+            models.Index(
+                fields=["brand", "created_at"],
+                condition=models.Q(status="active"),
+                name="giftcard_active_brand_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.brand.name} ${self.value} ({self.get_listing_type_display()})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_listing = instance.listing_state()
+        return instance
+
+    def listing_state(self):
+        """Current values of MARKETPLACE_FIELDS (deferred fields are reported as None)."""
+        return {field: self.__dict__.get(field) for field in self.MARKETPLACE_FIELDS}
+
+    def listing_changed(self, fields=LISTING_FIELDS):
+        """True if ``fields`` differ from when the card was loaded (or it is new)."""
+        loaded = getattr(self, "_loaded_listing", None)
+        if loaded is None:
+            return True
+        return any(loaded.get(field) != self.__dict__.get(field) for field in fields)
+
+    def save(self, *args, **kwargs):
+        # Signal handlers update ListingFacet counts in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @property
+    def is_swap_listing(self):
+        return (
+            self.status == self.Status.ACTIVE
+            and self.listing_type == self.ListingType.SWAP
+        )
+
     def set_card_number(self, raw_value):
         self.card_number_encrypted = encrypt_value(raw_value)
 
@@ -198,6 +253,35 @@ class GiftCard(models.Model):
         return self.expiry_date < timezone.now().date()
 
 
+# ─── Listing Facet (Denormalized Marketplace Counts) ───
+class ListingFacet(models.Model):
+    """
+    Number of active gift cards per brand, listing type and value bucket,
+    so the marketplace's filter sidebar sums a few hundred rows instead of
+    grouping every listing.
+
+    Kept in step with gift cards by ``core.facets`` inside the transaction
+    that changes them; the ``reconcile_listing_facets`` command (run
+    periodically) repairs any drift.
+    """
+
+    brand = models.ForeignKey(Brand, on_delete=models.CASCADE, related_name="facets")
+    listing_type = models.CharField(max_length=10, choices=GiftCard.ListingType.choices)
+    value_bucket = models.PositiveIntegerField()  # Lower bound, see core.facets.VALUE_BUCKETS
+    # Signed so a drifted count can't fail the save that decrements it.
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["brand", "listing_type", "value_bucket"], name="unique_listing_facet"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.brand_id}/{self.listing_type}/{self.value_bucket}+: {self.count}"
+
+
 # ─── Trade (Two-Party Swap) ───
 class Trade(models.Model):
     class Status(models.TextChoices):
@@ -237,22 +321,93 @@ class Trade(models.Model):
     class Meta:
         ordering = ["-created_at"]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.trade_id:
             self.trade_id = f"TRD-{uuid.uuid4().hex[:8].upper()}"
-        super().save(*args, **kwargs)
+        # Signal handlers update UserStats in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.trade_id} – {self.initiator.username} ↔ {self.responder.username}"
 
     def calculate_fees(self):
         from decimal import Decimal
-        raw = PlatformSettings.get("fee_percentage", "5")
-        fee_pct = Decimal(raw) / Decimal("100")
+        fee_pct = PlatformSettings.get_decimal("fee_percentage", Decimal("5")) / Decimal("100")
         self.platform_fee_initiator = self.initiator_card.value * fee_pct
         self.platform_fee_responder = self.responder_card.value * fee_pct
 
 
+# ─── Match Candidate (Precomputed Swap Suggestions) ───
+class MatchCandidate(models.Model):
+    """
+    One entry in a user's ranked top-K list of swap partners.
+
+    Maintained incrementally by ``core.match_index`` as listings change,
+    and rebuilt in full by the ``rebuild_match_index`` and nightly
+    ``compute_matches`` commands.  ``is_notified`` records that the user
+    was already sent a MATCH notification for this pair.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="match_candidates"
+    )
+    user_card = models.ForeignKey(GiftCard, on_delete=models.CASCADE, related_name="+")
+    suggested_card = models.ForeignKey(GiftCard, on_delete=models.CASCADE, related_name="+")
+    score = models.PositiveSmallIntegerField()
+    is_notified = models.BooleanField(default=False)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-score", "id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user_card", "suggested_card"], name="unique_match_candidate_pair"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-score", "id"]),
+        ]
+
+    def __str__(self):
+        return f"Match {self.user_card_id} ↔ {self.suggested_card_id} ({self.score})"
+
+
+# ─── User Stats (Denormalized Counters) ───
+class UserStats(models.Model):
+    """
+    Per-user trade, sale and dispute counters, so reputation, trust tiers
+    and trade limits are one primary-key lookup instead of several COUNTs.
+
+    Kept in step with trades, sales and disputes by ``core.user_stats``
+    inside the transaction that changes them; the ``reconcile_user_stats``
+    command verifies (and with ``--fix`` repairs) the counters.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    total_trades = models.PositiveIntegerField(default=0)  # Past the proposal, not cancelled
+    successful_trades = models.PositiveIntegerField(default=0)
+    active_trades = models.PositiveIntegerField(default=0)
+    disputes_raised = models.PositiveIntegerField(default=0)
+    completed_sales = models.PositiveIntegerField(default=0)  # As the seller
+    earnings = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "User Stats"
+
+    def __str__(self):
+        return f"Stats for {self.user_id}"
+
+
 # ─── Sale (One-Way Purchase) ───
 class Sale(models.Model):
     class Status(models.TextChoices):
@@ -281,15 +436,22 @@ class Sale(models.Model):
     class Meta:
         ordering = ["-created_at"]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.sale_id:
             self.sale_id = f"SAL-{uuid.uuid4().hex[:8].upper()}"
         if not self.platform_fee:
             from decimal import Decimal
-            raw = PlatformSettings.get("fee_percentage", "5")
-            fee_pct = Decimal(raw) / Decimal("100")
+            fee_pct = PlatformSettings.get_decimal("fee_percentage", Decimal("5")) / Decimal("100")
             self.platform_fee = self.amount * fee_pct
-        super().save(*args, **kwargs)
+        # Signal handlers update UserStats in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.sale_id} – {self.gift_card.brand.name} ${self.gift_card.value}"
@@ -313,6 +475,10 @@ class EscrowSession(models.Model):
 
     class Meta:
         ordering = ["-locked_at"]
+        indexes = [
+            # Upcoming deadlines, for auto-finalization.
+            models.Index(fields=["confirmation_deadline"]),
+        ]
 
     def __str__(self):
         return f"Escrow for {self.trade.trade_id} ({self.get_status_display()})"
@@ -400,6 +566,11 @@ class Dispute(models.Model):
     class Meta:
         ordering = ["-created_at"]
 
+    def save(self, *args, **kwargs):
+        # Signal handlers update UserStats in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         ref = self.trade.trade_id if self.trade else self.sale.sale_id if self.sale else "N/A"
         return f"Dispute #{self.pk} – {ref}"
@@ -473,6 +644,9 @@ class FraudFlag(models.Model):
         REPEATED_DISPUTES = "repeated_disputes", "Repeated Disputes"
         MULTI_IP = "multi_ip", "Multiple IPs"
         ABNORMAL_VALUE = "abnormal_value", "Abnormal Value"
+        COLLUSION_RING = "collusion_ring", "Collusion Ring"
+        STATISTICAL_ANOMALY = "statistical_anomaly", "Statistical Anomaly"
+        VALUE_VELOCITY = "value_velocity", "Value Velocity"
 
     class Status(models.TextChoices):
         PENDING = "pending", "Pending Review"
@@ -505,6 +679,92 @@ class FraudFlag(models.Model):
         return f"Flag: {self.get_flag_type_display()} – {self.user.username}"
 
 
+# ─── Fraud Scan Run (Watermarks) ───
+class FraudScanRun(models.Model):
+    """
+    One ``check_fraud_flags`` run.
+
+    ``watermark`` is the time the run started: trades, disputes and sales
+    created before it have been scanned, so the next incremental run only
+    needs to look at users with activity after it.
+    """
+
+    is_full = models.BooleanField(default=False)
+    watermark = models.DateTimeField()
+    users_scanned = models.PositiveIntegerField(default=0)
+    flags_created = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-watermark"]
+
+    def __str__(self):
+        kind = "Full" if self.is_full else "Incremental"
+        return f"{kind} fraud scan at {self.watermark:%Y-%m-%d %H:%M}"
+
+
+# ─── Login IP Bucket ───
+class LoginIPBucket(models.Model):
+    """
+    The distinct IPs a user logged in or refreshed a token from during one
+    time bucket (see ``core.ip_tracking``).
+
+    ``ips`` holds the exact addresses while there are few of them; past
+    that, ``sketch`` holds a HyperLogLog sketch and ``ips`` is emptied.
+    ``ip_count`` is the bucket's distinct count (estimated once sketched)
+    and ``updated_at`` the last time a new address was added.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="login_ip_buckets"
+    )
+    bucket_start = models.DateTimeField()
+    ips = models.JSONField(default=list, blank=True)
+    sketch = models.BinaryField(null=True, blank=True)
+    ip_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["-bucket_start"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "bucket_start"], name="unique_login_ip_bucket"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["updated_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user} logins at {self.bucket_start:%Y-%m-%d %H:%M}"
+
+
+# ─── Velocity Bucket ───
+class VelocityBucket(models.Model):
+    """
+    One time bucket of a user's sliding-window velocity counter (see
+    ``core.velocity``): ``count`` events (or cents) recorded for counter
+    ``name`` during bucket number ``bucket``.
+    """
+
+    name = models.CharField(max_length=50)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="velocity_buckets"
+    )
+    bucket = models.BigIntegerField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "name", "bucket"], name="unique_velocity_bucket"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} for {self.user_id} in bucket {self.bucket}: {self.count}"
+
+
 # ─── Fraud Report (User-submitted) ───
 class FraudReport(models.Model):
     class ReportType(models.TextChoices):
@@ -627,13 +887,46 @@ class PlatformSettings(models.Model):
     def __str__(self):
         return f"{self.key} = {self.value}"
 
+    # Reads go through the in-process cache in ``core.settings_cache``.
+
     @classmethod
     def get(cls, key, default=None):
         """Retrieve a setting value by key, with an optional default."""
-        try:
-            return cls.objects.values_list("value", flat=True).get(key=key)
-        except cls.DoesNotExist:
-            return default
+        from core import settings_cache
+
+        return settings_cache.get(key, default)
+
+    @classmethod
+    def get_int(cls, key, default=None):
+        from core import settings_cache
+
+        return settings_cache.get_int(key, default)
+
+    @classmethod
+    def get_decimal(cls, key, default=None):
+        from core import settings_cache
+
+        return settings_cache.get_decimal(key, default)
+
+    @classmethod
+    def get_bool(cls, key, default=None):
+        from core import settings_cache
+
+        return settings_cache.get_bool(key, default)
+
+
+# ─── Cache Version (Shared Counters) ───
+class CacheVersion(models.Model):
+    """
+    A named counter that in-process caches compare against to notice
+    changes made by other processes (see ``core.versions``).
+    """
+
+    name = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.version}"
 
 
 # ─── Notification Rule ───
@@ -666,3 +959,44 @@ class NotificationRule(models.Model):
 
     def __str__(self):
         return self.name
+
+
+# ─── Background Job ───
+class Job(models.Model):
+    """
+    One unit of background work (see ``core.jobs``).
+
+    ``task`` is the dotted path of the function to call with ``kwargs``.
+    Workers claim ``queued`` jobs whose ``run_after`` has passed; a failed
+    attempt is re-queued with backoff until ``max_attempts`` is reached.
+    ``key`` is optional and unique, so a job enqueued under the same key
+    twice (e.g. one periodic run per time slot) is only stored once.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    task = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["run_after"]
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
+
+    def __str__(self):
+        return f"{self.task} ({self.get_status_display()})"
@@ -0,0 +1,237 @@
+"""
+Brand search.
+
+``search_brands()`` returns active brands ranked by relevance from a
+full-text index, instead of the ``ILIKE '%q%'`` scans the search filters
+ran.  The index depends on the database (see ``BACKENDS``; migration
+0015 creates it):
+
+- SQLite: an FTS5 table over brand name and category, kept in sync with
+  ``core_brand`` by triggers, ranked by BM25 with the name weighted
+  above the category.
+- PostgreSQL: GIN indexes on a ``tsvector`` of name and category and on
+  the name's trigrams (``pg_trgm``), ranked by ``ts_rank`` plus trigram
+  similarity, so misspelt names still match.
+- Anything else: ``icontains`` (no index).
+
+``SEARCH_BACKEND`` (a dotted path) replaces the backend.  Every term is
+matched as a prefix, so results follow what is being typed.
+
+``autocomplete()`` answers prefix queries from an in-process trie of
+brand names, with no query at all.  The trie is rebuilt when a brand is
+saved or deleted: ``core.signals`` bumps the shared ``search:brands``
+version (see ``core.versions``), which every process checks at most every
+``VERSION_CHECK_SECONDS``, as in ``core.settings_cache``.
+"""
+
+import heapq
+import re
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from core.models import Brand
+from core.versions import SharedVersion
+
+SEARCH_BACKEND = getattr(settings, "SEARCH_BACKEND", None)
+# Most brands a search resolves to (marketplace searches filter cards by them).
+MAX_BRAND_RESULTS = 500
+# Suggestions kept per trie node, so the most autocomplete can return.
+AUTOCOMPLETE_SIZE = 10
+
+_TERM = re.compile(r"\w+")
+
+
+def terms(query):
+    """The lower-cased words of ``query``, which is never passed on raw."""
+    return _TERM.findall(query.lower())
+
+
+# ─── Full-text Backends ───
+
+
+class SearchBackend:
+    def search(self, words, limit):
+        """Ids of active brands matching every word (as a prefix), best first."""
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(SearchBackend):
+    table = "core_brand_fts"
+
+    def search(self, words, limit):
+        match = " ".join(f'"{word}"*' for word in words)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT b.id FROM {self.table} f "
+                f"JOIN core_brand b ON b.id = f.rowid "
+                f"WHERE {self.table} MATCH %s AND b.is_active "
+                f"ORDER BY bm25({self.table}, 10.0, 1.0), b.is_popular DESC, b.name "
+                f"LIMIT %s",
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(SearchBackend):
+    # Must match the expression indexed by migration 0015.
+    document = "to_tsvector('simple', name || ' ' || category)"
+
+    def search(self, words, limit):
+        tsquery = " & ".join(f"{word}:*" for word in words)
+        text = " ".join(words)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id FROM core_brand "
+                f"WHERE is_active AND ({self.document} @@ to_tsquery('simple', %s) OR name %% %s) "
+                f"ORDER BY ts_rank({self.document}, to_tsquery('simple', %s)) "
+                f"+ similarity(name, %s) DESC, is_popular DESC, name "
+                f"LIMIT %s",
+                [tsquery, text, tsquery, text, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SubstringSearchBackend(SearchBackend):
+    def search(self, words, limit):
+        brands = Brand.objects.filter(is_active=True)
+        for word in words:
+            brands = brands.filter(Q(name__icontains=word) | Q(category__icontains=word))
+        return list(brands.order_by("-is_popular", "name").values_list("pk", flat=True)[:limit])
+
+
+BACKENDS = {
+    "sqlite": SQLiteSearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def get_backend():
+    if SEARCH_BACKEND:
+        return import_string(SEARCH_BACKEND)()
+    return BACKENDS.get(connection.vendor, SubstringSearchBackend)()
+
+
+def search_brands(query, limit=MAX_BRAND_RESULTS):
+    """Ids of the active brands matching ``query``, most relevant first."""
+    words = terms(query)
+    if not words:
+        return []
+    return get_backend().search(words, limit)
+
+
+# ─── Autocomplete ───
+
+
+class _Node:
+    __slots__ = ("children", "top", "bucket")
+
+    def __init__(self):
+        self.children = {}
+        self.top = ()
+        self.bucket = None
+
+
+class BrandTrie:
+    """
+    Prefix trie over brand names.  Each name is indexed whole and from
+    each later word ("home depot" also under "depot"), and every node
+    keeps the ``size`` best brands below it, so a lookup walks the prefix
+    and returns that list as is.  Subtrees with at most ``bucket_size``
+    keys are kept as one sorted bucket and filtered at lookup, which keeps
+    the node count (and memory) a fraction of the indexed characters.
+
+    Brands rank popular first, then by name.
+    """
+
+    def __init__(self, brands, size=AUTOCOMPLETE_SIZE, bucket_size=16):
+        self.size = size
+        self.bucket_size = bucket_size
+        # Position in this list is the brand's rank.
+        self.brands = sorted(brands, key=lambda brand: (not brand["is_popular"], brand["name"].lower()))
+        keys = []
+        for rank, brand in enumerate(self.brands):
+            words = terms(brand["name"])
+            for start in range(len(words)):
+                keys.append((" ".join(words[start:]), rank))
+        keys.sort()
+        self.root = self._build(keys, 0)
+
+    def _best(self, ranks):
+        return tuple(heapq.nsmallest(self.size, set(ranks)))
+
+    def _build(self, keys, depth):
+        node = _Node()
+        node.top = self._best(rank for _, rank in keys)
+        if len(keys) <= self.bucket_size:
+            node.bucket = keys
+            return node
+        # ``keys`` is sorted, so each child's keys are a contiguous run.
+        start = 0
+        while start < len(keys) and len(keys[start][0]) == depth:
+            start += 1
+        while start < len(keys):
+            char = keys[start][0][depth]
+            end = start
+            while end < len(keys) and keys[end][0][depth] == char:
+                end += 1
+            node.children[char] = self._build(keys[start:end], depth + 1)
+            start = end
+        return node
+
+    def lookup(self, prefix):
+        """The best brands (dicts) whose name or a later word starts with ``prefix``."""
+        prefix = " ".join(terms(prefix))
+        if not prefix:
+            return []
+        node = self.root
+        for char in prefix:
+            if node.bucket is not None:
+                ranks = self._best(rank for key, rank in node.bucket if key.startswith(prefix))
+                return [self.brands[rank] for rank in ranks]
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return [self.brands[rank] for rank in node.top]
+
+
+VERSION_CHECK_SECONDS = 1.0
+
+_lock = threading.Lock()
+_shared_version = SharedVersion("search:brands", VERSION_CHECK_SECONDS)
+# ``(version, BrandTrie)``
+_loaded = None
+
+
+def _load():
+    return BrandTrie(
+        Brand.objects.filter(is_active=True).values("id", "name", "category", "is_popular")
+    )
+
+
+def brand_trie():
+    """This process's trie, rebuilt if a brand changed since it was built."""
+    global _loaded
+    version = _shared_version.get()
+    loaded = _loaded
+    if loaded is not None and loaded[0] == version:
+        return loaded[1]
+    with _lock:
+        if _loaded is None or _loaded[0] != version:
+            _loaded = (version, _load())
+        return _loaded[1]
+
+
+def autocomplete(prefix):
+    return brand_trie().lookup(prefix)
+
+
+def brands_changed():
+    """Drop this process's trie and tell other processes to rebuild theirs."""
+    global _loaded
+    with _lock:
+        _loaded = None
+    _shared_version.bump()
@@ -0,0 +1,95 @@
+"""
+In-process cache of ``PlatformSettings``.
+
+All settings rows are loaded into a dict the first time one is read, and
+reads after that are plain dict lookups with no queries.  Edits bump the
+shared ``platform_settings`` version (``core.signals`` calls
+``invalidate()`` once the edit commits); each process reads the version
+at most every ``VERSION_CHECK_SECONDS`` (see ``core.versions``) and
+reloads when it moved.  The process that made the edit reloads straight
+away.
+"""
+
+import logging
+import threading
+from decimal import Decimal, InvalidOperation
+
+from core.versions import SharedVersion
+
+logger = logging.getLogger("core")
+
+VERSION_CHECK_SECONDS = 1.0
+
+_TRUE_VALUES = {"1", "true", "yes", "on"}
+_FALSE_VALUES = {"0", "false", "no", "off"}
+
+_lock = threading.Lock()
+_shared_version = SharedVersion("platform_settings", VERSION_CHECK_SECONDS)
+# ``(version, {key: value})``
+_loaded = None
+
+
+def _load():
+    from core.models import PlatformSettings
+
+    return dict(PlatformSettings.objects.values_list("key", "value"))
+
+
+def all_settings():
+    """``{key: raw value}`` for every setting, reloaded if any process changed one."""
+    global _loaded
+    version = _shared_version.get()
+    loaded = _loaded
+    if loaded is not None and loaded[0] == version:
+        return loaded[1]
+    with _lock:
+        if _loaded is None or _loaded[0] != version:
+            _loaded = (version, _load())
+        return _loaded[1]
+
+
+def invalidate():
+    """Drop this process's copy and tell other processes to reload theirs."""
+    global _loaded
+    with _lock:
+        _loaded = None
+    _shared_version.bump()
+
+
+# ─── Typed Accessors ───
+
+
+def get(key, default=None):
+    return all_settings().get(key, default)
+
+
+def _parse(key, default, parse):
+    raw = all_settings().get(key)
+    if raw is None:
+        return default
+    try:
+        return parse(raw.strip())
+    except (ValueError, InvalidOperation):
+        logger.warning("Platform setting %s has an invalid value %r", key, raw)
+        return default
+
+
+def get_int(key, default=None):
+    return _parse(key, default, int)
+
+
+def get_decimal(key, default=None):
+    return _parse(key, default, Decimal)
+
+
+def _to_bool(raw):
+    value = raw.lower()
+    if value in _TRUE_VALUES:
+        return True
+    if value in _FALSE_VALUES:
+        return False
+    raise ValueError(raw)
+
+
+def get_bool(key, default=None):
+    return _parse(key, default, _to_bool)
@@ -0,0 +1,112 @@
+"""
+Model signal handlers that keep derived data in sync with gift cards,
+brands, trades, sales, disputes and platform settings.
+
+Match index maintenance (re-indexing a saved card, re-ranking the users
+affected by a deleted card or a completed trade) runs as background jobs,
+queued in the saving transaction (see ``core.jobs``), so a request never
+loads the marketplace snapshot.  ``UserStats`` and ``ListingFacet``
+handlers run inside the saving transaction, so the counters commit or
+roll back with the change.  Bulk ``QuerySet.update()`` calls bypass these
+signals; callers that change rows that way notify ``core.match_index``,
+``core.user_stats``, ``core.facets`` and ``core.listing_cache`` directly.
+"""
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core import facets, jobs, listing_cache, search, settings_cache, user_stats
+from core.models import Brand, Dispute, GiftCard, MatchCandidate, PlatformSettings, Sale, Trade
+
+@receiver(post_save, sender=GiftCard)
+def reindex_gift_card(sender, instance, created, raw=False, **kwargs):
+    if raw or not instance.listing_changed(GiftCard.MARKETPLACE_FIELDS):
+        return
+    reindex = instance.listing_changed()
+    facets.card_changed(instance, None if created else getattr(instance, "_loaded_listing", None))
+    instance._loaded_listing = instance.listing_state()
+    transaction.on_commit(listing_cache.bump)
+    if reindex:
+        jobs.enqueue("core.match_index.refresh_cards", {"card_ids": [instance.pk]})
+
+
+@receiver(post_delete, sender=GiftCard)
+def gift_card_deleted(sender, instance, **kwargs):
+    facets.card_deleted(instance)
+
+
+@receiver(pre_delete, sender=GiftCard)
+def unindex_gift_card(sender, instance, **kwargs):
+    transaction.on_commit(listing_cache.bump)
+    # Rows referencing the card are removed by the cascade; re-rank the
+    # users who lose an entry in the background.
+    affected = set(
+        MatchCandidate.objects.filter(
+            Q(user_card=instance) | Q(suggested_card=instance)
+        ).values_list("user_id", flat=True)
+    )
+    if affected:
+        jobs.enqueue("core.match_index.rebuild_users", {"user_ids": sorted(affected)})
+
+
+@receiver(post_save, sender=Trade)
+def trade_saved(sender, instance, created, raw=False, **kwargs):
+    loaded_status = None if created else getattr(instance, "_loaded_status", None)
+    instance._loaded_status = instance.status
+    if raw or loaded_status == instance.status:
+        return
+    user_stats.trade_changed(instance, loaded_status)
+    if instance.status == Trade.Status.COMPLETED:
+        # Both parties' brand history changed.
+        jobs.enqueue(
+            "core.match_index.rebuild_users",
+            {"user_ids": [instance.initiator_id, instance.responder_id]},
+        )
+
+
+@receiver(post_delete, sender=Trade)
+def trade_deleted(sender, instance, **kwargs):
+    user_stats.trade_deleted(instance)
+
+
+@receiver(post_save, sender=Sale)
+def sale_saved(sender, instance, created, raw=False, **kwargs):
+    loaded_status = None if created else getattr(instance, "_loaded_status", None)
+    instance._loaded_status = instance.status
+    if raw or loaded_status == instance.status:
+        return
+    user_stats.sale_changed(instance, loaded_status)
+
+
+@receiver(post_delete, sender=Sale)
+def sale_deleted(sender, instance, **kwargs):
+    user_stats.sale_deleted(instance)
+
+
+@receiver(post_save, sender=Dispute)
+def dispute_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        user_stats.dispute_created(instance)
+
+
+@receiver(post_delete, sender=Dispute)
+def dispute_deleted(sender, instance, **kwargs):
+    user_stats.dispute_deleted(instance)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def brand_changed(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(listing_cache.bump)
+        transaction.on_commit(search.brands_changed)
+
+
+@receiver(post_save, sender=PlatformSettings)
+@receiver(post_delete, sender=PlatformSettings)
+def platform_settings_changed(sender, **kwargs):
+    # Published after commit so no process reloads the old rows under the
+    # new version.
+    transaction.on_commit(settings_cache.invalidate)
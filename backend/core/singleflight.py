@@ -0,0 +1,171 @@
+"""
+Single-flight request coalescing.
+
+Concurrent calls for the same key share one computation instead of each
+running it:
+
+- Within a process, the first thread becomes the leader and runs the
+  function; other threads asking for the same key wait for its result,
+  for at most ``wait_timeout`` seconds before computing it themselves.
+- Across processes, when the default cache is shared between them (not
+  ``LocMemCache`` or ``DummyCache``), the leader also takes a short lock
+  in the cache (``cache.add``).  A leader in another process that finds
+  the lock held polls the cache for the result published under that
+  lock's token, and only computes on its own if the lock disappears
+  without a result or the wait times out.
+
+Results are shared only with calls that overlap the computation; nothing
+is served after it finishes, so this never returns stale data the way a
+response cache would.  Results must be picklable to cross processes.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger("core")
+
+_MISSING = object()
+
+
+def _cache_is_shared():
+    """True unless the default cache lives in this process (or nowhere)."""
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    A named group of coalesced computations.
+
+    ``counters`` (see ``stats()``) track how calls were served in this
+    process: ``executions`` ran the function, ``coalesced`` took another
+    thread's result, ``remote_hits`` took the result another process
+    computed, and ``fallbacks`` waited on another thread or process but
+    had to compute themselves.
+
+    ``shared`` turns the cross-process path on or off; by default it is on
+    when the default cache is shared between processes.
+    """
+
+    registry = {}
+
+    def __init__(self, name, lock_timeout=30, wait_timeout=10.0, poll_interval=0.05, shared=None):
+        self.name = name
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.counters = {"executions": 0, "coalesced": 0, "remote_hits": 0, "fallbacks": 0}
+        SingleFlight.registry[name] = self
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        calls = sum(counters.values())
+        shared = counters["coalesced"] + counters["remote_hits"]
+        counters["calls"] = calls
+        counters["hit_rate"] = round(shared / calls, 4) if calls else 0.0
+        return counters
+
+    def do(self, key, fn):
+        """Return ``fn()``, sharing one computation among concurrent callers of ``key``."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(self.wait_timeout):
+                logger.warning("Single-flight %s: leader still running, computing directly", self.name)
+                self._count("fallbacks")
+                return fn()
+            self._count("coalesced")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            shared = _cache_is_shared() if self.shared is None else self.shared
+            call.result = self._do_shared(key, fn) if shared else self._execute(fn)
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    # ─── Cross-process ───
+
+    def _cache_key(self, key, suffix):
+        digest = hashlib.sha1(str(key).encode()).hexdigest()
+        return f"singleflight:{self.name}:{digest}:{suffix}"
+
+    def _do_shared(self, key, fn):
+        lock_key = self._cache_key(key, "lock")
+        token = uuid.uuid4().hex
+        try:
+            acquired = cache.add(lock_key, token, timeout=self.lock_timeout)
+        except Exception as exc:
+            logger.warning("Single-flight lock unavailable for %s: %s", self.name, exc)
+            return self._execute(fn)
+
+        if acquired:
+            try:
+                result = self._execute(fn)
+                cache.set(self._cache_key(key, token), result, timeout=self.lock_timeout)
+                return result
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        result = self._wait_for_remote(key, lock_key)
+        if result is not _MISSING:
+            self._count("remote_hits")
+            return result
+        self._count("fallbacks")
+        return fn()
+
+    def _execute(self, fn):
+        self._count("executions")
+        return fn()
+
+    def _wait_for_remote(self, key, lock_key):
+        """Poll for the result of the flight holding ``lock_key``."""
+        deadline = time.monotonic() + self.wait_timeout
+        token = None
+        while time.monotonic() < deadline:
+            current = cache.get(lock_key)
+            if current is not None:
+                token = current
+            if token is not None:
+                # The leader publishes before releasing, so check once more
+                # after the lock is gone.
+                result = cache.get(self._cache_key(key, token), _MISSING)
+                if result is not _MISSING:
+                    return result
+            if current is None:
+                break
+            time.sleep(self.poll_interval)
+        return _MISSING
@@ -0,0 +1,248 @@
+"""
+Multi-party swap cycles (3- and 4-way swaps).
+
+Two-party swaps need both owners to want each other's card.  A cycle
+relaxes that: A's owner receives B, B's owner receives C, C's owner
+receives A, and everybody gets a card they want.
+
+The "wants" graph has one node per active swap listing and an edge
+``A -> B`` when A's owner would give A for B:
+
+- different owners,
+- value similarity of (A, B) of at least ``MIN_VALUE_SCORE``, and
+- a brand preference: B's brand was received by A's owner in a completed
+  trade, or B shares A's (non-blank) category.
+
+Candidate edges come from value-sorted indexes grouped by category and by
+brand, so each node only looks at listings in its value window.  Each node
+keeps its ``MAX_OUT_DEGREE`` best edges, computed lazily, and cycles are
+found by a depth-bounded search from the starting cards.
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+from django.db import connection
+
+from core.matching import (
+    _NO_CATEGORY,
+    SwapListingSnapshot,
+    _get_received_brand_ids_by_user,
+    _value_similarity,
+)
+
+MIN_VALUE_SCORE = 30
+MAX_OUT_DEGREE = 12
+MAX_CYCLE_LENGTH = 4
+
+# Window level (see ``core.matching``) that holds every pair scoring at
+# least ``MIN_VALUE_SCORE`` value points.
+_WINDOW_REACH_PERCENT = 101 - 2 * MIN_VALUE_SCORE
+
+logger = logging.getLogger("core")
+
+
+class _GroupedValueIndex:
+    """Row positions sorted by (group key, value) for per-group range lookups."""
+
+    def __init__(self, keys, values):
+        self.order = np.lexsort((values, keys))
+        self.keys = keys[self.order]
+        self.values = values[self.order]
+
+    def rows_in_range(self, key, low, high):
+        group_start = np.searchsorted(self.keys, key, side="left")
+        group_stop = np.searchsorted(self.keys, key, side="right")
+        values = self.values[group_start:group_stop]
+        start = group_start + np.searchsorted(values, low, side="left")
+        stop = group_start + np.searchsorted(values, high, side="right")
+        return self.order[start:stop]
+
+
+class WantsGraph:
+    """Lazily built, degree-bounded "wants" graph over a listing snapshot."""
+
+    def __init__(self, snapshot, received_by_user, max_out_degree=MAX_OUT_DEGREE):
+        self.snapshot = snapshot
+        self.received_by_user = received_by_user
+        self.max_out_degree = max_out_degree
+        self.by_category = _GroupedValueIndex(snapshot.categories, snapshot.value_cents)
+        self.by_brand = _GroupedValueIndex(snapshot.brand_ids, snapshot.value_cents)
+        self._edges = {}
+        self._edges_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, **kwargs):
+        return cls(SwapListingSnapshot.load(), _get_received_brand_ids_by_user(), **kwargs)
+
+    def neighbors(self, row):
+        """Rows ``row``'s owner would accept in exchange, best first."""
+        edges = self._edges.get(row)
+        if edges is None:
+            # Computed outside the lock; a thread that lost the race uses
+            # the first result, so every caller sees the same edges.
+            edges = self._compute_neighbors(row)
+            with self._edges_lock:
+                edges = self._edges.setdefault(row, edges)
+        return edges
+
+    def _compute_neighbors(self, row):
+        snapshot = self.snapshot
+        owner = int(snapshot.owner_ids[row])
+        cents = int(snapshot.value_cents[row])
+        reach = _WINDOW_REACH_PERCENT * cents // 100
+        low, high = cents - reach, cents + reach
+
+        received = self.received_by_user.get(owner, ())
+        category = int(snapshot.categories[row])
+        candidates = []
+        if category != _NO_CATEGORY:
+            candidates.append(self.by_category.rows_in_range(category, low, high))
+        for brand_id in received:
+            rows = self.by_brand.rows_in_range(brand_id, low, high)
+            if category != _NO_CATEGORY:
+                # Same-category rows are already in the category window.
+                rows = rows[snapshot.categories[rows] != category]
+            candidates.append(rows)
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.concatenate(candidates)
+        rows = rows[snapshot.owner_ids[rows] != owner]
+        value_scores = _value_similarity(cents, snapshot.value_cents[rows])
+        keep = value_scores >= MIN_VALUE_SCORE
+        rows, value_scores = rows[keep], value_scores[keep]
+
+        brand_scores = np.where(np.isin(snapshot.brand_ids[rows], list(received)), 20, 10)
+        weights = value_scores + brand_scores + snapshot.reputation_scores[rows]
+        # Best edges first; ties by row so the graph is deterministic.
+        keys = weights * len(snapshot) + (len(snapshot) - 1 - rows)
+        if len(keys) > self.max_out_degree:
+            best = np.argpartition(-keys, self.max_out_degree - 1)[:self.max_out_degree]
+            rows, keys = rows[best], keys[best]
+        return rows[np.argsort(-keys)]
+
+    def hop_score(self, giver_row, receiver_row):
+        """Value similarity (0-40) of giving ``giver_row`` for ``receiver_row``."""
+        values = self.snapshot.value_cents
+        return int(_value_similarity(values[giver_row], values[receiver_row]))
+
+
+def _search(graph, start, max_length, min_row, found):
+    """Depth-bounded search for cycles through ``start``; appends row tuples."""
+    owners = graph.snapshot.owner_ids
+    path = [start]
+    path_owners = {int(owners[start])}
+
+    def extend(row):
+        next_rows = graph.neighbors(row)
+        if len(path) >= 3 and start in next_rows:
+            found.append(tuple(path))
+        if len(path) == max_length:
+            return
+        for next_row in next_rows.tolist():
+            owner = int(owners[next_row])
+            if next_row <= min_row or owner in path_owners:
+                continue
+            path.append(next_row)
+            path_owners.add(owner)
+            extend(next_row)
+            path.pop()
+            path_owners.discard(owner)
+
+    extend(start)
+
+
+def _rank(graph, cycles, limit=None):
+    """Score cycles by value similarity and return them best first."""
+    ranked = []
+    for cycle in cycles:
+        hops = [
+            graph.hop_score(giver, cycle[(i + 1) % len(cycle)])
+            for i, giver in enumerate(cycle)
+        ]
+        # Mean hop similarity on a 0-100 scale; the weakest hop breaks ties.
+        score = round(sum(hops) * 100 / (40 * len(hops)))
+        ranked.append((score, min(hops), cycle))
+    ranked.sort(key=lambda item: (-item[0], -item[1], len(item[2]), item[2]))
+    return ranked[:limit] if limit is not None else ranked
+
+
+def find_user_cycles(graph, user_id, max_length=MAX_CYCLE_LENGTH, limit=10):
+    """
+    Best swap cycles that include one of ``user_id``'s listings.
+
+    Returns ``(score, weakest_hop, rows)`` tuples where ``rows`` starts with
+    the user's card and each owner receives the next row's card.
+    """
+    found = []
+    for start in np.flatnonzero(graph.snapshot.owner_ids == user_id).tolist():
+        _search(graph, start, max_length, -1, found)
+    return _rank(graph, found, limit)
+
+
+def find_all_cycles(graph, max_length=MAX_CYCLE_LENGTH, start_rows=None):
+    """
+    Every cycle of length 3..``max_length`` in the graph, each reported once.
+
+    A cycle is only reported from its lowest row, so searches never walk
+    into rows below their start.
+    """
+    if start_rows is None:
+        start_rows = range(len(graph.snapshot))
+    found = []
+    for start in start_rows:
+        _search(graph, start, max_length, start, found)
+    return found
+
+
+# ─── Shared Graph ───
+#
+# Building the graph costs one snapshot load.  Requests share one graph
+# (and its memoized edges); once it is ``GRAPH_TTL_SECONDS`` old, a
+# background thread builds the next one and swaps it in when it is ready,
+# while requests keep using the old one.  Only a process's first request
+# waits for a build.
+
+GRAPH_TTL_SECONDS = 60
+
+_graph_lock = threading.Lock()
+_shared_graph = None
+_shared_graph_loaded_at = 0.0
+_refresh_thread = None
+
+
+def _refresh_shared_graph():
+    global _shared_graph, _shared_graph_loaded_at, _refresh_thread
+    try:
+        graph = WantsGraph.load()
+    except Exception:
+        logger.exception("Swap cycle graph rebuild failed")
+        graph = None
+    finally:
+        connection.close()
+    with _graph_lock:
+        if graph is not None:
+            _shared_graph = graph
+        # After a failure, keep the old graph for another TTL before retrying.
+        _shared_graph_loaded_at = time.monotonic()
+        _refresh_thread = None
+
+
+def get_shared_graph():
+    global _shared_graph, _shared_graph_loaded_at, _refresh_thread
+    with _graph_lock:
+        if _shared_graph is None:
+            _shared_graph = WantsGraph.load()
+            _shared_graph_loaded_at = time.monotonic()
+        elif (
+            time.monotonic() - _shared_graph_loaded_at > GRAPH_TTL_SECONDS
+            and _refresh_thread is None
+        ):
+            _refresh_thread = threading.Thread(
+                target=_refresh_shared_graph, name="swap-graph-refresh", daemon=True
+            )
+            _refresh_thread.start()
+        return _shared_graph
@@ -1,3 +1,2036 @@
-from django.test import TestCase
+import json
+import re
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core import (
+    anomaly,
+    collusion,
+    facets,
+    jobs,
+    listing_cache,
+    match_index,
+    match_reasons,
+    search,
+    settings_cache,
+    swap_cycles,
+    trade_state,
+    user_stats,
+)
+from core.deadline_scheduler import DeadlineScheduler
+from core.emails import send_password_reset_email, send_verification_email
+from core.fraud_detection import (
+    MULTI_IP_THRESHOLD,
+    RAPID_TRADES_THRESHOLD,
+    record_trade_velocity,
+    run_bulk_fraud_checks,
+    run_fraud_checks,
+    run_incremental_fraud_checks,
+)
+from core.ip_tracking import HyperLogLog, distinct_ip_count, record_login_ip
+from core.matching import (
+    _NO_CATEGORY,
+    SwapListingSnapshot,
+    _calculate_reputation_score,
+    _calculate_value_similarity,
+    _recency_scores,
+    _reputation_scores,
+    _to_micros,
+    _value_similarity,
+    _windowed_top_pairs,
+    find_top_swap_pairs,
+    get_swap_suggestions,
+)
+from core.models import (
+    Brand,
+    Dispute,
+    EscrowSession,
+    FraudFlag,
+    FraudScanRun,
+    GiftCard,
+    Job,
+    ListingFacet,
+    MatchCandidate,
+    Notification,
+    PlatformSettings,
+    Sale,
+    Trade,
+    User,
+    UserStats,
+)
+from core.singleflight import SingleFlight
+from core.velocity import SlidingWindowCounter
+from core.versions import SharedVersion
+
+
+@override_settings(OPENAI_API_KEY="")
+class SwapSuggestionQueryCountTests(TestCase):
+    """The matcher must not issue per-pair or per-candidate queries."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="matcher", email="matcher@example.com")
+        self.brand = Brand.objects.create(name="Home Brand", category="Retail")
+        for value in ("50.00", "120.00"):
+            self._card(self.user, self.brand, value)
+
+    def _card(self, owner, brand, value, **kwargs):
+        return GiftCard.objects.create(
+            owner=owner,
+            brand=brand,
+            value=Decimal(value),
+            expiry_date=date(2099, 1, 1),
+            listing_type=GiftCard.ListingType.SWAP,
+            **kwargs,
+        )
+
+    def _add_listings(self, count):
+        start = GiftCard.objects.count()
+        for i in range(start, start + count):
+            owner = User.objects.create_user(username=f"owner{i}", email=f"owner{i}@example.com")
+            brand = Brand.objects.create(name=f"Brand {i}", category=f"Category {i % 3}")
+            self._card(owner, brand, f"{40 + i}.00")
+            # Give every owner some reputation history to aggregate.
+            counterpart = self._card(self.user, brand, "10.00", status=GiftCard.Status.SWAPPED)
+            trade = Trade.objects.create(
+                initiator=self.user,
+                responder=owner,
+                initiator_card=counterpart,
+                responder_card=self._card(owner, brand, "10.00", status=GiftCard.Status.SWAPPED),
+                status=Trade.Status.COMPLETED,
+            )
+            Dispute.objects.create(trade=trade, raised_by=owner, reason="test")
+
+    def _count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            suggestions = get_swap_suggestions(self.user, limit=50)
+        return len(ctx.captured_queries), suggestions
+
+    def test_query_count_is_independent_of_listing_count(self):
+        self._add_listings(3)
+        small_count, small = self._count_queries()
+
+        self._add_listings(30)
+        large_count, large = self._count_queries()
+
+        self.assertEqual(len(small), 6)
+        self.assertEqual(len(large), 50)
+        self.assertEqual(small_count, large_count)
+
+    def test_reputation_matches_user_property(self):
+        self._add_listings(5)
+        for match in get_swap_suggestions(self.user, limit=10):
+            owner = User.objects.get(username=match["suggested_card"]["owner_username"])
+            expected = owner.reputation
+            reputation = match["owner_reputation"]
+            self.assertEqual(reputation["total_trades"], expected["total_trades"])
+            self.assertEqual(reputation["successful_trades"], expected["successful_trades"])
+            self.assertEqual(reputation["disputes"], expected["disputes"])
+
+
+class VectorizedScoringTests(SimpleTestCase):
+    """The NumPy scoring engine agrees with the scalar rules on random listings."""
+
+    def setUp(self):
+        self.rng = np.random.default_rng(20261017)
+
+    def test_value_similarity_matches_scalar_rule(self):
+        user_cents = self.rng.integers(0, 100_000, size=400)
+        # Mix unrelated values with ones on and around the 20% and 100% edges.
+        ratios = self.rng.choice([0.2, 1.0, 2.0], size=400)
+        near_edges = np.rint(user_cents * (1 + ratios * self.rng.choice([-1, 1], size=400)))
+        other_cents = np.where(
+            self.rng.random(400) < 0.5, self.rng.integers(0, 100_000, size=400), near_edges
+        ).astype(np.int64)
+        other_cents = np.maximum(other_cents + self.rng.integers(-1, 2, size=400), 0)
+
+        vectorized = _value_similarity(user_cents, other_cents).tolist()
+        scalar = [
+            _calculate_value_similarity(Decimal(user) / 100, Decimal(other) / 100)
+            for user, other in zip(user_cents.tolist(), other_cents.tolist())
+        ]
+        self.assertEqual(vectorized, scalar)
+
+    def test_reputation_matches_scalar_rule(self):
+        trust = self.rng.integers(0, 151, size=300)
+        verified = self.rng.random(300) < 0.5
+        vectorized = _reputation_scores(trust, verified).tolist()
+        scalar = [
+            _calculate_reputation_score(User(trust_score=score, is_verified=is_verified))
+            for score, is_verified in zip(trust.tolist(), verified.tolist())
+        ]
+        self.assertEqual(vectorized, scalar)
+
+
+class WindowedTopPairsTests(SimpleTestCase):
+    """Value-window pruning returns exactly the brute-force top pairs."""
+
+    AGES = {15: 3600, 10: 3 * 86_400, 5: 30 * 86_400}  # Recency points -> age in seconds
+
+    def _snapshot(self, rng, size, user_id):
+        # Few distinct values, reputations and ages, so scores tie often; the
+        # user's cards sit at 100.00 (twice) and 57.00, with others on window edges.
+        edges = [10_000 + sign * (reach + jitter) for sign in (-1, 1)
+                 for reach in (2_100, 2_000, 5_900) for jitter in (-1, 0, 1)]
+        values = rng.choice(edges + [5_700, 4_500, 6_840, 10_000, 30_000], size=size)
+        owners = rng.integers(1, 8, size=size)
+        owners[:3], values[:3] = user_id, (10_000, 5_700, 10_000)
+        ages = rng.choice(list(self.AGES.values()), size=size)
+        now = timezone.now()
+        snapshot = SwapListingSnapshot(
+            card_ids=range(1, size + 1),
+            owner_ids=owners,
+            values=values,
+            brand_ids=rng.integers(1, 6, size=size),
+            categories=rng.choice(["", "Retail", "Food"], size=size).tolist(),
+            trust_scores=rng.choice([0, 50, 100], size=size),
+            is_verified=rng.random(size) < 0.3,
+            created_at=[_to_micros(now - timedelta(seconds=int(age))) for age in ages],
+        )
+        return snapshot, _to_micros(now)
+
+    def _brute_force(self, snapshot, user_id, received, now_micros, limit):
+        user_rows = [row for row in range(len(snapshot)) if snapshot.owner_ids[row] == user_id]
+        recency = _recency_scores(snapshot.created_micros, now_micros)
+        pairs = []
+        for position, user_row in enumerate(user_rows):
+            for row in range(len(snapshot)):
+                if snapshot.owner_ids[row] == user_id:
+                    continue
+                if snapshot.brand_ids[row] in received:
+                    brand = 20
+                elif snapshot.categories[user_row] == snapshot.categories[row] != _NO_CATEGORY:
+                    brand = 10
+                else:
+                    brand = 0
+                score = (
+                    int(_value_similarity(snapshot.value_cents[user_row], snapshot.value_cents[row]))
+                    + brand
+                    + int(snapshot.reputation_scores[row])
+                    + int(recency[row])
+                )
+                pairs.append((-score, position, row))
+        return [(position, row, -score) for score, position, row in sorted(pairs)[:limit]]
+
+    def test_matches_brute_force_ranking(self):
+        rng = np.random.default_rng(4)
+        windowed_runs = 0
+        for trial in range(60):
+            size = int(rng.integers(6, 120))
+            snapshot, now_micros = self._snapshot(rng, size, user_id=99)
+            received = set(rng.choice([1, 2, 3, 4, 5], size=int(rng.integers(0, 3))).tolist())
+            limit = int(rng.integers(1, 25))
+            is_own = snapshot.owner_ids == 99
+            expected = self._brute_force(snapshot, 99, received, now_micros, limit)
+
+            with self.subTest(trial=trial, size=size, limit=limit):
+                windowed = _windowed_top_pairs(
+                    snapshot, np.flatnonzero(is_own), is_own, limit, received, now_micros
+                )
+                if windowed is not None:
+                    windowed_runs += 1
+                    self.assertEqual(list(zip(*(column.tolist() for column in windowed))), expected)
+
+                pairs = find_top_swap_pairs(
+                    User(pk=99), limit=limit, snapshot=snapshot, received_brand_ids=received
+                )
+                card_ids = snapshot.card_ids
+                user_rows = np.flatnonzero(is_own)
+                self.assertEqual(
+                    pairs,
+                    [(int(card_ids[user_rows[p]]), int(card_ids[r]), s) for p, r, s in expected],
+                )
+        # Both the pruned and the full-matrix paths were exercised.
+        self.assertTrue(0 < windowed_runs < 60)
+
+
+@override_settings(OPENAI_API_KEY="")
+class MatchIndexTests(TestCase):
+    """The incrementally maintained index equals a full rebuild after every change."""
+
+    def setUp(self):
+        self.retail = Brand.objects.create(name="Index Retail", category="Retail")
+        self.food = Brand.objects.create(name="Index Food", category="Food")
+        self.users = [
+            User.objects.create_user(username=f"indexer{i}", email=f"indexer{i}@example.com")
+            for i in range(3)
+        ]
+        self.cards = [
+            self._card(owner, brand, value)
+            for owner, brand, value in (
+                (self.users[0], self.retail, "50.00"),
+                (self.users[0], self.food, "80.00"),
+                (self.users[1], self.food, "45.00"),
+                (self.users[2], self.retail, "70.00"),
+                (self.users[2], self.food, "75.00"),
+            )
+        ]
+        self.assertMatchesRebuild()
+
+    def _card(self, owner, brand, value):
+        with self.captureOnCommitCallbacks(execute=True):
+            return GiftCard.objects.create(
+                owner=owner,
+                brand=brand,
+                value=Decimal(value),
+                expiry_date=date(2099, 1, 1),
+                listing_type=GiftCard.ListingType.SWAP,
+            )
+
+    def _index(self):
+        return set(
+            MatchCandidate.objects.values_list("user_id", "user_card_id", "suggested_card_id", "score")
+        )
+
+    def assertMatchesRebuild(self):
+        jobs.run_pending()
+        incremental = self._index()
+        match_index.rebuild_all()
+        self.assertEqual(incremental, self._index())
+        return incremental
+
+    def test_create_update_and_delete(self):
+        # Saves queue the re-index instead of running it in the request.
+        new_card = self._card(self.users[1], self.retail, "55.00")
+        self.assertTrue(Job.objects.filter(kwargs={"card_ids": [new_card.pk]}).exists())
+        self.assertIn(
+            (self.users[0].pk, self.cards[0].pk, new_card.pk),
+            {row[:3] for row in self.assertMatchesRebuild()},
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_card.value = Decimal("400.00")
+            new_card.save()
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cards[1].listing_type = GiftCard.ListingType.SELL
+            self.cards[1].save()
+        self.assertNotIn(self.cards[1].pk, {row[1] for row in self.assertMatchesRebuild()})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cards[3].delete()
+        self.assertMatchesRebuild()
+
+    def test_trade(self):
+        trade = Trade.objects.create(
+            initiator=self.users[0],
+            responder=self.users[1],
+            initiator_card=self.cards[0],
+            responder_card=self.cards[2],
+        )
+        trade = Trade.objects.select_related(
+            "initiator", "responder", "initiator_card", "responder_card"
+        ).get(pk=trade.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            trade_state.accept(trade)
+        locked = {self.cards[0].pk, self.cards[2].pk}
+        index = self.assertMatchesRebuild()
+        self.assertFalse(locked & {card_id for row in index for card_id in row[1:3]})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trade_state.release(trade)
+            trade_state.confirm(trade, self.users[0])
+            trade_state.confirm(trade, self.users[1])
+        self.assertEqual(trade.status, Trade.Status.COMPLETED)
+        self.assertMatchesRebuild()
+
+    def test_requests_queue_the_reindex(self):
+        trade = Trade.objects.create(
+            initiator=self.users[0],
+            responder=self.users[1],
+            initiator_card=self.cards[0],
+            responder_card=self.cards[2],
+        )
+        trade = Trade.objects.select_related(
+            "initiator", "responder", "initiator_card", "responder_card"
+        ).get(pk=trade.pk)
+        other = Trade.objects.create(
+            initiator=self.users[2],
+            responder=self.users[0],
+            initiator_card=self.cards[3],
+            responder_card=self.cards[1],
+        )
+        referencing = set(
+            MatchCandidate.objects.filter(suggested_card=self.cards[4]).values_list(
+                "user_id", flat=True
+            )
+        ) | {self.cards[4].owner_id}
+        Job.objects.all().delete()
+
+        loaded = AssertionError("marketplace snapshot loaded in a request")
+        with (
+            mock.patch.object(SwapListingSnapshot, "load", side_effect=loaded),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            self.cards[4].delete()
+            trade_state.accept(trade)
+            trade_state.release(trade)
+            trade_state.confirm(trade, self.users[0])
+            trade_state.confirm(trade, self.users[1])
+            other.status = Trade.Status.COMPLETED
+            other.save()
+
+        self.assertEqual(
+            list(Job.objects.order_by("pk").values_list("task", "kwargs")),
+            [
+                ("core.match_index.rebuild_users", {"user_ids": sorted(referencing)}),
+                ("core.match_index.refresh_cards", {"card_ids": [self.cards[0].pk, self.cards[2].pk]}),
+                ("core.match_index.rebuild_users", {"user_ids": [self.users[0].pk, self.users[1].pk]}),
+                ("core.match_index.rebuild_users", {"user_ids": [self.users[2].pk, self.users[0].pk]}),
+            ],
+        )
+        self.assertMatchesRebuild()
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Minimal chat-completions endpoint answering one reason per match line."""
+
+    delay = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.delay)
+        matches = body["messages"][0]["content"].split("Matches:\n", 1)[1].splitlines()
+        content = json.dumps([f"reason {line.split('.')[0]}" for line in matches])
+        payload = json.dumps({
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class MatchReasonTests(SimpleTestCase):
+    """Match reasons are served from cache and generated off the request path."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeOpenAIHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(setattr, _FakeOpenAIHandler, "delay", 0)
+
+        settings = override_settings(
+            OPENAI_API_KEY="test",
+            OPENAI_BASE_URL=f"http://127.0.0.1:{self.server.server_port}/v1",
+            MATCH_REASON_TIMEOUT=0.5,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        caches["match_reasons"].clear()
+
+    def _matches(self, *pairs):
+        return [
+            {
+                "match_score": score,
+                "user_card": {"id": user_card, "brand": "Home", "value": "50.00"},
+                "suggested_card": {
+                    "id": suggested_card,
+                    "brand": "Away",
+                    "value": "45.00",
+                    "owner_username": "owner",
+                },
+                "owner_reputation": {"trust_score": 50},
+            }
+            for user_card, suggested_card, score in pairs
+        ]
+
+    def test_miss_returns_without_reason_then_fills_cache(self):
+        _FakeOpenAIHandler.delay = 0.2
+        pending = match_reasons.request_reasons(self._matches((1, 2, 91), (1, 3, 75)))
+
+        matches = match_reasons.attach_reasons(self._matches((1, 2, 91), (1, 3, 75)))
+        self.assertFalse(any("ai_match_reason" in m for m in matches))
+        # Pairs already being generated are not queued twice.
+        self.assertIsNone(match_reasons.request_reasons(matches))
+
+        pending.result(timeout=5)
+        cached = match_reasons.attach_reasons(self._matches((1, 2, 95), (1, 3, 79)))
+        self.assertEqual([m["ai_match_reason"] for m in cached], ["reason 1", "reason 2"])
+
+    def test_score_bucket_change_misses_cache(self):
+        match_reasons.request_reasons(self._matches((1, 2, 91))).result(timeout=5)
+        matches = match_reasons.attach_reasons(self._matches((1, 2, 89)))
+        self.assertNotIn("ai_match_reason", matches[0])
+
+    def test_slow_upstream_is_cut_off_by_timeout(self):
+        _FakeOpenAIHandler.delay = 2
+        started = time.monotonic()
+        matches = match_reasons.attach_reasons(self._matches((1, 2, 91)))
+        self.assertLess(time.monotonic() - started, 0.2)
+        self.assertNotIn("ai_match_reason", matches[0])
+
+        future = match_reasons.request_reasons(self._matches((5, 6, 50)))
+        future.result(timeout=5)
+        self.assertLess(time.monotonic() - started, 1.9)
+        self.assertIsNone(caches["match_reasons"].get(match_reasons.cache_key(matches[0])))
+
+
+@override_settings(OPENAI_API_KEY="")
+class ComputeMatchesTests(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(name="Nightly Brand", category="Retail")
+        self.users = []
+        for i in range(5):
+            user = User.objects.create_user(
+                username=f"nightly{i}", email=f"nightly{i}@example.com",
+                trust_score=100, is_verified=True,
+            )
+            self.users.append(user)
+            for value in ("50.00", "52.00"):
+                GiftCard.objects.create(
+                    owner=user, brand=brand, value=Decimal(value), expiry_date=date(2099, 1, 1),
+                    listing_type=GiftCard.ListingType.SWAP,
+                )
+        # A user without swap listings loses stale rows.
+        self.stale = MatchCandidate.objects.create(
+            user=User.objects.create_user(username="gone", email="gone@example.com"),
+            user_card=GiftCard.objects.first(),
+            suggested_card=GiftCard.objects.last(),
+            score=50,
+        )
+
+    def _rows(self):
+        return set(
+            MatchCandidate.objects.values_list("user_id", "user_card_id", "suggested_card_id", "score")
+        )
+
+    def test_pool_run_stores_ranked_rows_and_notifies_once_per_user(self):
+        out = StringIO()
+        call_command("compute_matches", "--processes", "2", "--shard-size", "2", stdout=out)
+        self.assertIn("Users ranked:   5", out.getvalue())
+        self.assertFalse(MatchCandidate.objects.filter(pk=self.stale.pk).exists())
+
+        rows = self._rows()
+        self.assertEqual(len(rows), 5 * 2 * 8)  # Each card against the other users' 8
+        self.assertTrue(all(score >= match_index.MATCH_NOTIFY_MIN_SCORE for *_, score in rows))
+        self.assertFalse(MatchCandidate.objects.filter(is_notified=False).exists())
+        notified = Notification.objects.filter(type=Notification.Type.MATCH)
+        self.assertEqual(
+            sorted(notified.values_list("user_id", flat=True)), [user.pk for user in self.users]
+        )
+        self.assertIn("15 more new matches", notified.first().message)
+
+        # The in-process path ranks the same rows, and nothing is sent twice.
+        match_index.rebuild_all()
+        self.assertEqual(self._rows(), rows)
+        self.assertFalse(MatchCandidate.objects.filter(is_notified=False).exists())
+        call_command("compute_matches", "--processes", "1", stdout=StringIO())
+        self.assertEqual(self._rows(), rows)
+        self.assertEqual(notified.count(), 5)
+
+
+class SwapCycleTests(SimpleTestCase):
+    def _graph(self, owners, brands, values, received, categories=None):
+        count = len(owners)
+        snapshot = SwapListingSnapshot(
+            card_ids=range(1, count + 1),
+            owner_ids=owners,
+            values=values,
+            brand_ids=brands,
+            categories=categories or [""] * count,
+            trust_scores=[50] * count,
+            is_verified=[False] * count,
+            created_at=[0] * count,
+        )
+        return swap_cycles.WantsGraph(snapshot, received)
+
+    def test_three_and_four_way_cycles(self):
+        # Each owner has received (and so wants) the next owner's brand:
+        # rows 0-2 form a 3-way ring, rows 3-6 a 4-way ring.  Row 7 is wanted
+        # by nobody, and row 8's value is too far from row 2's.
+        graph = self._graph(
+            owners=[10, 11, 12, 20, 21, 22, 23, 30, 31],
+            brands=[100, 101, 102, 200, 201, 202, 203, 300, 100],
+            values=[5000, 5200, 4900, 8000, 8000, 8000, 8000, 5000, 20000],
+            received={
+                10: {101}, 11: {102}, 12: {100},
+                20: {201}, 21: {202}, 22: {203}, 23: {200},
+                30: {101},
+            },
+        )
+        self.assertEqual(
+            sorted(swap_cycles.find_all_cycles(graph)), [(0, 1, 2), (3, 4, 5, 6)]
+        )
+        self.assertEqual(swap_cycles.find_all_cycles(graph, max_length=3), [(0, 1, 2)])
+
+        [(score, weakest, rows)] = swap_cycles.find_user_cycles(graph, 22)
+        self.assertEqual((score, weakest, rows), (100, 40, (5, 6, 3, 4)))
+        [(score, weakest, rows)] = swap_cycles.find_user_cycles(graph, 11)
+        self.assertEqual(rows, (1, 2, 0))
+        self.assertEqual(swap_cycles.find_user_cycles(graph, 30), [])
+
+    def test_same_category_cards_form_cycles_both_ways(self):
+        graph = self._graph(
+            owners=[1, 2, 3],
+            brands=[1, 2, 3],
+            values=[5000, 5000, 5000],
+            received={},
+            categories=["Retail"] * 3,
+        )
+        self.assertEqual(sorted(swap_cycles.find_all_cycles(graph)), [(0, 1, 2), (0, 2, 1)])
+
+    def test_stale_graph_is_rebuilt_in_the_background(self):
+        first, second = object(), object()
+        building = threading.Event()
+        self.addCleanup(setattr, swap_cycles, "_shared_graph", None)
+        with mock.patch.object(swap_cycles.WantsGraph, "load", side_effect=[first, second]) as load:
+            swap_cycles._shared_graph = None
+            self.assertIs(swap_cycles.get_shared_graph(), first)
+
+            load.side_effect = lambda: building.wait(5) and second
+            later = time.monotonic() + swap_cycles.GRAPH_TTL_SECONDS + 1
+            with mock.patch("core.swap_cycles.time.monotonic", return_value=later):
+                # Served the stale graph while the next one builds.
+                self.assertIs(swap_cycles.get_shared_graph(), first)
+                refresh = swap_cycles._refresh_thread
+                self.assertIs(swap_cycles.get_shared_graph(), first)
+            building.set()
+            refresh.join(5)
+            self.assertEqual(load.call_count, 2)
+            self.assertIs(swap_cycles.get_shared_graph(), second)
+
+    def test_benchmark_clamps_queries_to_owners(self):
+        out = StringIO()
+        call_command(
+            "benchmark_swap_cycles", "--cards", "60", "--users", "10", "--queries", "50", stdout=out
+        )
+        self.assertIn("Cycles per user", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("benchmark_swap_cycles", "--queries", "0", stdout=StringIO())
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.release = threading.Event()
+        self.calls = []
+
+    def _slow(self, result="fresh"):
+        def compute():
+            self.calls.append(threading.current_thread().name)
+            self.release.wait(5)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        return compute
+
+    def _run_concurrently(self, flight, count, fn):
+        """Call ``flight.do("key", fn)`` from ``count`` threads; returns results or exceptions."""
+        outcomes = [None] * count
+
+        def call(index):
+            try:
+                outcomes[index] = flight.do("key", fn)
+            except Exception as exc:
+                outcomes[index] = exc
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+        threads[0].start()
+        while not self.calls:
+            time.sleep(0.001)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.2)  # Let the followers reach the flight.
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_leader_runs_once_and_shares_its_result(self):
+        flight = SingleFlight("test-shared-result")
+        self.assertEqual(self._run_concurrently(flight, 8, self._slow()), ["fresh"] * 8)
+        self.assertEqual(len(self.calls), 1)
+        stats = flight.stats()
+        self.assertEqual((stats["executions"], stats["coalesced"], stats["calls"]), (1, 7, 8))
+        self.assertEqual(stats["hit_rate"], 0.875)
+
+        # Nothing is kept once the flight lands.
+        self.assertEqual(flight.do("key", lambda: "next"), "next")
+
+    def test_errors_reach_every_waiter(self):
+        flight = SingleFlight("test-shared-error")
+        outcomes = self._run_concurrently(flight, 4, self._slow(RuntimeError("upstream down")))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual([str(outcome) for outcome in outcomes], ["upstream down"] * 4)
+        self.assertTrue(all(isinstance(outcome, RuntimeError) for outcome in outcomes))
+
+    def test_waiters_compute_directly_after_the_timeout(self):
+        flight = SingleFlight("test-wait-timeout", wait_timeout=0.05)
+        outcomes = self._run_concurrently(flight, 3, self._slow())
+        self.assertEqual(outcomes, ["fresh"] * 3)
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(flight.stats()["fallbacks"], 2)
+
+    def test_cross_process_only_with_a_shared_cache(self):
+        # The default LocMem cache is per process: no cache lock is taken.
+        with mock.patch("core.singleflight.cache") as shared_cache:
+            self.assertEqual(SingleFlight("test-local").do("key", lambda: "fresh"), "fresh")
+        self.assertFalse(shared_cache.method_calls)
+
+        # Two flights sharing a cache stand in for two processes.
+        here = SingleFlight("test-remote", shared=True)
+        there = SingleFlight("test-remote", shared=True)
+        results = {}
+        leader = threading.Thread(target=lambda: results.update(here=here.do("key", self._slow())))
+        leader.start()
+        while not self.calls:
+            time.sleep(0.001)
+        follower = threading.Thread(target=lambda: results.update(there=there.do("key", self._slow())))
+        follower.start()
+        time.sleep(0.1)
+        self.release.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(results, {"here": "fresh", "there": "fresh"})
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(there.stats()["remote_hits"], 1)
+
+
+class BulkFraudScanTests(TestCase):
+    """The bulk scan must produce exactly what the per-user scan produces."""
+
+    def setUp(self):
+        self.brand = Brand.objects.create(name="Scan Brand", category="Retail")
+        self.counterpart = self._user("counterpart", trust_tier=User.TrustTier.TRUSTED)
+
+        rapid = self._user("rapid")
+        for _ in range(3):
+            self._trade(rapid, self.counterpart)
+        self._trade(self.counterpart, rapid)
+        self._trade(rapid, rapid)  # Self-trade counts once.
+        self._trade(rapid, self.counterpart, status=Trade.Status.CANCELLED)
+
+        disputer = self._user("disputer", trust_tier=User.TrustTier.ESTABLISHED)
+        trade = self._trade(disputer, self.counterpart)
+        for _ in range(3):
+            Dispute.objects.create(trade=trade, raised_by=disputer, reason="test")
+
+        # Rapid trades and a high-value card: two flags, so auto-restricted.
+        both = self._user("both")
+        for _ in range(4):
+            self._trade(both, self.counterpart, value="750.00")
+
+        # Already flagged for rapid trades; a dispute flag tips them over.
+        flagged = self._user("flagged", trust_tier=User.TrustTier.ESTABLISHED)
+        FraudFlag.objects.create(
+            user=flagged, flag_type=FraudFlag.FlagType.RAPID_TRADES, details="earlier"
+        )
+        for _ in range(4):
+            self._trade(flagged, self.counterpart)
+        trade = self._trade(self.counterpart, flagged)
+        for _ in range(3):
+            Dispute.objects.create(trade=trade, raised_by=flagged, reason="test")
+
+        established = self._user("established", trust_tier=User.TrustTier.ESTABLISHED)
+        self._trade(self.counterpart, established, value="900.00")
+
+        restricted = self._user("restricted", status=User.Status.RESTRICTED)
+        for _ in range(5):
+            self._trade(restricted, self.counterpart)
+
+        roamer = self._user("roamer", trust_tier=User.TrustTier.ESTABLISHED)
+        for i in range(MULTI_IP_THRESHOLD + 1):
+            record_login_ip(roamer, f"203.0.113.{i}")
+
+    def _user(self, username, **kwargs):
+        return User.objects.create_user(
+            username=username, email=f"{username}@example.com", **kwargs
+        )
+
+    def _trade(self, initiator, responder, value="50.00", **kwargs):
+        def card(owner):
+            return GiftCard.objects.create(
+                owner=owner, brand=self.brand, value=Decimal(value), expiry_date=date(2099, 1, 1)
+            )
+
+        return Trade.objects.create(
+            initiator=initiator,
+            responder=responder,
+            initiator_card=card(initiator),
+            responder_card=card(responder),
+            **kwargs,
+        )
+
+    def _scan_result(self, flags):
+        return (
+            sorted((f.user_id, f.flag_type, f.details, f.auto_restricted) for f in flags),
+            dict(User.objects.values_list("id", "status")),
+            sorted(FraudFlag.objects.values_list("user_id", "flag_type", "auto_restricted")),
+        )
+
+    def test_bulk_scan_matches_per_user_scan(self):
+        savepoint = transaction.savepoint()
+        per_user = self._scan_result(run_fraud_checks())
+        transaction.savepoint_rollback(savepoint)
+
+        bulk = self._scan_result(run_bulk_fraud_checks())
+
+        self.assertEqual(bulk, per_user)
+        flagged = {(user_id, flag_type) for user_id, flag_type, *_ in bulk[0]}
+        # rapid, disputer, both (x2), flagged, roamer, and the busy counterpart.
+        self.assertEqual(len(flagged), 7)
+        restricted = [u for u, status in bulk[1].items() if status == User.Status.RESTRICTED]
+        self.assertEqual(len(restricted), 3)
+
+
+class IncrementalFraudScanTests(TestCase):
+    """Incremental scans cover users active since the last finished run's watermark."""
+
+    def setUp(self):
+        self.brand = Brand.objects.create(name="Watermark Brand", category="Retail")
+        self.counterpart = self._user("counterpart", trust_tier=User.TrustTier.TRUSTED)
+        self.quiet = self._user("quiet")
+        self.busy = self._user("busy")
+        trade = self._trade(self.quiet)
+        Trade.objects.filter(pk=trade.pk).update(created_at=timezone.now() - timedelta(hours=2))
+        self.previous = FraudScanRun.objects.create(
+            is_full=True,
+            watermark=timezone.now() - timedelta(hours=1),
+            finished_at=timezone.now() - timedelta(hours=1),
+        )
+
+    def _user(self, username, **kwargs):
+        return User.objects.create_user(
+            username=username, email=f"{username}@example.com", **kwargs
+        )
+
+    def _trade(self, initiator):
+        def card(owner):
+            return GiftCard.objects.create(
+                owner=owner, brand=self.brand, value=Decimal("50.00"), expiry_date=date(2099, 1, 1)
+            )
+
+        return Trade.objects.create(
+            initiator=initiator,
+            responder=self.counterpart,
+            initiator_card=card(initiator),
+            responder_card=card(self.counterpart),
+        )
+
+    def _scanned(self):
+        with mock.patch(
+            "core.fraud_detection.run_bulk_fraud_checks", wraps=run_bulk_fraud_checks
+        ) as scan:
+            run, _ = run_incremental_fraud_checks()
+        # No call at all when nobody was active.
+        return run, set(scan.call_args.args[0]) if scan.called else set()
+
+    def test_only_users_active_since_the_watermark_are_scanned(self):
+        self._trade(self.busy)
+        run, user_ids = self._scanned()
+        self.assertFalse(run.is_full)
+        self.assertEqual(user_ids, {self.busy.pk, self.counterpart.pk})
+        self.assertEqual(run.users_scanned, 2)
+        self.assertIsNotNone(run.finished_at)
+
+    def test_watermark_advances_only_after_a_successful_run(self):
+        self._trade(self.busy)
+        with mock.patch(
+            "core.fraud_detection.run_bulk_fraud_checks", side_effect=RuntimeError("scan failed")
+        ):
+            with self.assertRaises(RuntimeError):
+                run_incremental_fraud_checks()
+        failed = FraudScanRun.objects.first()
+        self.assertIsNone(failed.finished_at)
+        self.assertEqual(FraudScanRun.objects.filter(finished_at__isnull=False).get(), self.previous)
+
+        # The next run starts from the last finished watermark again.
+        run, user_ids = self._scanned()
+        self.assertEqual(user_ids, {self.busy.pk, self.counterpart.pk})
+        self.assertEqual(FraudScanRun.objects.filter(finished_at__isnull=False).first(), run)
+        self.assertGreater(run.watermark, failed.watermark)
+
+    def test_overlap_creates_no_duplicate_flags(self):
+        trade = self._trade(self.busy)
+        for _ in range(3):
+            Dispute.objects.create(trade=trade, raised_by=self.busy, reason="test")
+        first, _ = self._scanned()
+        self.assertEqual(first.flags_created, 1)
+
+        # The disputes fall inside the overlap, so the next run re-checks the user.
+        flags = sorted(FraudFlag.objects.values_list("user_id", "flag_type"))
+        self.assertEqual(flags, [(self.busy.pk, FraudFlag.FlagType.REPEATED_DISPUTES)])
+        second, user_ids = self._scanned()
+        self.assertIn(self.busy.pk, user_ids)
+        self.assertEqual(second.flags_created, 0)
+        self.assertEqual(sorted(FraudFlag.objects.values_list("user_id", "flag_type")), flags)
+
+
+class VelocityCounterTests(TestCase):
+    """Write-time velocity counters flag on the event that crosses a threshold."""
+
+    def setUp(self):
+        cache.clear()
+        self.brand = Brand.objects.create(name="Velocity Brand", category="Retail")
+        self.trader = self._user("trader")
+        self.counterpart = self._user("counterpart", trust_tier=User.TrustTier.TRUSTED)
+
+    def _user(self, username, **kwargs):
+        return User.objects.create_user(
+            username=username, email=f"{username}@example.com", **kwargs
+        )
+
+    def _trade(self, value="50.00"):
+        def card(owner):
+            return GiftCard.objects.create(
+                owner=owner, brand=self.brand, value=Decimal(value), expiry_date=date(2099, 1, 1)
+            )
+
+        return Trade.objects.create(
+            initiator=self.trader,
+            responder=self.counterpart,
+            initiator_card=card(self.trader),
+            responder_card=card(self.counterpart),
+        )
+
+    def test_sliding_window_weights_previous_bucket(self):
+        counter = SlidingWindowCounter("test", 3600)
+        counter.add(self.trader.pk, 4, now=3600 * 10 + 1800)
+        self.assertEqual(counter.get(self.trader.pk, now=3600 * 11 + 900), 3.0)
+        self.assertEqual(counter.get(self.trader.pk, now=3600 * 12 + 1), 0)
+
+    def test_counts_are_shared_between_processes(self):
+        # Each process has its own counter object and local cache.
+        here, there = SlidingWindowCounter("shared", 3600), SlidingWindowCounter("shared", 3600)
+        now = 3600 * 10
+        here.add(self.trader.pk, 2, now=now)
+        cache.clear()
+        self.assertEqual(there.add(self.trader.pk, 3, now=now + 60), (2, 5))
+        self.assertEqual(here.get(self.trader.pk, now=now + 60), 5)
+
+        # Starting a new bucket drops the ones that left the window.
+        here.add(self.trader.pk, 1, now=now + 3 * 3600)
+        self.assertEqual(self.trader.velocity_buckets.count(), 1)
+
+    def test_flags_once_when_threshold_is_crossed(self):
+        raised = []
+        for _ in range(RAPID_TRADES_THRESHOLD + 2):
+            raised.append(record_trade_velocity(self._trade()))
+
+        self.assertEqual([len(flags) for flags in raised], [0, 0, 0, 2, 0])
+        self.assertEqual(
+            sorted(FraudFlag.objects.values_list("user__username", "flag_type")),
+            [("counterpart", "rapid_trades"), ("trader", "rapid_trades")],
+        )
+
+    def test_daily_value_flag(self):
+        trade = self._trade(value="1500.00")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(record_trade_velocity(trade), [])
+        # Below every threshold: only the counters are touched.
+        self.assertFalse([q for q in queries if "core_fraudflag" in q["sql"]])
+
+        flags = record_trade_velocity(self._trade(value="600.00"))
+        self.assertEqual([flag.flag_type for flag in flags], [FraudFlag.FlagType.VALUE_VELOCITY])
+
+
+class LoginIPTrackingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="traveller", email="traveller@example.com", password="pass-1234"
+        )
+
+    def test_exact_set_switches_to_sketch(self):
+        for i in range(1000):
+            record_login_ip(self.user, f"10.0.{i // 256}.{i % 256}")
+            record_login_ip(self.user, "10.0.0.0")
+
+        bucket = self.user.login_ip_buckets.get()
+        self.assertEqual(bucket.ips, [])
+        self.assertEqual(len(bucket.sketch), 1024)
+        self.assertAlmostEqual(distinct_ip_count(self.user, 24), 1000, delta=100)
+
+    def test_small_counts_are_exact(self):
+        for ip in ["198.51.100.1", "198.51.100.2", "198.51.100.1"]:
+            record_login_ip(self.user, ip)
+        self.assertEqual(distinct_ip_count(self.user, 24), 2)
+
+        sketch = HyperLogLog()
+        sketch.update(["198.51.100.1", "198.51.100.2"])
+        self.assertEqual(sketch.count(), 2)
+
+    def test_token_refresh_records_ip(self):
+        refresh = RefreshToken.for_user(self.user)
+        response = self.client.post(
+            "/api/auth/token/refresh/",
+            {"refresh": str(refresh)},
+            content_type="application/json",
+            REMOTE_ADDR="192.0.2.7",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.user.login_ip_buckets.get().ips, ["192.0.2.7"])
+
+
+class CollusionRingTests(TestCase):
+    def setUp(self):
+        self.brand = Brand.objects.create(name="Ring Brand", category="Retail")
+        self.users = {
+            name: User.objects.create_user(username=name, email=f"{name}@example.com")
+            for name in ["ann", "bob", "cat", "dan", "eve", "fay"]
+        }
+
+    def _card(self, owner):
+        return GiftCard.objects.create(
+            owner=owner, brand=self.brand, value=Decimal("25.00"), expiry_date=date(2099, 1, 1)
+        )
+
+    def _swap(self, initiator, responder, initiator_card=None, responder_card=None):
+        initiator, responder = self.users[initiator], self.users[responder]
+        return Trade.objects.create(
+            initiator=initiator,
+            responder=responder,
+            initiator_card=initiator_card or self._card(initiator),
+            responder_card=responder_card or self._card(responder),
+            status=Trade.Status.COMPLETED,
+        )
+
+    def test_ping_pong_ring_is_flagged(self):
+        # ann and bob hand the same two cards back and forth; cat joins in.
+        trade = self._swap("ann", "bob")
+        for _ in range(2):
+            trade = self._swap("ann", "bob", trade.responder_card, trade.initiator_card)
+        for _ in range(3):
+            self._swap("bob", "cat")
+        # dan and eve trade a lot, but also with plenty of other people.
+        for _ in range(5):
+            self._swap("dan", "eve")
+        for other in ["ann", "cat", "fay"] * 2:
+            self._swap("dan", other)
+            self._swap("eve", other)
+
+        streamed, clusters = collusion.find_collusion_clusters()
+        self.assertEqual(streamed, 23)
+        by_members = {
+            tuple(User.objects.get(pk=pk).username for pk in c.user_ids): c for c in clusters
+        }
+        self.assertTrue(by_members["ann", "bob", "cat"].is_suspicious)
+        self.assertEqual(by_members["ann", "bob", "cat"].card_returns, 4)
+        self.assertFalse(by_members["dan", "eve"].is_suspicious)
+
+        flags = collusion.flag_collusion_clusters(clusters)
+        self.assertEqual(
+            sorted(flag.user.username for flag in flags), ["ann", "bob", "cat"]
+        )
+        self.assertEqual(collusion.flag_collusion_clusters(clusters), [])
+
+    def test_misra_gries_keeps_heavy_pairs(self):
+        summary = collusion.MisraGries(capacity=2)
+        for key in ["a", "b", "a", "c", "a", "d", "a", "e", "a"]:
+            summary.add(key)
+        self.assertIn("a", summary.counts)
+        self.assertLessEqual(len(summary.counts), 2)
+
+
+class AnomalyScoringTests(TestCase):
+    def test_robust_z_scores_ignore_extremes(self):
+        values = np.array([[10.0]] * 40 + [[11.0]] * 40 + [[1000.0]])
+        z_scores = anomaly.robust_z_scores(values, np.zeros(len(values), dtype=np.int64))
+        self.assertLess(abs(z_scores[0, 0]), 1)
+        self.assertGreater(z_scores[-1, 0], 500)
+
+    def _population(self):
+        brand = Brand.objects.create(name="Anomaly Brand", category="Retail")
+        partner = User.objects.create_user(
+            username="partner", email="partner@example.com", trust_tier=User.TrustTier.TRUSTED
+        )
+        for i in range(anomaly.ANOMALY_MIN_COHORT + 10):
+            user = User.objects.create_user(username=f"new{i}", email=f"new{i}@example.com")
+            value = "900.00" if i == 7 else f"{20 + i % 5}.00"
+            Trade.objects.create(
+                initiator=user,
+                responder=partner,
+                initiator_card=GiftCard.objects.create(
+                    owner=user, brand=brand, value=Decimal(value), expiry_date=date(2099, 1, 1)
+                ),
+                responder_card=GiftCard.objects.create(
+                    owner=partner, brand=brand, value=Decimal("25.00"), expiry_date=date(2099, 1, 1)
+                ),
+            )
+
+    def test_outlier_within_tier_is_flagged(self):
+        self._population()
+        result = anomaly.compute_anomaly_scores()
+        flags = anomaly.flag_anomalies(result)
+
+        self.assertEqual([flag.user.username for flag in flags], ["new7"])
+        self.assertIn("card value $900.00", flags[0].details)
+        self.assertEqual(anomaly.flag_anomalies(result), [])
+
+    def test_user_deleted_after_scoring_is_skipped(self):
+        self._population()
+        result = anomaly.compute_anomaly_scores()
+        User.objects.filter(username="new7").delete()
+        self.assertEqual(anomaly.flag_anomalies(result), [])
+
+
+class UserStatsTests(TestCase):
+    """Denormalized counters must always equal a recount from the source tables."""
+
+    def setUp(self):
+        self.brand = Brand.objects.create(name="Stats Brand", category="Retail")
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com")
+
+    def _card(self, owner):
+        return GiftCard.objects.create(
+            owner=owner, brand=self.brand, value=Decimal("40.00"), expiry_date=date(2099, 1, 1)
+        )
+
+    def _trade(self, **kwargs):
+        return Trade.objects.create(
+            initiator=self.alice,
+            responder=self.bob,
+            initiator_card=self._card(self.alice),
+            responder_card=self._card(self.bob),
+            **kwargs,
+        )
+
+    def assertStatsMatch(self):
+        expected = user_stats.compute_stats([self.alice.pk, self.bob.pk])
+        stored = {
+            row["user_id"]: {field: row[field] for field in user_stats.STAT_FIELDS}
+            for row in UserStats.objects.values("user_id", *user_stats.STAT_FIELDS)
+        }
+        self.assertEqual(stored, expected)
+
+    def test_counters_follow_state_changes(self):
+        trade = self._trade()
+        for next_status in [Trade.Status.ACCEPTED, Trade.Status.IN_ESCROW, Trade.Status.COMPLETED]:
+            trade.status = next_status
+            trade.save(update_fields=["status", "updated_at"])
+            self.assertStatsMatch()
+
+        reloaded = Trade.objects.get(pk=self._trade().pk)
+        reloaded.status = Trade.Status.CANCELLED
+        reloaded.save()
+        Dispute.objects.create(trade=trade, raised_by=self.bob, reason="test")
+
+        sale = Sale.objects.create(
+            buyer=self.bob, seller=self.alice, gift_card=self._card(self.alice), amount=Decimal("30.00")
+        )
+        sale.status = Sale.Status.COMPLETED
+        sale.save()
+        self.assertStatsMatch()
+
+        trade.delete()
+        self.assertStatsMatch()
+        stats = user_stats.get_stats(self.alice)
+        self.assertEqual((stats.total_trades, stats.completed_sales), (0, 1))
+        self.assertEqual(stats.earnings, Decimal("30.00"))
+
+    def test_failed_transaction_rolls_back_counters(self):
+        self._trade(status=Trade.Status.COMPLETED)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self._trade(status=Trade.Status.COMPLETED)
+            raise RuntimeError
+        self.assertEqual(user_stats.get_stats(self.bob).successful_trades, 1)
+
+    def test_reputation_is_one_lookup(self):
+        self._trade(status=Trade.Status.COMPLETED)
+        with self.assertNumQueries(1):
+            reputation = self.alice.reputation
+        self.assertEqual(
+            reputation, {"total_trades": 1, "successful_trades": 1, "disputes": 0}
+        )
+
+    def test_reconcile_repairs_drift(self):
+        self._trade(status=Trade.Status.COMPLETED)
+        UserStats.objects.filter(user=self.alice).update(successful_trades=7)
+        UserStats.objects.filter(user=self.bob).delete()
+
+        out = StringIO()
+        call_command("reconcile_user_stats", "--fix", stdout=out)
+        self.assertIn("Missing rows:     1", out.getvalue())
+        self.assertIn("Mismatched rows:  1", out.getvalue())
+        self.assertStatsMatch()
+
+
+class PlatformSettingsCacheTests(TestCase):
+    def setUp(self):
+        settings_cache.invalidate()
+        self.addCleanup(settings_cache.invalidate)
+        self.fee = PlatformSettings.objects.create(key="fee_percentage", value="5")
+        PlatformSettings.objects.create(key="max_daily_trades_new", value="oops")
+        PlatformSettings.objects.create(key="maintenance_mode", value="On")
+
+    def test_reads_are_typed_and_query_free_once_loaded(self):
+        user = User(username="reader", trust_tier=User.TrustTier.NEW)
+        PlatformSettings.get("fee_percentage")
+        with self.assertNumQueries(0):
+            self.assertEqual(PlatformSettings.get_decimal("fee_percentage"), Decimal("5"))
+            self.assertIs(PlatformSettings.get_bool("maintenance_mode"), True)
+            self.assertEqual(user.max_daily_trades, 3)  # Invalid value: default.
+            self.assertEqual(user.max_active_trades, 1)
+
+    def test_admin_update_invalidates(self):
+        admin = User.objects.create_user(
+            username="settings-admin", email="settings-admin@example.com", is_staff=True
+        )
+        self.client.force_login(admin)
+        self.assertEqual(PlatformSettings.get_int("fee_percentage"), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/admin/settings/{self.fee.pk}/",
+                {"value": "7"},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PlatformSettings.get_int("fee_percentage"), 7)
+
+    def test_other_process_change_is_picked_up_by_version(self):
+        self.assertEqual(PlatformSettings.get("fee_percentage"), "5")
+        # Another process edits the row and bumps the version through its own
+        # counter; nothing it does reaches this process's cache.
+        PlatformSettings.objects.filter(pk=self.fee.pk).update(value="9")
+        SharedVersion("platform_settings").bump()
+        cache.clear()
+
+        self.assertEqual(PlatformSettings.get("fee_percentage"), "5")
+        later = time.monotonic() + settings_cache.VERSION_CHECK_SECONDS
+        with mock.patch("core.versions.time.monotonic", return_value=later):
+            self.assertEqual(PlatformSettings.get("fee_percentage"), "9")
+
+
+@override_settings(OPENAI_API_KEY="")
+class TradeStateMachineTests(TestCase):
+    """Transitions are compare-and-swap: a stale copy of a trade can't overwrite a newer state."""
+
+    def setUp(self):
+        self.brand = Brand.objects.create(name="State Brand", category="Retail")
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com")
+
+    def _card(self, owner):
+        return GiftCard.objects.create(
+            owner=owner, brand=self.brand, value=Decimal("40.00"), expiry_date=date(2099, 1, 1)
+        )
+
+    def _trade(self, responder_card=None):
+        trade = Trade.objects.create(
+            initiator=self.alice,
+            responder=self.bob,
+            initiator_card=self._card(self.alice),
+            responder_card=responder_card or self._card(self.bob),
+        )
+        return trade.trade_id
+
+    def _load(self, trade_id):
+        return Trade.objects.select_related(
+            "initiator", "responder", "initiator_card", "responder_card", "escrow"
+        ).get(trade_id=trade_id)
+
+    def _act(self, user, trade_id, action, data=None):
+        self.client.force_login(user)
+        method = self.client.patch if action == "respond" else self.client.post
+        return method(
+            f"/api/trades/{trade_id}/{action}/", data or {}, content_type="application/json"
+        )
+
+    def test_full_swap_through_the_api(self):
+        trade_id = self._trade()
+        self.assertEqual(self._act(self.bob, trade_id, "respond", {"action": "accept"}).status_code, 200)
+        self.assertEqual(self._act(self.alice, trade_id, "release").json()["status"], "codes_released")
+        self.assertEqual(self._act(self.alice, trade_id, "confirm").json()["status"], "confirming")
+        response = self._act(self.bob, trade_id, "confirm")
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["status"], "completed")
+        self.assertEqual(body["escrow"]["status"], "finalized")
+        self.assertEqual(body["initiator_card"]["owner_username"], "bob")
+        trade = self._load(trade_id)
+        self.assertEqual(
+            (trade.initiator_card.owner_id, trade.initiator_card.status),
+            (self.bob.pk, GiftCard.Status.SWAPPED),
+        )
+        self.assertEqual(trade.responder_card.owner_id, self.alice.pk)
+        self.assertEqual(User.objects.get(pk=self.bob.pk).daily_trade_count, 1)
+        stats = user_stats.get_stats(self.alice)
+        self.assertEqual((stats.successful_trades, stats.active_trades), (1, 0))
+
+        self.assertEqual(self._act(self.bob, trade_id, "confirm").status_code, 400)
+
+    def test_stale_copies_cannot_accept_twice(self):
+        trade_id = self._trade()
+        first, second = self._load(trade_id), self._load(trade_id)
+        # savepoint, cards, trade, stats, facets, escrow, user, job, release
+        with self.assertNumQueries(9):
+            trade_state.accept(first)
+        self.assertEqual(first.escrow.status, EscrowSession.Status.LOCKED)
+
+        with self.assertRaises(trade_state.TransitionError):
+            trade_state.accept(second)
+        self.assertEqual(EscrowSession.objects.filter(trade__trade_id=trade_id).count(), 1)
+        self.assertEqual(User.objects.get(pk=self.bob.pk).daily_trade_count, 1)
+        self.assertEqual(user_stats.get_stats(self.bob).active_trades, 1)
+
+    def test_card_locked_by_another_trade(self):
+        shared = self._card(self.bob)
+        first, second = self._trade(shared), self._trade(shared)
+        trade_state.accept(self._load(first))
+
+        with self.assertRaises(trade_state.TransitionError):
+            trade_state.accept(self._load(second))
+        trade = self._load(second)
+        self.assertEqual(trade.status, Trade.Status.PROPOSED)
+        self.assertEqual(trade.initiator_card.status, GiftCard.Status.ACTIVE)
+
+    def test_simultaneous_confirmations_complete_once(self):
+        trade_id = self._trade()
+        trade_state.release(trade_state.accept(self._load(trade_id)))
+        by_alice, by_bob = self._load(trade_id), self._load(trade_id)
+
+        trade_state.confirm(by_alice, self.alice)
+        # Bob's copy still shows Alice unconfirmed; the swap fails, re-reads
+        # and completes the trade instead of leaving it confirming.
+        trade_state.confirm(by_bob, self.bob)
+        self.assertEqual(by_bob.status, Trade.Status.COMPLETED)
+
+        stale = self._load(trade_id)
+        stale.status = Trade.Status.CONFIRMING
+        with self.assertRaises(trade_state.TransitionError):
+            trade_state.dispute(stale, self.alice, "never arrived")
+        self.assertEqual(self._load(trade_id).status, Trade.Status.COMPLETED)
+        self.assertFalse(Dispute.objects.exists())
+        stats = user_stats.get_stats(self.bob)
+        self.assertEqual((stats.successful_trades, stats.active_trades), (1, 0))
+
+
+@override_settings(OPENAI_API_KEY="")
+class AutoFinalizeTests(TestCase):
+    def setUp(self):
+        self.brand = Brand.objects.create(name="Finalize Brand", category="Retail")
+        self.users = [
+            User.objects.create_user(username=f"party{i}", email=f"party{i}@example.com")
+            for i in range(4)
+        ]
+
+    def _confirming(self, initiator, responder, minutes_left=-5):
+        def card(owner):
+            return GiftCard.objects.create(
+                owner=owner,
+                brand=self.brand,
+                value=Decimal("25.00"),
+                expiry_date=date(2099, 1, 1),
+                status=GiftCard.Status.IN_TRADE,
+            )
+
+        trade = Trade.objects.create(
+            initiator=initiator,
+            responder=responder,
+            initiator_card=card(initiator),
+            responder_card=card(responder),
+            status=Trade.Status.CONFIRMING,
+            initiator_confirmed=True,
+        )
+        EscrowSession.objects.create(
+            trade=trade,
+            status=EscrowSession.Status.CONFIRMING,
+            confirmation_deadline=timezone.now() + timedelta(minutes=minutes_left),
+        )
+        return trade
+
+    def _finalize_all(self):
+        ids = list(trade_state.expired_confirmations().values_list("pk", flat=True))
+        with CaptureQueriesContext(connection) as ctx:
+            rows = trade_state.finalize_expired(ids)
+        return rows, len(ctx.captured_queries)
+
+    def test_finalizes_in_bulk_and_skips_disputes(self):
+        a, b, c, d = self.users
+        done = [self._confirming(a, b), self._confirming(a, c)]
+        disputed = self._confirming(c, d)
+        Dispute.objects.create(trade=disputed, raised_by=d, reason="empty card")
+        dismissed = self._confirming(b, d)
+        Dispute.objects.create(
+            trade=dismissed, raised_by=d, reason="oops", status=Dispute.Status.DISMISSED
+        )
+        pending = self._confirming(a, d, minutes_left=30)
+        # Four earlier successful trades: the next one upgrades a.
+        UserStats.objects.filter(user=a).update(successful_trades=4)
+
+        out = StringIO()
+        call_command("auto_finalize_trades", stdout=out)
+        self.assertIn("Finalized:  3", out.getvalue())
+        self.assertIn("Skipped:    1", out.getvalue())
+        self.assertIn(f"  SKIP  {disputed.trade_id} -- dispute filed", out.getvalue())
+        self.assertIn(f"  AUTO  {done[0].trade_id} ({a.username} <-> {b.username})", out.getvalue())
+        # The parties are re-ranked by a job, not by the finalizing process.
+        self.assertTrue(
+            Job.objects.filter(
+                task="core.match_index.rebuild_users", kwargs={"user_ids": [a.pk, b.pk, c.pk, d.pk]}
+            ).exists()
+        )
+
+        for trade in [*done, dismissed]:
+            trade.refresh_from_db()
+            self.assertEqual(trade.status, Trade.Status.COMPLETED)
+            self.assertEqual(trade.escrow.status, EscrowSession.Status.FINALIZED)
+            self.assertEqual(
+                (trade.initiator_card.owner_id, trade.responder_card.owner_id),
+                (trade.responder_id, trade.initiator_id),
+            )
+            self.assertEqual(trade.initiator_card.status, GiftCard.Status.SWAPPED)
+        for trade in (disputed, pending):
+            trade.refresh_from_db()
+            self.assertEqual(trade.status, Trade.Status.CONFIRMING)
+
+        a.refresh_from_db()
+        self.assertEqual(a.trust_tier, User.TrustTier.ESTABLISHED)
+        stats = user_stats.get_stats(a)
+        self.assertEqual((stats.successful_trades, stats.active_trades), (6, 1))
+        self.assertEqual(user_stats.get_stats(d).active_trades, 2)
+        self.assertEqual(trade_state.next_confirmation_deadline(), pending.escrow.confirmation_deadline)
+
+    def test_statement_count_does_not_grow_with_trades(self):
+        a, b, c, d = self.users
+        self._confirming(a, b)
+        _, one = self._finalize_all()
+        for _ in range(4):
+            self._confirming(c, d)
+        rows, four = self._finalize_all()
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(one, four)
+        self.assertEqual(self._finalize_all()[0], [])
+
+    def test_deadline_scheduler(self):
+        a, b, c, d = self.users
+        overdue = self._confirming(a, b)
+        later = self._confirming(c, d, minutes_left=30)
+        scheduler = DeadlineScheduler(capacity=1, poll_interval=5)
+        now = timezone.now()
+
+        # Rebuilt on the first tick; only one deadline fits.
+        rows, sleep = scheduler.tick(now)
+        self.assertEqual([row[0] for row in rows], [overdue.pk])
+        self.assertLessEqual(sleep, 5)
+        # The heap drained, so the next tick reloads the deadline that didn't fit.
+        scheduler.tick(now + timedelta(seconds=1))
+        self.assertEqual(len(scheduler), 1)
+
+        # A window opened after the rebuild is found by the poll.
+        scheduler.capacity = 10
+        opened = self._confirming(b, c, minutes_left=60)
+        scheduler.tick(now + timedelta(seconds=6))
+        self.assertEqual(len(scheduler), 2)
+
+        rows, _ = scheduler.tick(later.escrow.confirmation_deadline + timedelta(seconds=1))
+        self.assertEqual([row[0] for row in rows], [later.pk])
+        rows, _ = scheduler.tick(opened.escrow.confirmation_deadline + timedelta(seconds=1))
+        self.assertEqual([row[0] for row in rows], [opened.pk])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_loops_refresh_connections_every_pass(self):
+        for command in ("auto_finalize_trades", "run_deadline_scheduler"):
+            module = f"core.management.commands.{command}"
+            with (
+                mock.patch(f"{module}.close_old_connections") as close,
+                mock.patch(f"{module}.time.sleep", side_effect=[None, KeyboardInterrupt]),
+            ):
+                args = ["--loop"] if command == "auto_finalize_trades" else []
+                call_command(command, *args, stdout=StringIO())
+            self.assertEqual(close.call_count, 2, command)
+
+
+_flaky_calls = []
+
+
+def _flaky_task(fail_times):
+    """Job task for JobQueueTests: fails the first ``fail_times`` calls."""
+    _flaky_calls.append(fail_times)
+    if len(_flaky_calls) <= fail_times:
+        raise RuntimeError("upstream unavailable")
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        _flaky_calls.clear()
+
+    def test_emails_are_queued_and_sent_by_a_worker(self):
+        user = User.objects.create_user(username="mailer", email="mailer@example.com")
+        send_password_reset_email(user)
+        send_verification_email(user)
+        self.assertEqual(mail.outbox, [])
+        # Only the user's id is stored; secrets are made by the worker.
+        self.assertEqual(
+            [job.kwargs for job in Job.objects.filter(status=Job.Status.QUEUED)],
+            [{"user_id": user.pk}, {"user_id": user.pk}],
+        )
+
+        self.assertEqual(jobs.run_pending(), 2)
+        self.assertEqual([message.to for message in mail.outbox], [["mailer@example.com"]] * 2)
+        token = re.search(r"token=([\w-]+)", mail.outbox[0].body).group(1)
+        self.assertTrue(default_token_generator.check_token(user, token))
+        user.refresh_from_db()
+        self.assertIn(user.otp_code, mail.outbox[1].body)
+        self.assertFalse(Job.objects.exclude(status=Job.Status.DONE).exists())
+
+        # A code used before the worker gets to it is not sent.
+        send_verification_email(user)
+        User.objects.filter(pk=user.pk).update(otp_code="", otp_expires_at=None)
+        jobs.run_pending()
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failed_jobs_retry_with_backoff(self):
+        job = jobs.enqueue("core.tests._flaky_task", {"fail_times": 1})
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.QUEUED, 1))
+        self.assertIn("upstream unavailable", job.last_error)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=10))
+        self.assertEqual(jobs.run_pending(), 0)  # Not due yet.
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.DONE, 2))
+
+        doomed = jobs.enqueue("core.tests._flaky_task", {"fail_times": 9}, max_attempts=1)
+        jobs.run_pending()
+        doomed.refresh_from_db()
+        self.assertEqual(doomed.status, Job.Status.FAILED)
+
+    def test_claims_are_exclusive_and_stale_claims_requeued(self):
+        jobs.enqueue("core.tests._flaky_task", {"fail_times": 0})
+        self.assertEqual(len(jobs.claim("worker-a")), 1)
+        self.assertEqual(jobs.claim("worker-b"), [])
+
+        later = timezone.now() + timedelta(seconds=jobs.JOB_STALE_SECONDS + 1)
+        self.assertEqual(jobs.requeue_stale(later), 1)
+        self.assertEqual(jobs.claim("worker-b", now=later)[0].attempts, 2)
+
+    def test_heartbeat_keeps_long_jobs_claimed(self):
+        jobs.enqueue("core.tests._flaky_task", {"fail_times": 0})
+        [job] = jobs.claim("worker-a")
+        later = timezone.now() + timedelta(seconds=jobs.JOB_STALE_SECONDS + 1)
+        with mock.patch("core.jobs.timezone.now", return_value=later):
+            self.assertEqual(jobs._Heartbeat(job).beat(), 1)
+        self.assertEqual(jobs.requeue_stale(later), 0)
+
+        threads = threading.active_count()
+        self.assertTrue(jobs.run(job))
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_periodic_commands_are_enqueued_once_per_slot(self):
+        now = timezone.now()
+        jobs.schedule_periodic(now)
+        jobs.schedule_periodic(now)
+        self.assertEqual(Job.objects.count(), len(jobs.PERIODIC_COMMANDS))
+        self.assertIsNone(jobs.enqueue("core.jobs.run_command", key=Job.objects.first().key))
+
+        jobs.schedule_periodic(now + timedelta(seconds=min(jobs.PERIODIC_COMMANDS.values())))
+        self.assertGreater(Job.objects.count(), len(jobs.PERIODIC_COMMANDS))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()  # Anonymous throttle history
+        brand = Brand.objects.create(name="Paged Brand", category="Retail")
+        seller = User.objects.create_user(username="pager", email="pager@example.com")
+        self.cards = [
+            GiftCard.objects.create(
+                owner=seller,
+                brand=brand,
+                value=Decimal(value),
+                selling_price=Decimal(price) if price else None,
+                expiry_date=date(2099, 1, 1 + i),
+            )
+            for i, (value, price) in enumerate([
+                ("50.00", "45.00"), ("25.00", None), ("50.00", "40.00"), ("10.00", None),
+                ("75.00", "70.00"), ("25.00", "20.00"), ("50.00", None), ("100.00", "95.00"),
+            ])
+        ]
+
+    def _walk(self, ordering):
+        url = f"/api/marketplace/?pagination=cursor&page_size=3&ordering={ordering}"
+        ids, pages = [], []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                body = self.client.get(url).json()
+            self.assertFalse(any("COUNT(" in q["sql"] for q in ctx.captured_queries))
+            self.assertNotIn("count", body)
+            ids += [card["id"] for card in body["results"]]
+            pages.append(url)
+            url = body["next"]
+        return ids, pages
+
+    def test_cursor_pages_follow_the_ordering(self):
+        def expected(field, descending):
+            # By (value, id) in the requested direction, NULLs last.
+            present = [card for card in self.cards if getattr(card, field) is not None]
+            present.sort(key=lambda card: (getattr(card, field), card.pk), reverse=descending)
+            missing = [card for card in self.cards if getattr(card, field) is None]
+            missing.sort(key=lambda card: card.pk, reverse=descending)
+            return [card.pk for card in present + missing]
+
+        for ordering in ("value", "-value", "selling_price", "-selling_price"):
+            with self.subTest(ordering=ordering):
+                ids, _ = self._walk(ordering)
+                self.assertEqual(ids, expected(ordering.lstrip("-"), ordering.startswith("-")))
+
+        ids, pages = self._walk("-created_at")
+        self.assertEqual(ids, [card.pk for card in reversed(self.cards)])
+
+        # Walking back from the last page returns the same pages.
+        body = self.client.get(pages[-1]).json()
+        previous = self.client.get(body["previous"]).json()
+        self.assertEqual([card["id"] for card in previous["results"]], ids[3:6])
+        self.assertIsNotNone(previous["previous"])
+
+    def test_page_numbers_stay_the_default(self):
+        body = self.client.get("/api/marketplace/?page=2&page_size=3").json()
+        self.assertEqual(body["count"], len(self.cards))
+        self.assertEqual(len(body["results"]), 3)
+
+        body = self.client.get("/api/marketplace/?pagination=cursor&count=estimate").json()
+        self.assertEqual(body["estimated_count"], len(self.cards))
+        self.assertEqual(self.client.get("/api/marketplace/?cursor=bogus").status_code, 404)
+
+
+class ListingCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.brand = Brand.objects.create(name="Cached Brand", category="Retail")
+        self.seller = User.objects.create_user(username="lister", email="lister@example.com")
+        self.buyer = User.objects.create_user(username="browser", email="browser@example.com")
+        self.card = GiftCard.objects.create(
+            owner=self.seller,
+            brand=self.brand,
+            value=Decimal("50.00"),
+            selling_price=Decimal("45.00"),
+            listing_type=GiftCard.ListingType.SELL,
+            expiry_date=date(2099, 1, 1),
+        )
+        self.own_card = GiftCard.objects.create(
+            owner=self.buyer,
+            brand=self.brand,
+            value=Decimal("20.00"),
+            expiry_date=date(2099, 1, 1),
+        )
+
+    def _get(self, url="/api/marketplace/", **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, headers=headers)
+        card_queries = [q for q in ctx.captured_queries if 'FROM "core_giftcard"' in q["sql"]]
+        return response, len(card_queries)
+
+    def test_repeat_requests_are_served_from_cache(self):
+        first, queries = self._get()
+        self.assertEqual(first.json()["count"], 2)
+        self.assertTrue(queries)
+
+        self.assertEqual(self._get()[1], 0)
+
+        # Equivalent query strings share an entry.
+        paged, queries = self._get("/api/marketplace/?page_size=5&ordering=value")
+        self.assertTrue(queries)
+        again, queries = self._get("/api/marketplace/?ordering=value&brand=&page_size=5")
+        self.assertEqual(queries, 0)
+        self.assertEqual(again.json(), paged.json())
+
+        not_modified, queries = self._get(**{"If-None-Match": first["ETag"]})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], first["ETag"])
+        self.assertEqual(queries, 0)
+
+    def test_listing_changes_bump_the_version(self):
+        first, _ = self._get()
+
+        # Fields the marketplace doesn't show leave the entry in place.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.card.moderation_note = "Looked fine"
+            self.card.save()
+        self.assertEqual(self._get(**{"If-None-Match": first["ETag"]})[0].status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.card.selling_price = Decimal("40.00")
+            self.card.save()
+        repriced, queries = self._get(**{"If-None-Match": first["ETag"]})
+        self.assertEqual(repriced.status_code, 200)
+        self.assertTrue(queries)
+        self.assertNotEqual(repriced["ETag"], first["ETag"])
+        prices = {card["id"]: card["selling_price"] for card in repriced.json()["results"]}
+        self.assertEqual(prices[self.card.pk], "40.00")
+
+        brands = self.client.get("/api/brands/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.brand.name = "Renamed Brand"
+            self.brand.save()
+        renamed = self.client.get("/api/brands/", headers={"If-None-Match": brands["ETag"]})
+        self.assertEqual(renamed.json()["results"][0]["name"], "Renamed Brand")
+
+        version = listing_cache.version()
+        trade = Trade.objects.create(
+            initiator=self.buyer,
+            responder=self.seller,
+            initiator_card=self.own_card,
+            responder_card=self.card,
+        )
+        trade = Trade.objects.select_related("responder", "responder_card").get(pk=trade.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            trade_state.accept(trade)
+        self.assertNotEqual(listing_cache.version(), version)
+        self.assertEqual(self.client.get("/api/marketplace/").json()["count"], 0)
+
+    def test_bump_from_another_process_retires_entries(self):
+        first, _ = self._get()
+        # A worker reprices the card and bumps the version through its own
+        # counter; this process's cache never hears of it.
+        GiftCard.objects.filter(pk=self.card.pk).update(selling_price=Decimal("30.00"))
+        SharedVersion("listings").bump()
+
+        self.assertEqual(self._get()[1], 0)  # Until the next version check
+        later = time.monotonic() + listing_cache.VERSION_CHECK_SECONDS
+        with mock.patch("core.versions.time.monotonic", return_value=later):
+            response, queries = self._get(**{"If-None-Match": first["ETag"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(queries)
+        prices = {card["id"]: card["selling_price"] for card in response.json()["results"]}
+        self.assertEqual(prices[self.card.pk], "30.00")
+
+    def test_authenticated_users_share_the_entry_without_their_cards(self):
+        anonymous, _ = self._get()
+        self.client.force_login(self.buyer)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/marketplace/")
+        card_queries = [q["sql"] for q in ctx.captured_queries if 'FROM "core_giftcard"' in q["sql"]]
+        # Only the lookup of the user's own matching cards.
+        self.assertEqual(len(card_queries), 1)
+        self.assertNotIn("LIMIT", card_queries[0])
+
+        body = response.json()
+        self.assertEqual(body["count"], 1)
+        self.assertEqual([card["id"] for card in body["results"]], [self.card.pk])
+        self.assertNotEqual(response["ETag"], anonymous["ETag"])
+        self.assertIn("Cookie", response["Vary"])
+        self.assertEqual(
+            self.client.get("/api/marketplace/", headers={"If-None-Match": response["ETag"]}).status_code,
+            304,
+        )
+
+        # The shared entry still lists the card for everyone else.
+        self.client.logout()
+        self.assertEqual(self._get()[0].json()["count"], 2)
+
+
+class BrandSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        names = [
+            ("Amazon", "Retail", True),
+            ("Amazing Spa", "Wellness", False),
+            ("Home Depot", "Home Improvement", True),
+            ("Homegoods", "Home", False),
+            ("Apple", "Electronics", True),
+            ("Wellness Hub", "Gifts", False),
+            ("Retired Brand", "Retail", False),
+        ]
+        self.brands = {
+            name: Brand.objects.create(name=name, category=category, is_popular=popular)
+            for name, category, popular in names
+        }
+        Brand.objects.filter(name="Retired Brand").update(is_active=False)
+        search.brands_changed()
+
+    def _names(self, url):
+        body = self.client.get(url).json()
+        return [brand["name"] for brand in body.get("results", body.get("suggestions"))]
+
+    def test_search_is_ranked_and_prefix_matched(self):
+        self.assertEqual(self._names("/api/search/?q=amaz"), ["Amazon", "Amazing Spa"])
+        # Name matches outrank category matches.
+        self.assertEqual(self._names("/api/search/?q=wellness"), ["Wellness Hub", "Amazing Spa"])
+        self.assertEqual(self._names("/api/search/?q=home improv"), ["Home Depot"])
+        self.assertEqual(self._names("/api/search/?q=retail"), ["Amazon"])
+        self.assertEqual(self._names("/api/search/?q=%22)(*"), [])
+
+        # The index follows renames made with bulk updates as well.
+        Brand.objects.filter(pk=self.brands["Apple"].pk).update(name="Pear")
+        self.assertEqual(self._names("/api/search/?q=pea"), ["Pear"])
+        self.assertEqual(self._names("/api/search/?q=apple"), [])
+
+    def test_brand_list_and_marketplace_use_the_index(self):
+        self.assertEqual(self._names("/api/brands/?search=amaz"), ["Amazon", "Amazing Spa"])
+        self.assertEqual(
+            self._names("/api/brands/?search=amaz&ordering=name"), ["Amazing Spa", "Amazon"]
+        )
+
+        seller = User.objects.create_user(username="searcher", email="searcher@example.com")
+        cards = [
+            GiftCard.objects.create(
+                owner=seller, brand=self.brands[name], value=Decimal("25.00"),
+                expiry_date=date(2099, 1, 1),
+            )
+            for name in ("Amazon", "Home Depot", "Apple")
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            body = self.client.get("/api/marketplace/?search=depot").json()
+        self.assertEqual([card["id"] for card in body["results"]], [cards[1].pk])
+        self.assertFalse(any("LIKE" in query["sql"] for query in ctx.captured_queries))
+
+    def test_autocomplete_trie(self):
+        with self.assertNumQueries(2):  # Version, brands
+            self.assertEqual(self._names("/api/search/autocomplete/?q=am"), ["Amazon", "Amazing Spa"])
+        with self.assertNumQueries(0):
+            # Later words match too; popular brands come first.
+            self.assertEqual(
+                self._names("/api/search/autocomplete/?q=h"), ["Home Depot", "Homegoods", "Wellness Hub"]
+            )
+            self.assertEqual(self._names("/api/search/autocomplete/?q=dep"), ["Home Depot"])
+            self.assertEqual(self._names("/api/search/autocomplete/?q=x"), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Brand.objects.create(name="Amazing Games", category="Gaming", is_popular=True)
+        self.assertEqual(
+            self._names("/api/search/autocomplete/?q=amazi"), ["Amazing Games", "Amazing Spa"]
+        )
+
+        # A rename in another process reaches this one at its next version check.
+        Brand.objects.filter(name="Homegoods").update(name="Home Sense")
+        SharedVersion("search:brands").bump()
+        later = time.monotonic() + search.VERSION_CHECK_SECONDS
+        with mock.patch("core.versions.time.monotonic", return_value=later):
+            self.assertEqual(self._names("/api/search/autocomplete/?q=home s"), ["Home Sense"])
+
+        # Large subtrees are split into nodes; buckets are filtered at lookup.
+        trie = search.BrandTrie(
+            [{"id": i, "name": f"Brand {i:04d}", "category": "", "is_popular": i % 7 == 0} for i in range(2000)],
+            size=3,
+            bucket_size=4,
+        )
+        self.assertEqual([b["id"] for b in trie.lookup("brand")], [0, 7, 14])
+        self.assertEqual([b["id"] for b in trie.lookup("brand 12")], [1204, 1211, 1218])
+        self.assertEqual([b["id"] for b in trie.lookup("1999")], [1999])
+
+
+class ListingFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user(username="faceter", email="faceter@example.com")
+        self.buyer = User.objects.create_user(username="facet-buyer", email="fb@example.com")
+        self.retail = Brand.objects.create(name="Facet Mart", category="Retail")
+        self.outlet = Brand.objects.create(name="Facet Outlet", category="Retail")
+        self.food = Brand.objects.create(name="Facet Diner", category="Food")
+        self.cards = [
+            self._card(brand, value, listing_type)
+            for brand, value, listing_type in [
+                (self.retail, "10.00", "swap"),
+                (self.retail, "30.00", "sell"),
+                (self.retail, "30.00", "swap"),
+                (self.outlet, "75.00", "sell"),
+                (self.food, "24.99", "swap"),
+                (self.food, "600.00", "sell"),
+            ]
+        ]
+
+    def _card(self, brand, value, listing_type, **fields):
+        return GiftCard.objects.create(
+            owner=self.seller,
+            brand=brand,
+            value=Decimal(value),
+            listing_type=listing_type,
+            selling_price=Decimal(value) if listing_type == "sell" else None,
+            expiry_date=date(2099, 1, 1),
+            **fields,
+        )
+
+    def assertFacetsMatch(self):
+        stored = {
+            (row.brand_id, row.listing_type, row.value_bucket): row.count
+            for row in ListingFacet.objects.exclude(count=0)
+        }
+        self.assertEqual(stored, facets.compute_cells())
+
+    def test_counts_follow_card_changes(self):
+        self.assertFacetsMatch()
+        self.assertEqual(
+            ListingFacet.objects.get(brand=self.retail, listing_type="sell", value_bucket=25).count, 1
+        )
+
+        card = self.cards[2]
+        card.value = Decimal("120.00")  # Moves to another bucket
+        card.save()
+        GiftCard.objects.get(pk=self.cards[1].pk).delete()
+        self._card(self.outlet, "80.00", "sell", status=GiftCard.Status.PENDING_REVIEW)
+        self.assertFacetsMatch()
+
+        trade = Trade.objects.create(
+            initiator=self.buyer,
+            responder=self.seller,
+            initiator_card=self._card(self.food, "40.00", "swap"),
+            responder_card=self.cards[0],
+        )
+        trade = Trade.objects.select_related(
+            "initiator_card", "responder_card", "responder"
+        ).get(pk=trade.pk)
+        trade_state.accept(trade)
+        self.assertFacetsMatch()
+
+        GiftCard.objects.filter(pk=self.cards[3].pk).update(expiry_date=date(2020, 1, 1))
+        call_command("check_expiry", stdout=StringIO())
+        self.assertFacetsMatch()
+
+    def test_facets_endpoint_applies_the_other_filters(self):
+        with CaptureQueriesContext(connection) as ctx:
+            body = self.client.get("/api/marketplace/facets/?category=Retail&listing_type=sell").json()
+        self.assertFalse(any('FROM "core_giftcard"' in q["sql"] for q in ctx.captured_queries))
+
+        self.assertEqual(body["total"], 2)
+        self.assertEqual(
+            [(brand["name"], brand["count"]) for brand in body["brands"]],
+            [("Facet Mart", 1), ("Facet Outlet", 1)],
+        )
+        # Each facet ignores its own filter.
+        self.assertEqual(
+            {row["category"]: row["count"] for row in body["categories"]}, {"Food": 1, "Retail": 2}
+        )
+        self.assertEqual(
+            {row["listing_type"]: row["count"] for row in body["listing_types"]},
+            {"sell": 2, "swap": 2},
+        )
+        self.assertEqual(
+            [(row["min"], row["max"], row["count"]) for row in body["value_buckets"]],
+            [(25, 50, 1), (50, 100, 1)],
+        )
+        self.assertTrue(body["exact"])
+        with self.assertNumQueries(0):  # Cached under the listings version
+            self.client.get("/api/marketplace/facets/?listing_type=sell&category=Retail")
+
+        # The totals agree with the marketplace itself.
+        for query in ("", "?brand=%d" % self.food.pk, "?min_value=25&max_value=99.99", "?search=diner"):
+            with self.subTest(query=query):
+                facet_total = self.client.get(f"/api/marketplace/facets/{query}").json()["total"]
+                self.assertEqual(facet_total, self.client.get(f"/api/marketplace/{query}").json()["count"])
+
+        body = self.client.get("/api/marketplace/facets/?min_value=20&max_value=60").json()
+        self.assertFalse(body["exact"])
+        self.assertEqual(self.client.get("/api/marketplace/facets/?min_value=x").status_code, 400)
+
+    def test_reconcile_repairs_drift(self):
+        ListingFacet.objects.filter(brand=self.retail, value_bucket=0).update(count=9)
+        ListingFacet.objects.filter(brand=self.food).delete()
+        ListingFacet.objects.create(brand=self.outlet, listing_type="swap", value_bucket=500, count=3)
+
+        out = StringIO()
+        call_command("reconcile_listing_facets", "--dry-run", stdout=out)
+        self.assertIn("Mismatched cells: 3", out.getvalue())
+        self.assertIn("Empty cells:      1", out.getvalue())
+
+        call_command("reconcile_listing_facets", stdout=StringIO())
+        self.assertFacetsMatch()
+        self.assertFalse(ListingFacet.objects.filter(count=0).exists())
+
+
+class MarketplaceQueryPlanTests(TestCase):
+    """
+    EXPLAIN every gift card query the hot marketplace requests run, on a
+    seeded table, and fail on a full table scan (or, for the page queries,
+    on sorting the whole result instead of reading an index in order).
+    """
+
+    CARDS = 5000
+
+    @classmethod
+    def setUpTestData(cls):
+        brands = Brand.objects.bulk_create(
+            Brand(name=f"Plan Brand {i}", category="Retail") for i in range(20)
+        )
+        cls.brand = brands[0]
+        owner = User.objects.create_user(username="planner", email="planner@example.com")
+        statuses = [GiftCard.Status.ACTIVE] * 6 + [GiftCard.Status.SOLD, GiftCard.Status.SWAPPED]
+        GiftCard.objects.bulk_create(
+            GiftCard(
+                owner=owner,
+                brand=brands[i % len(brands)],
+                value=Decimal(10 + i % 190),
+                selling_price=Decimal(9 + i % 180) if i % 3 else None,
+                listing_type=GiftCard.ListingType.SELL if i % 2 else GiftCard.ListingType.SWAP,
+                status=statuses[i % len(statuses)],
+                expiry_date=date(2030 + i % 60, 1 + i % 12, 1),
+            )
+            for i in range(cls.CARDS)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def _plans(self, url):
+        cache.clear()  # Anonymous throttle history
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        plans = []
+        for query in ctx.captured_queries:
+            if 'FROM "core_giftcard"' not in query["sql"]:
+                continue
+            with connection.cursor() as cursor:
+                if connection.vendor == "postgresql":
+                    # A sequential scan despite this means no index applies.
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+                    cursor.execute(f"EXPLAIN {query['sql']}")
+                else:
+                    cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                plan = "\n".join(str(row[-1]) for row in cursor.fetchall())
+            plans.append((query["sql"], plan))
+        self.assertTrue(plans)
+        return plans
+
+    def assertNoFullScan(self, url):
+        for sql, plan in self._plans(url):
+            message = f"{url}\n{sql}\n{plan}"
+            self.assertNotIn("Seq Scan on core_giftcard", plan, message)
+            self.assertNotRegex(plan, r"SCAN core_giftcard(?! USING)", message)
+            if "LIMIT" in sql and "COUNT(" not in sql:
+                self.assertNotIn("TEMP B-TREE FOR ORDER BY", plan, message)
+
+    def test_hot_marketplace_queries_use_indexes(self):
+        urls = [
+            "/api/marketplace/",
+            "/api/marketplace/?ordering=value",
+            "/api/marketplace/?ordering=-value",
+            "/api/marketplace/?ordering=selling_price",
+            "/api/marketplace/?ordering=expiry_date",
+            f"/api/marketplace/?brand={self.brand.pk}",
+            "/api/marketplace/?listing_type=sell",
+            "/api/marketplace/?min_value=50&max_value=60&ordering=value",
+            "/api/marketplace/?pagination=cursor",
+            "/api/marketplace/?pagination=cursor&ordering=-selling_price",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNoFullScan(url)
+
+        # Deep keyset pages read the same index from the cursor onwards.
+        cache.clear()
+        body = self.client.get("/api/marketplace/?pagination=cursor&ordering=value").json()
+        self.assertNoFullScan(body["next"])
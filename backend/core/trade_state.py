@@ -0,0 +1,306 @@
+"""
+Trade state machine.
+
+Every change to a trade after it is proposed goes through one of the
+transitions below.  A transition runs in a single transaction and moves
+the trade with a conditional ``UPDATE ... WHERE status = <status read>``
+(compare-and-swap): if another request moved the trade first, no row
+matches and ``TransitionError`` is raised instead of overwriting that
+change, so a trade can't be accepted twice or completed and disputed at
+once.  Card and escrow rows are written with one ``UPDATE`` each, and the
+trade passed in (with its cards, escrow and parties, when loaded) is
+updated in place so callers can serialize it without reloading.
+
+``QuerySet.update()`` bypasses the model signals, so the transitions
+apply the ``UserStats`` and ``ListingFacet`` deltas themselves and queue
+the match index maintenance as background jobs (see ``core.jobs``).
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Exists, F, Min, OuterRef, Subquery, Value, When
+from django.utils import timezone
+
+from core import facets, jobs, listing_cache, user_stats
+from core.fraud_detection import check_and_upgrade_trust_tier, upgrade_trust_tiers
+from core.models import Dispute, EscrowSession, GiftCard, PlatformSettings, Trade, User
+
+CONFLICT_MESSAGE = "This trade was just updated by another request. Reload it and try again."
+
+# Fields compared when recording a confirmation: both parties may confirm
+# at the same moment, and exactly one of them must complete the trade.
+_CONFIRMATION_FIELDS = ("status", "initiator_confirmed", "responder_confirmed")
+
+
+class TransitionError(Exception):
+    """The trade is not (or is no longer) in a state that allows the transition."""
+
+
+def _compare_and_swap(trade, now, compare=("status",), **changes):
+    """
+    Write ``changes`` if the trade's ``compare`` fields still hold the values
+    on ``trade``; returns False if another request changed them first.
+    """
+    expected = {field: getattr(trade, field) for field in compare}
+    if not Trade.objects.filter(pk=trade.pk, **expected).update(updated_at=now, **changes):
+        return False
+
+    old_status = trade.status
+    for field, value in changes.items():
+        setattr(trade, field, value)
+    trade.updated_at = now
+    if trade.status != old_status:
+        trade._loaded_status = trade.status
+        user_stats.trade_changed(trade, old_status)
+        if trade.status == Trade.Status.COMPLETED:
+            # Both parties' brand history changed.
+            jobs.enqueue(
+                "core.match_index.rebuild_users",
+                {"user_ids": [trade.initiator_id, trade.responder_id]},
+            )
+    return True
+
+
+def _move(trade, allowed, now, **changes):
+    if trade.status not in allowed:
+        raise TransitionError(
+            f"Trade {trade.trade_id} cannot move from {trade.status} to {changes['status']}."
+        )
+    if not _compare_and_swap(trade, now, **changes):
+        raise TransitionError(CONFLICT_MESSAGE)
+
+
+def _update_escrow(trade, **changes):
+    EscrowSession.objects.filter(trade_id=trade.pk).update(**changes)
+    escrow = getattr(trade, "escrow", None)
+    if escrow is not None:
+        for field, value in changes.items():
+            setattr(escrow, field, value)
+
+
+def _set_cards(trade, now, **changes):
+    """Mirror a card ``UPDATE`` onto the trade's loaded cards."""
+    for card in (trade.initiator_card, trade.responder_card):
+        for field, value in changes.items():
+            setattr(card, field, value)
+        card.updated_at = now
+        card._loaded_listing = card.listing_state()
+
+
+# ─── Transitions ───
+
+
+def decline(trade):
+    with transaction.atomic():
+        _move(trade, (Trade.Status.PROPOSED,), timezone.now(), status=Trade.Status.CANCELLED)
+    return trade
+
+
+def accept(trade):
+    """
+    Lock both cards, open escrow and count the trade against the
+    responder's daily limits.  Fails if either card was locked by another
+    trade in the meantime.
+    """
+    now = timezone.now()
+    card_ids = [trade.initiator_card_id, trade.responder_card_id]
+    card_value = trade.responder_card.value
+    with transaction.atomic():
+        locked = GiftCard.objects.filter(pk__in=card_ids, status=GiftCard.Status.ACTIVE).update(
+            status=GiftCard.Status.IN_TRADE, updated_at=now
+        )
+        if locked != len(card_ids):
+            raise TransitionError("One of the gift cards is no longer available for trading.")
+        _move(trade, (Trade.Status.PROPOSED,), now, status=Trade.Status.IN_ESCROW)
+        facets.cards_moved(
+            (trade.initiator_card, trade.responder_card),
+            GiftCard.Status.ACTIVE,
+            GiftCard.Status.IN_TRADE,
+        )
+        trade.escrow = EscrowSession.objects.create(trade=trade, status=EscrowSession.Status.LOCKED)
+        User.objects.filter(pk=trade.responder_id).update(
+            daily_trade_count=F("daily_trade_count") + 1,
+            daily_trade_value=F("daily_trade_value") + card_value,
+        )
+        # Locked cards are no longer listed.
+        jobs.enqueue("core.match_index.refresh_cards", {"card_ids": card_ids})
+        transaction.on_commit(listing_cache.bump)
+
+    _set_cards(trade, now, status=GiftCard.Status.IN_TRADE)
+    trade.responder.daily_trade_count += 1
+    trade.responder.daily_trade_value += card_value
+    return trade
+
+
+def release(trade):
+    now = timezone.now()
+    with transaction.atomic():
+        _move(trade, (Trade.Status.IN_ESCROW,), now, status=Trade.Status.CODES_RELEASED)
+        _update_escrow(trade, status=EscrowSession.Status.RELEASED, released_at=now)
+    return trade
+
+
+def confirm(trade, user):
+    """
+    Record ``user``'s confirmation.  The first one starts the escrow's
+    confirmation window; the second completes the trade and swaps the cards.
+    """
+    now = timezone.now()
+    own, other = ("initiator_confirmed", "responder_confirmed")
+    if user.pk != trade.initiator_id:
+        own, other = other, own
+
+    with transaction.atomic():
+        # A failed swap means the other party confirmed (or disputed) in
+        # between; re-read and decide again.
+        for _ in range(3):
+            if trade.status not in (Trade.Status.CODES_RELEASED, Trade.Status.CONFIRMING):
+                raise TransitionError(
+                    "Trade must be in codes_released or confirming state to confirm."
+                )
+            if getattr(trade, own):
+                raise TransitionError("You have already confirmed this trade.")
+            completes = getattr(trade, other)
+            new_status = Trade.Status.COMPLETED if completes else Trade.Status.CONFIRMING
+            if _compare_and_swap(trade, now, _CONFIRMATION_FIELDS, status=new_status, **{own: True}):
+                break
+            trade.refresh_from_db(fields=_CONFIRMATION_FIELDS)
+            trade._loaded_status = trade.status
+        else:
+            raise TransitionError(CONFLICT_MESSAGE)
+
+        if completes:
+            _complete(trade, now)
+        else:
+            window = PlatformSettings.get_int("confirmation_window_minutes", 60)
+            deadline = now + timedelta(minutes=window)
+            started = EscrowSession.objects.filter(
+                trade_id=trade.pk, confirmation_deadline__isnull=True
+            ).update(status=EscrowSession.Status.CONFIRMING, confirmation_deadline=deadline)
+            escrow = getattr(trade, "escrow", None)
+            if started and escrow is not None:
+                escrow.status = EscrowSession.Status.CONFIRMING
+                escrow.confirmation_deadline = deadline
+    return trade
+
+
+def _complete(trade, now):
+    _update_escrow(trade, status=EscrowSession.Status.FINALIZED, finalized_at=now)
+    # Each card goes to the other party.  Both were already unlisted when
+    # they were locked, so the match index has nothing to drop.
+    GiftCard.objects.filter(pk__in=[trade.initiator_card_id, trade.responder_card_id]).update(
+        owner_id=Case(
+            When(pk=trade.initiator_card_id, then=Value(trade.responder_id)),
+            default=Value(trade.initiator_id),
+        ),
+        status=GiftCard.Status.SWAPPED,
+        updated_at=now,
+    )
+    trade.initiator_card.owner = trade.responder
+    trade.responder_card.owner = trade.initiator
+    _set_cards(trade, now, status=GiftCard.Status.SWAPPED)
+
+    check_and_upgrade_trust_tier(trade.initiator)
+    check_and_upgrade_trust_tier(trade.responder)
+
+
+def dispute(trade, user, reason):
+    """Open a dispute, reverse escrow and restrict both parties pending review."""
+    now = timezone.now()
+    parties = (trade.initiator, trade.responder)
+    with transaction.atomic():
+        _move(
+            trade,
+            (Trade.Status.CODES_RELEASED, Trade.Status.CONFIRMING),
+            now,
+            status=Trade.Status.DISPUTED,
+        )
+        Dispute.objects.create(
+            trade=trade, raised_by=user, reason=reason, status=Dispute.Status.OPEN
+        )
+        User.objects.filter(
+            pk__in=[party.pk for party in parties], status=User.Status.ACTIVE
+        ).update(status=User.Status.RESTRICTED)
+        _update_escrow(trade, status=EscrowSession.Status.REVERSED)
+
+    for party in parties:
+        if party.status == User.Status.ACTIVE:
+            party.status = User.Status.RESTRICTED
+    return trade
+
+
+# ─── Auto-finalization ───
+
+
+def expired_confirmations(now=None):
+    """Confirming trades whose window has closed with no open dispute."""
+    now = now or timezone.now()
+    open_disputes = Dispute.objects.filter(trade=OuterRef("pk")).exclude(
+        status=Dispute.Status.DISMISSED
+    )
+    return Trade.objects.filter(
+        status=Trade.Status.CONFIRMING,
+        escrow__confirmation_deadline__lt=now,
+    ).exclude(Exists(open_disputes))
+
+
+def finalize_expired(trade_ids, now=None):
+    """
+    Complete the trades in ``trade_ids`` (primary keys) that are still
+    eligible, as if both parties had confirmed, with one transaction and a
+    fixed number of statements however many trades there are.  Rows being
+    changed by another request are skipped (``SKIP LOCKED`` where the
+    database supports it) and left for the next run.
+
+    Returns the ``(pk, trade_id, initiator_id, responder_id)`` of each
+    trade finalized.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        rows = list(
+            expired_confirmations(now)
+            .filter(pk__in=trade_ids)
+            .select_for_update(skip_locked=True, of=("self",))
+            .order_by()
+            .values_list("pk", "trade_id", "initiator_id", "responder_id")
+        )
+        if not rows:
+            return []
+        pks = [row[0] for row in rows]
+        Trade.objects.filter(pk__in=pks, status=Trade.Status.CONFIRMING).update(
+            status=Trade.Status.COMPLETED,
+            initiator_confirmed=True,
+            responder_confirmed=True,
+            updated_at=now,
+        )
+        EscrowSession.objects.filter(trade_id__in=pks).update(
+            status=EscrowSession.Status.FINALIZED, finalized_at=now
+        )
+        # Each card goes to the other party (see _complete).
+        sides = (("initiator_card", "responder_id"), ("responder_card", "initiator_id"))
+        for card_side, new_owner in sides:
+            GiftCard.objects.filter(**{f"trades_as_{card_side}__in": pks}).update(
+                owner_id=Subquery(
+                    Trade.objects.filter(pk__in=pks, **{card_side: OuterRef("pk")}).values(
+                        new_owner
+                    )[:1]
+                ),
+                status=GiftCard.Status.SWAPPED,
+                updated_at=now,
+            )
+
+        parties = [(initiator_id, responder_id) for _, _, initiator_id, responder_id in rows]
+        user_stats.trades_moved(parties, Trade.Status.CONFIRMING, Trade.Status.COMPLETED)
+        user_ids = {user_id for pair in parties for user_id in pair}
+        upgrade_trust_tiers(user_ids)
+        jobs.enqueue("core.match_index.rebuild_users", {"user_ids": sorted(user_ids)})
+    return rows
+
+
+def next_confirmation_deadline(now=None):
+    """The earliest confirmation deadline still ahead, or None."""
+    now = now or timezone.now()
+    return EscrowSession.objects.filter(
+        trade__status=Trade.Status.CONFIRMING, confirmation_deadline__gte=now
+    ).aggregate(next=Min("confirmation_deadline"))["next"]
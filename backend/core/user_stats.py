@@ -0,0 +1,231 @@
+"""
+Denormalized per-user counters (``UserStats``).
+
+Each trade, sale or dispute change applies a delta to the affected users'
+rows with ``F()`` expressions, in the same transaction as the change
+(``core.signals`` calls in from the save and delete handlers; the models
+wrap saves in a transaction).  Bulk ``QuerySet.update()`` calls bypass the
+signals, so callers recompute the affected users instead.
+
+Rows are created on first use: a read or delta that finds no row computes
+the user's counters from the source tables.  ``reconcile_user_stats``
+compares every row against the source tables.
+"""
+
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, F, Q, Sum
+
+from core.models import Dispute, Sale, Trade, UserStats
+
+ACTIVE_TRADE_STATUSES = (
+    Trade.Status.PROPOSED,
+    Trade.Status.ACCEPTED,
+    Trade.Status.IN_ESCROW,
+    Trade.Status.CODES_RELEASED,
+    Trade.Status.CONFIRMING,
+)
+
+STAT_FIELDS = (
+    "total_trades",
+    "successful_trades",
+    "active_trades",
+    "disputes_raised",
+    "completed_sales",
+    "earnings",
+)
+
+# Keeps ``IN (...)`` lists under SQLite's bound-parameter limit.
+_CHUNK_SIZE = 500
+
+
+def _trade_counts(status):
+    """The counters a trade in ``status`` contributes to each party."""
+    if status is None:
+        return {}
+    return {
+        "total_trades": int(status not in (Trade.Status.PROPOSED, Trade.Status.CANCELLED)),
+        "successful_trades": int(status == Trade.Status.COMPLETED),
+        "active_trades": int(status in ACTIVE_TRADE_STATUSES),
+    }
+
+
+def _sale_counts(status, amount):
+    if status != Sale.Status.COMPLETED:
+        return {}
+    return {"completed_sales": 1, "earnings": amount}
+
+
+def _diff(new, old):
+    fields = set(new) | set(old)
+    deltas = {field: new.get(field, 0) - old.get(field, 0) for field in fields}
+    return {field: delta for field, delta in deltas.items() if delta}
+
+
+def _apply(user_ids, deltas, create_missing=True):
+    """Add ``deltas`` to the rows of ``user_ids``; compute rows that don't exist yet."""
+    if not deltas:
+        return
+    user_ids = set(user_ids)
+    updated = UserStats.objects.filter(user_id__in=user_ids).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    if create_missing and updated < len(user_ids):
+        existing = set(
+            UserStats.objects.filter(user_id__in=user_ids).values_list("user_id", flat=True)
+        )
+        # Computed from the source tables, which already include this change.
+        recompute_users(user_ids - existing)
+
+
+def trade_changed(trade, old_status):
+    """Apply a trade's move from ``old_status`` (None if new) to its current status."""
+    deltas = _diff(_trade_counts(trade.status), _trade_counts(old_status))
+    _apply({trade.initiator_id, trade.responder_id}, deltas)
+
+
+def trades_moved(parties, old_status, new_status):
+    """
+    Apply a bulk move of trades from ``old_status`` to ``new_status``;
+    ``parties`` holds each trade's ``(initiator_id, responder_id)``.  Users
+    are grouped by how many of the trades they were party to, so this is
+    one update per distinct count rather than one per trade.
+    """
+    deltas = _diff(_trade_counts(new_status), _trade_counts(old_status))
+    if not deltas:
+        return
+    per_user = Counter()
+    for pair in parties:
+        per_user.update(set(pair))
+    by_count = defaultdict(set)
+    for user_id, count in per_user.items():
+        by_count[count].add(user_id)
+    for count, user_ids in by_count.items():
+        _apply(user_ids, {field: delta * count for field, delta in deltas.items()})
+
+
+def trade_deleted(trade):
+    deltas = _diff({}, _trade_counts(trade.status))
+    _apply({trade.initiator_id, trade.responder_id}, deltas, create_missing=False)
+
+
+def sale_changed(sale, old_status):
+    deltas = _diff(_sale_counts(sale.status, sale.amount), _sale_counts(old_status, sale.amount))
+    _apply({sale.seller_id}, deltas)
+
+
+def sale_deleted(sale):
+    deltas = _diff({}, _sale_counts(sale.status, sale.amount))
+    _apply({sale.seller_id}, deltas, create_missing=False)
+
+
+def dispute_created(dispute):
+    _apply({dispute.raised_by_id}, {"disputes_raised": 1})
+
+
+def dispute_deleted(dispute):
+    _apply({dispute.raised_by_id}, {"disputes_raised": -1}, create_missing=False)
+
+
+# ─── Reads ───
+
+
+def get_stats(user):
+    """The user's ``UserStats`` row, computing it if it doesn't exist yet."""
+    stats = UserStats.objects.filter(user_id=user.pk).first()
+    if stats is None:
+        recompute_users([user.pk])
+        stats = UserStats.objects.get(user_id=user.pk)
+    return stats
+
+
+def get_stats_for(user_ids):
+    """``{user_id: UserStats}`` for many users in one query (plus any missing rows)."""
+    user_ids = set(user_ids)
+    stats = {row.user_id: row for row in UserStats.objects.filter(user_id__in=user_ids)}
+    missing = user_ids - set(stats)
+    if missing:
+        recompute_users(missing)
+        stats.update(
+            (row.user_id, row) for row in UserStats.objects.filter(user_id__in=missing)
+        )
+    return stats
+
+
+# ─── Recomputation ───
+
+
+def compute_stats(user_ids):
+    """``{user_id: {field: value}}`` computed from the source tables."""
+    user_ids = list(user_ids)
+    stats = {
+        user_id: dict.fromkeys(STAT_FIELDS[:-1], 0) | {"earnings": Decimal("0.00")}
+        for user_id in user_ids
+    }
+    trade_fields = {
+        "total": Count("id", filter=~Q(status__in=[Trade.Status.PROPOSED, Trade.Status.CANCELLED])),
+        "successful": Count("id", filter=Q(status=Trade.Status.COMPLETED)),
+        "active": Count("id", filter=Q(status__in=ACTIVE_TRADE_STATUSES)),
+    }
+    for start in range(0, len(user_ids), _CHUNK_SIZE):
+        chunk = user_ids[start:start + _CHUNK_SIZE]
+        per_side = [
+            ("initiator_id", Trade.objects.filter(initiator_id__in=chunk)),
+            # A user who is both parties is only counted once, on the initiator side.
+            (
+                "responder_id",
+                Trade.objects.filter(responder_id__in=chunk).exclude(
+                    initiator_id=F("responder_id")
+                ),
+            ),
+        ]
+        for field, trades in per_side:
+            for row in trades.order_by().values(field).annotate(**trade_fields):
+                user_stats = stats[row[field]]
+                user_stats["total_trades"] += row["total"]
+                user_stats["successful_trades"] += row["successful"]
+                user_stats["active_trades"] += row["active"]
+
+        disputes = (
+            Dispute.objects.filter(raised_by_id__in=chunk)
+            .order_by()
+            .values("raised_by_id")
+            .annotate(total=Count("id"))
+        )
+        for row in disputes:
+            stats[row["raised_by_id"]]["disputes_raised"] = row["total"]
+
+        sales = (
+            Sale.objects.filter(seller_id__in=chunk, status=Sale.Status.COMPLETED)
+            .order_by()
+            .values("seller_id")
+            .annotate(total=Count("id"), earned=Sum("amount"))
+        )
+        for row in sales:
+            stats[row["seller_id"]]["completed_sales"] = row["total"]
+            stats[row["seller_id"]]["earnings"] = row["earned"]
+    return stats
+
+
+def recompute_users(user_ids):
+    """Overwrite (or create) the rows of ``user_ids`` from the source tables."""
+    rows = [
+        UserStats(user_id=user_id, **values)
+        for user_id, values in compute_stats(user_ids).items()
+    ]
+    UserStats.objects.bulk_create(
+        rows,
+        batch_size=_CHUNK_SIZE,
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=list(STAT_FIELDS),
+    )
+
+
+def trade_parties(trades):
+    """Ids of every user on either side of ``trades`` (a queryset)."""
+    parties = set()
+    for initiator_id, responder_id in trades.values_list("initiator_id", "responder_id"):
+        parties.update((initiator_id, responder_id))
+    return parties
@@ -0,0 +1,91 @@
+"""
+Sliding-window event counters stored in ``VelocityBucket`` rows.
+
+Each counter splits time into fixed buckets one window long and keeps two
+of them per user: the current bucket and the one before it.  The sliding
+count is the current bucket plus the previous bucket weighted by how much
+of it still overlaps the window, which is exact for evenly spread events
+and never off by more than the previous bucket's share otherwise.
+
+Recording an event reads the user's two buckets and adds to the current
+one with an ``F()`` expression, whatever the user's history, so counters
+can be updated on the write path, and every process sees the same counts.
+Older buckets are deleted whenever a user starts a new one.
+"""
+
+import logging
+import time
+
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F
+
+from core.models import VelocityBucket
+
+logger = logging.getLogger("core")
+
+
+class SlidingWindowCounter:
+    """A per-user event count (or sum) over the last ``window_seconds``."""
+
+    def __init__(self, name, window_seconds):
+        self.name = name
+        self.window_seconds = window_seconds
+
+    def _buckets(self, user_id, now, lock=False):
+        """``(current bucket, previous bucket's overlap, {bucket: count})`` as of ``now``."""
+        bucket, offset = divmod(now, self.window_seconds)
+        bucket = int(bucket)
+        rows = VelocityBucket.objects.filter(
+            name=self.name, user_id=user_id, bucket__in=[bucket - 1, bucket]
+        )
+        if lock:
+            rows = rows.select_for_update()
+        counts = dict(rows.values_list("bucket", "count"))
+        return bucket, 1 - offset / self.window_seconds, counts
+
+    def get(self, user_id, now=None):
+        """Sliding count for ``user_id`` as of ``now`` (epoch seconds)."""
+        bucket, overlap, counts = self._buckets(user_id, time.time() if now is None else now)
+        return counts.get(bucket, 0) + counts.get(bucket - 1, 0) * overlap
+
+    def add(self, user_id, amount=1, now=None):
+        """
+        Record ``amount`` for ``user_id`` and return ``(before, after)``.
+
+        ``amount`` must be an integer (store money in cents).  Database
+        errors are logged and reported as no change so callers never fail
+        on them.
+        """
+        try:
+            with transaction.atomic():
+                bucket, overlap, counts = self._buckets(
+                    user_id, time.time() if now is None else now, lock=True
+                )
+                before = counts.get(bucket, 0) + counts.get(bucket - 1, 0) * overlap
+                if bucket not in counts:
+                    self._start_bucket(user_id, bucket, amount)
+                else:
+                    self._increment(user_id, bucket, amount)
+        except DatabaseError as exc:
+            logger.warning("Velocity counter %s unavailable: %s", self.name, exc)
+            return 0, 0
+        return before, before + amount
+
+    def _increment(self, user_id, bucket, amount):
+        VelocityBucket.objects.filter(name=self.name, user_id=user_id, bucket=bucket).update(
+            count=F("count") + amount
+        )
+
+    def _start_bucket(self, user_id, bucket, amount):
+        try:
+            with transaction.atomic():
+                VelocityBucket.objects.create(
+                    name=self.name, user_id=user_id, bucket=bucket, count=amount
+                )
+        except IntegrityError:
+            # Another request started it first.
+            self._increment(user_id, bucket, amount)
+            return
+        VelocityBucket.objects.filter(
+            name=self.name, user_id=user_id, bucket__lt=bucket - 1
+        ).delete()
@@ -0,0 +1,64 @@
+"""
+Version counters shared by every process, stored in ``CacheVersion``.
+
+In-process caches (``core.settings_cache``, the brand trie in
+``core.search``) and the listing cache key what they hold by a version.
+Writers ``bump()`` it once their change has committed; readers call
+``get()``, which reads the row at most every ``check_seconds`` and
+otherwise answers from memory.  A change made in another process (a
+worker, a daemon, another web worker) is therefore seen within
+``check_seconds``; the process that bumped sees it straight away.
+
+The counters live in the database rather than ``CACHES["default"]``,
+which is per process unless a shared backend is configured.
+"""
+
+import time
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+VERSION_CHECK_SECONDS = 1.0
+
+
+class SharedVersion:
+    def __init__(self, name, check_seconds=VERSION_CHECK_SECONDS):
+        self.name = name
+        self.check_seconds = check_seconds
+        # ``(version, monotonic time it was read)``, swapped as one value so
+        # threads never see a version with another version's read time.
+        self._read = None
+
+    def get(self):
+        """The current version (0 before the first bump)."""
+        from core.models import CacheVersion
+
+        now = time.monotonic()
+        read = self._read
+        if read is not None and now - read[1] < self.check_seconds:
+            return read[0]
+        current = (
+            CacheVersion.objects.filter(name=self.name).values_list("version", flat=True).first()
+        )
+        current = current or 0
+        self._read = (current, now)
+        return current
+
+    def bump(self):
+        """Move to a new version; every process sees it on its next check."""
+        from core.models import CacheVersion
+
+        updated = CacheVersion.objects.filter(name=self.name).update(version=F("version") + 1)
+        if not updated:
+            # Start from the clock, so a deleted row never comes back at a
+            # version some process still has cached data under.
+            try:
+                with transaction.atomic():
+                    CacheVersion.objects.create(name=self.name, version=time.time_ns())
+            except IntegrityError:
+                CacheVersion.objects.filter(name=self.name).update(version=F("version") + 1)
+        self.expire()
+
+    def expire(self):
+        """Read the version from the database on the next ``get()``."""
+        self._read = None